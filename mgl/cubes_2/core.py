@@ -10,7 +10,7 @@ class Camera:
     near = 0.1
     far = 100
     sensitivity = 0.1
-    speed = 0.005
+    speed = 5.0  # Units per second
 
     position = None
     up = glm.vec3(0, 1, 0)
@@ -21,6 +21,8 @@ class Camera:
                  fov=fov, near=near, far=far, sensitivity=sensitivity):
         self.app = app
         self.position = glm.vec3(position)
+        # Position at the previous simulation tick, the view is drawn between the two
+        self.previous_position = glm.vec3(position)
         self.yaw = yaw
         self.pitch = pitch
         self.fov = fov
@@ -60,14 +62,17 @@ class Camera:
         self.right = glm.normalize(glm.cross(self.forward, glm.vec3(0, 1, 0)))
         self.up = glm.normalize(glm.cross(self.right, self.forward))
 
+    def tick(self, dt):
+        self.previous_position = glm.vec3(self.position)
+        self.move(dt)
+
     def update(self):
-        self.move()
         self.rotate()
         self.update_camera_vectors()
         self.m_view = self.get_view_matrix()
 
-    def move(self):
-        self.velocity = self.speed * self.app.delta_time
+    def move(self, dt):
+        self.velocity = self.speed * dt
         keys = pygame.key.get_pressed()
         if keys[self.key_bindings["forward"]]:
             self.position += self.forward * self.velocity
@@ -83,7 +88,8 @@ class Camera:
             self.position -= self.up * self.velocity
 
     def get_view_matrix(self):
-        return glm.lookAt(self.position, self.position + self.forward, self.up)
+        position = glm.mix(self.previous_position, self.position, self.app.simulation.alpha)
+        return glm.lookAt(position, position + self.forward, self.up)
 
     def get_projection_matrix(self):
         return glm.perspective(glm.radians(self.fov), self.aspect_ratio, self.near, self.far)
@@ -103,6 +109,14 @@ class Light:
 
 
 class Shader():
+    # Quality tiers, each a define-set compiled into its own program variant
+    quality_tiers = {
+        'low': {'SHADOW_TAPS': 1, 'MAX_LIGHTS': 2, 'FOG': 0},
+        'medium': {'SHADOW_TAPS': 4, 'MAX_LIGHTS': 4, 'FOG': 1},
+        'high': {'SHADOW_TAPS': 16, 'MAX_LIGHTS': 8, 'FOG': 1},
+        'ultra': {'SHADOW_TAPS': 64, 'MAX_LIGHTS': 16, 'FOG': 1},
+    }
+
     def __init__(self, app):
         self.app = app
         self.ctx = app.ctx
@@ -110,19 +124,23 @@ class Shader():
         self.programs_count = -1
         self.programs_map = {}
 
-    def get_shader(self, shader_name, geometry=False):
-        if shader_name in self.programs_map:
-            # print(f"Reuse shader: {shader_name} at index: {self.programs_map[shader_name]}")
-            return self.programs[self.programs_map[shader_name]]
+    def get_variant_name(self, shader_name, defines=None):
+        '''Cache key of a program variant, e.g. default[FOG=1,MAX_LIGHTS=4,SHADOW_TAPS=4].'''
+        if not defines:
+            return shader_name
+        return f"{shader_name}[{','.join(f'{key}={value}' for key, value in sorted(defines.items()))}]"
 
-        with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.vert', 'r') as f:
-            vertex_shader_source = f.read()
-        with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.frag', 'r') as f:
-            fragment_shader_source = f.read()
+    def get_shader(self, shader_name, geometry=False, defines=None):
+        variant_name = self.get_variant_name(shader_name, defines)
+        if variant_name in self.programs_map:
+            # print(f"Reuse shader: {variant_name} at index: {self.programs_map[variant_name]}")
+            return self.programs[self.programs_map[variant_name]]
+
+        vertex_shader_source = self.load_source(f'{shader_name}.vert', defines)
+        fragment_shader_source = self.load_source(f'{shader_name}.frag', defines)
 
         if geometry is True:
-            with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.geom', 'r') as f:
-                geometry_shader_source = f.read()
+            geometry_shader_source = self.load_source(f'{shader_name}.geom', defines)
             shader_program = self.ctx.program(
                 vertex_shader=vertex_shader_source,
                 fragment_shader=fragment_shader_source,
@@ -134,11 +152,40 @@ class Shader():
                 fragment_shader=fragment_shader_source,
             )
         self.programs_count += 1
-        self.programs_map[shader_name] = self.programs_count
+        self.programs_map[variant_name] = self.programs_count
         self.programs.append(shader_program)
-        print(f"loaded shader: {shader_name} at index: {self.programs_count}")
+        print(f"loaded shader: {variant_name} at index: {self.programs_count}")
         return shader_program
 
+    def get_quality_shader(self, shader_name, quality, geometry=False):
+        return self.get_shader(shader_name, geometry, self.quality_tiers[quality])
+
+    def warm_up(self, shader_name, geometry=False):
+        '''Compile every quality tier of a shader up front, so switching tiers at runtime does not hitch.'''
+        for quality in self.quality_tiers:
+            self.get_quality_shader(shader_name, quality, geometry)
+
+    def load_source(self, file_name, defines=None):
+        '''Read a shader file, resolve its #include lines and insert the defines after #version.'''
+        source = self.resolve_includes(file_name, set())
+        if not defines:
+            return source
+        lines = source.split('\n')
+        index = next((i + 1 for i, line in enumerate(lines) if line.strip().startswith('#version')), 0)
+        define_lines = [f'#define {key} {value}' for key, value in sorted(defines.items())]
+        return '\n'.join(lines[:index] + define_lines + lines[index:])
+
+    def resolve_includes(self, file_name, included):
+        # Each file is included once per program, like an include guard
+        included.add(file_name)
+        with open(f'{self.app.base_path}/{self.app.shader_path}/{file_name}', 'r') as f:
+            lines = f.read().split('\n')
+        for i, line in enumerate(lines):
+            if line.strip().startswith('#include'):
+                include_name = line.strip()[len('#include'):].strip().strip('"<>')
+                lines[i] = '' if include_name in included else self.resolve_includes(include_name, included)
+        return '\n'.join(lines)
+
     def destroy(self):
         for program in self.programs:
             program.release()
@@ -4,6 +4,7 @@ import sys
 
 from model import Cube, Floor
 from core import Camera, Light, Shadow, Texture, Shader
+from fixed_step import FixedStepLoop
 
 
 class GraphicsEngine:
@@ -14,6 +15,11 @@ class GraphicsEngine:
     target_display = 0
     base_path = '.'
     shader_path = 'shaders'
+    # Shader quality tier, one of Shader.quality_tiers, cycled with F2
+    quality = 'high'
+    # Fixed simulation step in seconds and the most steps run to catch up after a slow frame
+    simulation_step = 1 / 60
+    max_simulation_steps = 8
     # Variables
     fps = 0
     time = 0
@@ -53,12 +59,16 @@ class GraphicsEngine:
         self.clock = pygame.time.Clock()
         # Set fps max
         pygame.time.set_timer(pygame.USEREVENT, 1000 // self.target_fps)
+        # Movement and animation tick at a fixed rate, rendering is interpolated between ticks
+        self.simulation = FixedStepLoop(self.tick, self.simulation_step, self.max_simulation_steps)
         # Camera
         self.camera = Camera(self, position=(0, 0, 5))
         # Texture, Shader, Shadow
         self.texture = Texture(self)
         self.shader = Shader(self)
         self.shadow = Shadow(self)
+        # Compile all quality tiers now so switching later does not hitch
+        self.shader.warm_up('default')
         # Light
         self.light = Light(position=(-5, 2, 5), color=(1.0, 0.0, 0.0), strength=10.0)
         # Light 2
@@ -77,13 +87,19 @@ class GraphicsEngine:
         size = 1
         for i in range(-tiles, tiles):
             for j in range(-tiles, tiles):
-                self.scene.append(Floor(self, position=(i*size*2.0, base_h, j*size*2.0), size=(size, 0.1, size)))
+                self.scene.append(Floor(self, position=(i*size*2.0, base_h, j*size*2.0), size=(size, 0.1, size),
+                                        quality=self.quality))
         cube_space = 1.5
-        self.cube = Cube(self,  albedo=(1.0, 1.0, 1.0), position=(-cube_space*2, 0, 0), texture="crate_0")
-        self.cube2 = Cube(self, albedo=(1.0, 1.0, 1.0), position=(-cube_space, 0, 0), texture="crate_1")
-        self.cube3 = Cube(self, albedo=(1.0, 1.0, 1.0), position=(0, 0, 0), texture="crate_2")
-        self.cube4 = Cube(self, albedo=(1.0, 1.0, 1.0), position=(cube_space, 0, 0), texture="crate_3")
-        self.cube5 = Cube(self, albedo=(1.0, 1.0, 1.0), position=(cube_space*2, 0, 0), texture="crate_4")
+        self.cube = Cube(self,  albedo=(1.0, 1.0, 1.0), position=(-cube_space*2, 0, 0), texture="crate_0",
+                         quality=self.quality)
+        self.cube2 = Cube(self, albedo=(1.0, 1.0, 1.0), position=(-cube_space, 0, 0), texture="crate_1",
+                         quality=self.quality)
+        self.cube3 = Cube(self, albedo=(1.0, 1.0, 1.0), position=(0, 0, 0), texture="crate_2",
+                         quality=self.quality)
+        self.cube4 = Cube(self, albedo=(1.0, 1.0, 1.0), position=(cube_space, 0, 0), texture="crate_3",
+                         quality=self.quality)
+        self.cube5 = Cube(self, albedo=(1.0, 1.0, 1.0), position=(cube_space*2, 0, 0), texture="crate_4",
+                         quality=self.quality)
         self.scene.extend([self.cube, self.cube2, self.cube3, self.cube4, self.cube5])
         # Font
         self.font = pygame.font.SysFont('arial', 64)
@@ -100,6 +116,8 @@ class GraphicsEngine:
                 sys.exit()
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_F1:
                 self.paused = not self.paused
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F2:
+                self.cycle_quality()
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
                 self.full_polygon = not self.full_polygon
                 self.toggle_full_polygon()
@@ -121,13 +139,27 @@ class GraphicsEngine:
             self.ctx.viewport = (0, 0, *self.win_size)
             self.camera.set_aspect_and_projection()
 
+    def cycle_quality(self):
+        tiers = list(self.shader.quality_tiers)
+        self.quality = tiers[(tiers.index(self.quality) + 1) % len(tiers)]
+        for obj in self.scene:
+            obj.set_quality(self.quality)
+        print(f"shader quality: {self.quality}")
+
     def toggle_full_polygon(self):
         if self.full_polygon:
             self.ctx.wireframe = False
         else:
             self.ctx.wireframe = True
 
+    def tick(self, dt):
+        self.camera.tick(dt)
+        if not self.paused:
+            for obj in self.scene:
+                obj.tick(dt)
+
     def update(self):
+        self.simulation.advance(self.delta_time * 0.001)
         self.camera.update()
         for obj in self.scene:
             obj.update()
@@ -1,6 +1,8 @@
 import glm
 import numpy
 
+from fixed_step import interpolate
+
 
 def generate_vertex_data(vertices, indices):
     data = [vertices[ind] for triangle in indices for ind in triangle]
@@ -8,9 +10,11 @@ def generate_vertex_data(vertices, indices):
 
 
 class Cube:
+    spin_speed = 1.0  # Radians per second
+
     def __init__(self, app, albedo=(0.9, 0.1, 0.1), diffuse=0.8, specular=1.0,
                  ao: float = 1.0, position=(0, 0, 0), size=(0.5, 0.5, 0.5),
-                 texture: str = 'crate_0'):
+                 texture: str = 'crate_0', quality: str = 'high'):
         self.app = app
         self.ctx = app.ctx
         self.size = size
@@ -21,8 +25,12 @@ class Cube:
         self.ao = ao
 
         self.vbo = self.get_vbo()
-        self.shader_program = app.shader.get_shader('default')
+        # Program variant and its VAO per quality tier, built on first use
+        self.quality = quality
+        self.vaos = {}
+        self.shader_program = app.shader.get_quality_shader('default', quality)
         self.vao = self.get_vao()
+        self.vaos[quality] = self.vao
 
         # self.shadow_vbo = self.get_vbo()
         self.shadow_program = app.shader.get_shader('shadow')
@@ -31,15 +39,33 @@ class Cube:
         self.tex_id = app.texture.get_texture(path=f'textures/{texture}.png')
         self.depth_tex_id = app.shadow.depth_tex_id
         self.m_model = self.position
+        # Spin in radians, advanced by the fixed simulation tick
+        self.angle = 0.0
+        self.previous_angle = 0.0
+        self.on_init()
+
+    @property
+    def max_lights(self):
+        return self.app.shader.quality_tiers[self.quality]['MAX_LIGHTS']
+
+    def set_quality(self, quality):
+        '''Switch to the program variant of another quality tier.'''
+        if quality == self.quality:
+            return
+        self.quality = quality
+        self.shader_program = self.app.shader.get_quality_shader('default', quality)
+        if quality not in self.vaos:
+            self.vaos[quality] = self.get_vao()
+        self.vao = self.vaos[quality]
         self.on_init()
 
     def on_init(self):
         # Set resolution
         self.shader_program['u_resolution'].write(glm.vec2(self.app.win_size))
         # n lights
-        self.shader_program['num_lights'].value = len(self.app.lights)
+        self.shader_program['num_lights'].value = min(len(self.app.lights), self.max_lights)
         # Send lights into uniform array of Light struct
-        for i, light in enumerate(self.app.lights):
+        for i, light in enumerate(self.app.lights[:self.max_lights]):
             self.shader_program[f'lights[{i}].position'].value = light.position
             self.shader_program[f'lights[{i}].color'].value = light.color
             self.shader_program[f'lights[{i}].strength'].value = light.strength
@@ -64,14 +90,19 @@ class Cube:
         self.shadow_program['m_view_light'].write(self.app.light.m_view_light)
         self.shadow_program['m_model'].write(self.m_model)
 
+    def tick(self, dt):
+        self.previous_angle = self.angle
+        self.angle += self.spin_speed * dt
+
     def update(self):
-        self.m_model = glm.rotate(self.position, self.app.time, glm.vec3(0, 1, 0))
+        angle = interpolate(self.previous_angle, self.angle, self.app.simulation.alpha)
+        self.m_model = glm.rotate(self.position, angle, glm.vec3(0, 1, 0))
 
     def render(self):
         # n lights
-        self.shader_program['num_lights'].value = len(self.app.lights)
+        self.shader_program['num_lights'].value = min(len(self.app.lights), self.max_lights)
         # Send lights into uniform array of Light struct
-        for i, light in enumerate(self.app.lights):
+        for i, light in enumerate(self.app.lights[:self.max_lights]):
             self.shader_program[f'lights[{i}].position'].value = light.position
             self.shader_program[f'lights[{i}].color'].value = light.color
             self.shader_program[f'lights[{i}].strength'].value = light.strength
@@ -101,7 +132,8 @@ class Cube:
         self.shadow_vao.render()
 
     def destroy(self):
-        self.vao.release()
+        for vao in self.vaos.values():
+            vao.release()
         self.shadow_vao.release()
         self.shader_program.release()
         self.shadow_program.release()
@@ -170,8 +202,11 @@ class Cube:
 class Floor(Cube):
     def __init__(self, app, albedo=(0.9, 0.1, 0.1), diffuse=0.8, specular=1.0,
                  ao: float = 1.0, position=(0, 0, 0), size=(0.5, 0.5, 0.5),
-                 texture: str = 'ground'):
-        super().__init__(app, albedo, diffuse, specular, ao, position, size, texture)
+                 texture: str = 'ground', quality: str = 'high'):
+        super().__init__(app, albedo, diffuse, specular, ao, position, size, texture, quality)
+
+    def tick(self, dt):
+        pass
 
     def update(self):
         self.m_model = self.position
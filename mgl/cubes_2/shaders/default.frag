@@ -7,6 +7,17 @@ in vec3 normal;
 in vec3 fragPos;
 in vec4 shadow_coord;
 
+// Permutation defaults, overridden by the defines of the quality tier
+#ifndef MAX_LIGHTS
+#define MAX_LIGHTS 99
+#endif
+#ifndef SHADOW_TAPS
+#define SHADOW_TAPS 16
+#endif
+#ifndef FOG
+#define FOG 0
+#endif
+
 struct Light {
   vec3 position;
   vec3 color;
@@ -21,7 +32,7 @@ struct Material {
 };
 
 // uniform vec3 camPos;
-uniform Light lights[99];
+uniform Light lights[MAX_LIGHTS];
 uniform float num_lights;
 uniform Material material;
 uniform sampler2D u_texture_0;
@@ -31,63 +42,8 @@ uniform vec2 u_resolution;
 const vec3 gamma = vec3(2.2);
 const vec3 i_gamma = vec3(1 / 2.2);
 
-float lookup(float ox, float oy) {
-  vec2 pixelOffset = 1 / u_resolution;
-  return textureProj(u_shadow_map, shadow_coord + vec4(ox * pixelOffset.x * shadow_coord.w, oy * pixelOffset.y * shadow_coord.w, 0.0, 0.0));
-}
-
-float getSoftShadowX4() {
-  float shadow;
-  float swidth = 1.5;  // shadow spread
-  vec2 offset = mod(floor(gl_FragCoord.xy), 2.0) * swidth;
-  shadow += lookup(-1.5 * swidth + offset.x, 1.5 * swidth - offset.y);
-  shadow += lookup(-1.5 * swidth + offset.x, -0.5 * swidth - offset.y);
-  shadow += lookup(0.5 * swidth + offset.x, 1.5 * swidth - offset.y);
-  shadow += lookup(0.5 * swidth + offset.x, -0.5 * swidth - offset.y);
-  return shadow / 4.0;
-}
-
-float getSoftShadowX8() {
-  float shadow;
-  float swidth = 1.0;
-  float endp = swidth * 1.5;
-  for (float y = -endp; y <= endp; y += swidth) {
-    for (float x = -endp; x <= endp; x += swidth) {
-      shadow += lookup(x, y);
-    }
-  }
-  return shadow / 8.0;
-}
-
-float getSoftShadowX16() {
-  float shadow;
-  float swidth = 1.0;
-  float endp = swidth * 1.5;
-  for (float y = -endp; y <= endp; y += swidth) {
-    for (float x = -endp; x <= endp; x += swidth) {
-      shadow += lookup(x, y);
-    }
-  }
-  return shadow / 16.0;
-}
-
-float getSoftShadowX64() {
-  float shadow;
-  float swidth = 0.6;
-  float endp = swidth * 3.0 + swidth / 2.0;
-  for (float y = -endp; y <= endp; y += swidth) {
-    for (float x = -endp; x <= endp; x += swidth) {
-      shadow += lookup(x, y);
-    }
-  }
-  return shadow / 64;
-}
-
-float getShadow() {
-  // Return 0 or 1 depending on the shadow map depth comparison, where 1 means the frag is in shadow
-  float shadow = textureProj(u_shadow_map, shadow_coord);
-  return shadow;
-}
+#include "shadow_pcf.glsl"
+#include "fog.glsl"
 
 vec3 calculateLight(vec3 N, Light light) {
   // Radience
@@ -118,18 +74,12 @@ vec3 getLight(vec3 tex_color) {
   vec3 ambient = vec3(0.03) * material.Ka * material.Kao;
 
   vec3 Lo = vec3(0.0);
-  for (int i = 0; i < num_lights; i++) {
+  for (int i = 0; i < min(int(num_lights), MAX_LIGHTS); i++) {
     Lo += calculateLight(N, lights[i]);
   }
 
-  // Shadow
-  // float shadow = getShadow();
-
-  // Shadow with 16 samples PCR lookup
-  float shadow = getSoftShadowX16();
-  // float shadow = getSoftShadowX64();
-  // float shadow = getSoftShadowX4();
-  // float shadow = getSoftShadowX8();
+  // Shadow with SHADOW_TAPS samples PCF lookup
+  float shadow = getSoftShadow();
 
   vec3 light_color = mix(ambient, Lo * shadow, 0.5);
   light_color = light_color / (light_color + vec3(1.0));
@@ -141,6 +91,7 @@ void main() {
   vec3 color = texture(u_texture_0, uv_0).rgb;
   color = pow(color, gamma);
   color = getLight(color);
+  color = applyFog(color);
   color = pow(color, i_gamma);
   fragColor = vec4(color, 1.0);
 }
\ No newline at end of file
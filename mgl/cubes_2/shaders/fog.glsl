@@ -0,0 +1,19 @@
+// Exponential squared fog by view depth, compiled in when FOG is 1
+
+#ifndef FOG_DENSITY
+#define FOG_DENSITY 0.04
+#endif
+#ifndef FOG_COLOR
+#define FOG_COLOR vec3(0.08, 0.16, 0.18)
+#endif
+
+vec3 applyFog(vec3 color) {
+#if FOG
+  // gl_FragCoord.w is 1 / clip w, which is the view depth for a perspective projection
+  float depth = 1.0 / gl_FragCoord.w;
+  float fog = exp(-pow(depth * FOG_DENSITY, 2.0));
+  return mix(FOG_COLOR, color, clamp(fog, 0.0, 1.0));
+#else
+  return color;
+#endif
+}
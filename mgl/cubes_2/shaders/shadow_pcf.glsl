@@ -0,0 +1,74 @@
+// Shadow map lookups, included by default.frag where u_shadow_map, shadow_coord and u_resolution are declared
+// Only the lookup selected by SHADOW_TAPS is called, so the others are removed by the compiler
+
+float lookup(float ox, float oy) {
+  vec2 pixelOffset = 1 / u_resolution;
+  return textureProj(u_shadow_map, shadow_coord + vec4(ox * pixelOffset.x * shadow_coord.w, oy * pixelOffset.y * shadow_coord.w, 0.0, 0.0));
+}
+
+float getSoftShadowX4() {
+  float shadow;
+  float swidth = 1.5;  // shadow spread
+  vec2 offset = mod(floor(gl_FragCoord.xy), 2.0) * swidth;
+  shadow += lookup(-1.5 * swidth + offset.x, 1.5 * swidth - offset.y);
+  shadow += lookup(-1.5 * swidth + offset.x, -0.5 * swidth - offset.y);
+  shadow += lookup(0.5 * swidth + offset.x, 1.5 * swidth - offset.y);
+  shadow += lookup(0.5 * swidth + offset.x, -0.5 * swidth - offset.y);
+  return shadow / 4.0;
+}
+
+float getSoftShadowX8() {
+  float shadow;
+  float swidth = 1.0;
+  float endp = swidth * 1.5;
+  for (float y = -endp; y <= endp; y += swidth) {
+    for (float x = -endp; x <= endp; x += swidth) {
+      shadow += lookup(x, y);
+    }
+  }
+  return shadow / 8.0;
+}
+
+float getSoftShadowX16() {
+  float shadow;
+  float swidth = 1.0;
+  float endp = swidth * 1.5;
+  for (float y = -endp; y <= endp; y += swidth) {
+    for (float x = -endp; x <= endp; x += swidth) {
+      shadow += lookup(x, y);
+    }
+  }
+  return shadow / 16.0;
+}
+
+float getSoftShadowX64() {
+  float shadow;
+  float swidth = 0.6;
+  float endp = swidth * 3.0 + swidth / 2.0;
+  for (float y = -endp; y <= endp; y += swidth) {
+    for (float x = -endp; x <= endp; x += swidth) {
+      shadow += lookup(x, y);
+    }
+  }
+  return shadow / 64;
+}
+
+float getShadow() {
+  // Return 0 or 1 depending on the shadow map depth comparison, where 1 means the frag is in shadow
+  float shadow = textureProj(u_shadow_map, shadow_coord);
+  return shadow;
+}
+
+float getSoftShadow() {
+#if SHADOW_TAPS >= 64
+  return getSoftShadowX64();
+#elif SHADOW_TAPS >= 16
+  return getSoftShadowX16();
+#elif SHADOW_TAPS >= 8
+  return getSoftShadowX8();
+#elif SHADOW_TAPS >= 4
+  return getSoftShadowX4();
+#else
+  return getShadow();
+#endif
+}
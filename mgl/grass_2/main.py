@@ -1,8 +1,9 @@
 import pygame
 import moderngl
 import sys
+import time
 
-from model import Terrain, Grass
+from model import Terrain, Grass, GrassInstanced
 from core import Camera, Light, Texture
 
 
@@ -14,6 +15,9 @@ class GraphicsEngine:
     target_display = 0
     base_path = '.'
     shader_path = 'shaders'
+    # Draw the grass as instanced blade meshes instead of expanding points in the geometry shader
+    instanced_grass = False
+    benchmark_frames = 60
     # Variables
     fps = 0
     time = 0
@@ -61,8 +65,12 @@ class GraphicsEngine:
         self.camera = Camera(self, position=(0, 1, 5))
         # Terrain
         self.terrain = Terrain(self)
-        # Grass and Ground
-        self.grass = Grass(self, terrain=self.terrain)
+        # Grass and Ground, both paths are built so they can be switched and compared
+        self.grass_paths = {
+            False: Grass(self, terrain=self.terrain),
+            True: GrassInstanced(self, terrain=self.terrain),
+        }
+        self.grass = self.grass_paths[self.instanced_grass]
         # Scene
         self.scene = [self.grass]
         # Font
@@ -71,20 +79,25 @@ class GraphicsEngine:
     def check_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
-                for obj in self.scene:
+                for obj in self.grass_paths.values():
                     obj.destroy()
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_F1:
                 self.paused = not self.paused
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F2:
+                self.toggle_instanced_grass()
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
                 self.full_polygon = not self.full_polygon
                 self.toggle_full_polygon()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                self.benchmark_grass()
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_F11:
                 self.full_screen = not self.full_screen
                 self.toggle_full_screen()
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_1:
-                self.grass.change_tile()
+                for grass in self.grass_paths.values():
+                    grass.change_tile()
 
     def toggle_full_screen(self):
         if self.full_screen:
@@ -100,6 +113,28 @@ class GraphicsEngine:
             self.ctx.viewport = (0, 0, *self.win_size)
             self.camera.set_aspect_and_projection()
 
+    def toggle_instanced_grass(self):
+        self.instanced_grass = not self.instanced_grass
+        self.grass = self.grass_paths[self.instanced_grass]
+        self.scene = [self.grass]
+        print(f"instanced grass: {self.instanced_grass}")
+
+    def benchmark_grass(self):
+        '''Draw each grass path benchmark_frames times from the current view, waiting for the GPU to finish.'''
+        blades = len(self.terrain.vertices_mesh)
+        for instanced, grass in self.grass_paths.items():
+            grass.update()
+            grass.render()
+            self.ctx.finish()
+            start = time.perf_counter()
+            for _ in range(self.benchmark_frames):
+                self.ctx.clear(color=(0.08, 0.16, 0.18))
+                grass.render()
+            self.ctx.finish()
+            frame_ms = (time.perf_counter() - start) * 1000 / self.benchmark_frames
+            print(f"grass {'instanced' if instanced else 'geometry shader'}: {blades} blades, "
+                  f"{frame_ms:.2f} ms/frame, {blades / frame_ms:.0f} blades/ms")
+
     def toggle_full_polygon(self):
         if self.full_polygon:
             self.ctx.wireframe = False
@@ -1,22 +1,29 @@
 import glm
+import math
 import moderngl
 import numpy
 
 
 class Terrain:
-    def __init__(self, app, position=(0, 0, 0), width=32, step=0.1, curve=0.5):
+    def __init__(self, app, position=(0, 0, 0), width=32, step=0.1, curve=0.5, tile_count=15, seed=0):
         self.app = app
         self.ctx = app.ctx
         self.position = glm.mat4(glm.translate(glm.mat4(1), glm.vec3(position)))
         self.width = width
         self.step = step
+        self.tile_count = tile_count
 
-        vertices = []
-        for x in numpy.arange(-width, width, step):
-            for z in numpy.arange(-width, width, step):
-                y = 0.5 * numpy.sin(curve * x) + 0.5 * numpy.sin(curve * z)
-                vertices.append((x, y, z))
-        self.vertices_mesh = numpy.array(vertices, dtype='f4')
+        # Grid of points in rows of x, computed for all points at once
+        x, z = numpy.meshgrid(numpy.arange(-width, width, step), numpy.arange(-width, width, step), indexing='ij')
+        y = 0.5 * numpy.sin(curve * x) + 0.5 * numpy.sin(curve * z)
+        self.vertices_mesh = numpy.stack([x, y, z], axis=-1).reshape(-1, 3).astype('f4')
+
+        # Per blade atlas tile, size, tint and rotation on Y as bytes, read as a uvec4 in the shaders
+        rng = numpy.random.default_rng(seed)
+        count = len(self.vertices_mesh)
+        self.blade_attributes = numpy.empty((count, 4), dtype='u1')
+        self.blade_attributes[:, 0] = rng.integers(0, tile_count, count)
+        self.blade_attributes[:, 1:4] = rng.integers(0, 256, (count, 3))
 
 
 class Grass:
@@ -25,34 +32,20 @@ class Grass:
         self.ctx = app.ctx
         self.position = glm.mat4(glm.translate(glm.mat4(1), glm.vec3(position)))
         self.terrain = terrain
-        self.vbo = self.get_vbo()
-        self.shader_program = self.get_shader_program(shader_name)
-        self.vao = self.get_vao()
-        self.tex_id = app.texture.get_alpha_texture(path=f'textures/{texture}.png')
-        self.tex_id_wind = app.texture.get_basic_texture(path=f'textures/flow_map.png')
 
         # Not ideal format but workable
         self.tex_size = 4096
         self.num_tiles = 4
-        self.tile_uv = self.num_tiles * 0.25
-        self.current_tile = 4
-        self.max_tile = 15
-        self.current_tile_xy = glm.vec2(0, 3)
-
-        # Tile indices: count from top left to bottom right, and store the top left corner of each tile
-        self.tile_indices = []
-        for i in range(self.num_tiles):
-            for j in range(self.num_tiles):
-                self.tile_indices.append(glm.vec2(i * self.tile_uv, j * self.tile_uv))
-
-        # Create a random selection of tile_indices (0-15) for each grass vertex
-        # self.terrain_types = []
-        # width = self.terrain.width
-        # step = self.terrain.step
-        # for x in numpy.arange(-width, width, step):
-        #     for z in numpy.arange(-width, width, step):
-        #         self.terrain_types.append(numpy.random.randint(0, 16))
+        # Each blade has its own tile from the terrain, the shaders add current_tile to it
+        self.current_tile = 0
+        self.max_tile = terrain.tile_count
 
+        self.vbo = self.get_vbo()
+        self.blade_vbo = self.ctx.buffer(self.terrain.blade_attributes)
+        self.shader_program = self.get_shader_program(shader_name)
+        self.vao = self.get_vao()
+        self.tex_id = app.texture.get_alpha_texture(path=f'textures/{texture}.png')
+        self.tex_id_wind = app.texture.get_basic_texture(path=f'textures/flow_map.png')
         self.on_init()
 
     def on_init(self):
@@ -67,8 +60,9 @@ class Grass:
         self.shader_program['m_proj'].write(self.app.camera.m_proj)
         self.shader_program['m_view'].write(self.app.camera.m_view)
         self.shader_program['camPos'].write = self.app.camera.position
-        # tile_indices
-        self.shader_program['u_current_tile'].value = self.current_tile_xy
+        # Tiles
+        self.shader_program['u_tile_offset'].value = self.current_tile
+        self.shader_program['u_tile_count'].value = self.max_tile
         # Set point size
         self.ctx.point_size = 4
 
@@ -81,8 +75,7 @@ class Grass:
         self.current_tile = self.current_tile + 1
         if self.current_tile >= self.max_tile:
             self.current_tile = 0
-        self.current_tile_xy = self.tile_indices[self.current_tile]
-        self.shader_program['u_current_tile'].value = self.current_tile_xy
+        self.shader_program['u_tile_offset'].value = self.current_tile
 
     def render(self):
         self.app.texture.textures[self.tex_id_wind].use(location=self.tex_id_wind)
@@ -91,12 +84,14 @@ class Grass:
 
     def destroy(self):
         self.vbo.release()
+        self.blade_vbo.release()
         self.shader_program.release()
         self.vao.release()
 
     def get_vao(self):
         vao = self.ctx.vertex_array(self.shader_program, [
             (self.vbo, '3f', 'in_position'),
+            (self.blade_vbo, '4u1', 'in_blade'),
         ])
         return vao
 
@@ -119,3 +114,65 @@ class Grass:
 
     def get_model_matrix(self):
         return glm.mat4()
+
+
+class GrassInstanced(Grass):
+    '''Same blades as Grass without the geometry shader: one small blade mesh of the three quads is drawn instanced,
+    with the terrain points and blade attributes as per instance buffers. The level of detail is chosen per quad in
+    the vertex shader, quads that are not drawn collapse to a point outside the view.'''
+
+    # Quad rotations on Y of the blade mesh, in the order grass.geom picks them by level of detail
+    quad_angles = (0.0, math.radians(45), math.radians(-45))
+
+    def __init__(self, app, position=(0, 0, 0), texture: str = 'grass', terrain: Terrain = None,
+                 shader_name='grass_instanced', fragment_shader_name='grass'):
+        self.fragment_shader_name = fragment_shader_name
+        self.blade_count = len(terrain.vertices_mesh)
+        super().__init__(app, position=position, texture=texture, terrain=terrain, shader_name=shader_name)
+
+    def render(self):
+        self.app.texture.textures[self.tex_id_wind].use(location=self.tex_id_wind)
+        self.app.texture.textures[self.tex_id].use(location=self.tex_id)
+        self.vao.render(moderngl.TRIANGLES, instances=self.blade_count)
+
+    def destroy(self):
+        self.vbo.release()
+        self.blade_vbo.release()
+        self.ibo.release()
+        self.instance_vbo.release()
+        self.shader_program.release()
+        self.vao.release()
+
+    def get_vao(self):
+        vao = self.ctx.vertex_array(self.shader_program, [
+            (self.vbo, '4f 3f', 'in_corner', 'in_quad'),
+            (self.instance_vbo, '3f/i', 'in_position'),
+            (self.blade_vbo, '4u1/i', 'in_blade'),
+        ], index_buffer=self.ibo, index_element_size=4)
+        return vao
+
+    def get_vbo(self):
+        # Blade mesh, the corners and texture coordinates of the grass.geom quads, wind moves the top left corner
+        corners = ((-0.25, 0.0, 0.0, 0.0), (0.25, 0.0, 1.0, 0.0), (-0.25, 0.5, 0.0, 1.0), (0.25, 0.5, 1.0, 1.0))
+        vertices = []
+        indices = []
+        for quad, angle in enumerate(self.quad_angles):
+            for corner_index, corner in enumerate(corners):
+                vertices.append((*corner, angle, 1.0 if corner_index == 2 else 0.0, quad))
+            # Same winding as the triangle strip
+            first = quad * 4
+            indices.extend((first, first + 1, first + 2, first + 2, first + 1, first + 3))
+        self.ibo = self.ctx.buffer(numpy.array(indices, dtype='i4'))
+        self.instance_vbo = self.ctx.buffer(self.terrain.vertices_mesh)
+        return self.ctx.buffer(numpy.array(vertices, dtype='f4'))
+
+    def get_shader_program(self, shader_name='grass_instanced'):
+        with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.vert', 'r') as f:
+            vertex_shader_source = f.read()
+        with open(f'{self.app.base_path}/{self.app.shader_path}/{self.fragment_shader_name}.frag', 'r') as f:
+            fragment_shader_source = f.read()
+        shader_program = self.ctx.program(
+            vertex_shader=vertex_shader_source,
+            fragment_shader=fragment_shader_source
+        )
+        return shader_program
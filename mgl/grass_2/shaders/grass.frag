@@ -5,6 +5,7 @@ layout (location = 0) out vec4 fragColor;
 in GS_OUT {
   vec2 textCoord;
   float colorVariation;
+  float tint;
 } fs_in;
 
 struct Light {
@@ -16,6 +17,9 @@ uniform Light light;
 uniform sampler2D u_texture_0;
 const vec3 gamma = vec3(2.2);
 const vec3 i_gamma = vec3(1 / 2.2);
+// Blades with a high tint turn towards dry grass
+const vec3 dry_tint = vec3(1.2, 1.05, 0.55);
+const float tint_strength = 0.6;
 
 vec3 getLight(vec3 color) {
   vec3 ambient = light.color;
@@ -30,5 +34,6 @@ void main() {
   color.rgb = getLight(color.rgb);
   color.rgb = pow(color.rgb, i_gamma);
   color.xyz = mix(color.xyz, 0.5 * color.xyz, fs_in.colorVariation);
+  color.rgb = mix(color.rgb, color.rgb * dry_tint, fs_in.tint * tint_strength);
   fragColor = vec4(color.rgb, 1.0);
 }
\ No newline at end of file
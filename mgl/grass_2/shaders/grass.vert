@@ -1,6 +1,11 @@
 #version 460 core
 
 layout (location = 0) in vec3 in_position;
+layout (location = 1) in uvec4 in_blade; // Atlas tile, size, tint and rotation on Y as bytes
+
+out VS_OUT {
+    uvec4 blade;
+} vs_out;
 
 // uniform mat4 m_proj;
 // uniform mat4 m_view;
@@ -10,4 +15,5 @@ void main() {
     // Not using m_proj, m_view, m_model but passing into Geometry Shader
     // gl_Position = m_proj * m_view * m_model * vec4(in_position, 1.0);
     gl_Position = vec4(in_position, 1.0);
+    vs_out.blade = in_blade;
 }
\ No newline at end of file
@@ -0,0 +1,152 @@
+#version 460 core
+
+// Instanced version of grass.geom: the blade mesh holds the three quads, and each instance is one blade
+layout (location = 0) in vec4 in_corner; // Quad corner x, y and texture u, v
+layout (location = 1) in vec3 in_quad; // Quad rotation on Y, wind weight and quad number
+layout (location = 2) in vec3 in_position; // Per blade
+layout (location = 3) in uvec4 in_blade; // Per blade atlas tile, size, tint and rotation on Y as bytes
+
+out GS_OUT {
+	vec2 textCoord;
+	float colorVariation;
+	float tint;
+} vs_out;
+
+uniform mat4 m_proj;
+uniform mat4 m_view;
+uniform vec3 camPos;
+uniform sampler2D u_wind;
+uniform float u_time;
+uniform int u_tile_offset = 0;
+uniform int u_tile_count = 15;
+
+const float c_min_size = 0.4;
+const float grass_scale = 2.0;
+const float n_tiles = 4.0;
+const float n_tile_shift = 1.0 / n_tiles;
+
+const float LOD1 = 50.0;
+const float LOD2 = 100.0;
+const float LOD3 = 400.0; // Basically, no render at this distance
+const float PI = 3.141592653589793;
+const float q_PI = PI * 0.25;
+const float qq_PI = q_PI * 0.5;
+
+const vec2 windDirection = vec2(1.0, 1.0);
+const float windStrength = 0.15;
+
+// Outside the clip volume, every vertex of a quad that is not drawn goes here so it is a culled point
+const vec4 hidden = vec4(2.0, 2.0, 2.0, 1.0);
+
+// Functions
+mat4 rotationX(in float angle);
+mat4 rotationY(in float angle);
+mat4 rotationZ(in float angle);
+float random(vec2 st);
+float noise(in vec2 st);
+float fbm(in vec2 _st);
+
+void main() {
+	// Distance of position to camera, with the same jitter as the geometry shader
+	float dist_length = length(in_position - camPos);
+	float t = 6.0;
+	if (dist_length > LOD1) {
+		t *= 1.5;
+	}
+	dist_length += (random(in_position.xz) * t - t / 2.0);
+	// Quad 0 is drawn at detail levels 3 and 1, quads 1 and 2 (at 45 and -45 degrees) at levels 3 and 2
+	int quad = int(in_quad.z);
+	float lod2_dist = 1.0;
+	float lod3_dist = 1.0;
+	bool visible = dist_length <= LOD3;
+	if (dist_length > LOD2) {
+		lod2_dist = 0.0;
+		lod3_dist = 0.0;
+		visible = visible && quad == 0;
+	} else if (dist_length > LOD1) {
+		lod2_dist = 0.0;
+		visible = quad != 0;
+	}
+	if (!visible) {
+		gl_Position = hidden;
+		vs_out.textCoord = vec2(0.0);
+		vs_out.colorVariation = 0.0;
+		vs_out.tint = 0.0;
+		return;
+	}
+
+	// Diminish the wind based on LOD levels
+	const float wind_scale = 0.6 + (lod2_dist * 0.25) + (lod3_dist * 0.15);
+	// Wind calculation using the flow map texture and time
+	vec2 uv = (in_position.xz * 0.1) + windDirection * windStrength * u_time * wind_scale;
+	uv.x = mod(uv.x, 1.0);
+	uv.y = mod(uv.y, 1.0);
+	mat4 wind_mat = mat4(1.0);
+	if (in_quad.y > 0.5) {
+		const vec4 wind = texture(u_wind, uv);
+		wind_mat = rotationX(wind.x * PI * 0.75 - PI * 0.25) * rotationZ(wind.y * PI * 0.75 - PI * 0.25);
+	}
+
+	// Rotation matrix to make the billboards face the camera
+	mat4 cam_rot = mat4(1.0);
+	cam_rot[0][0] = m_view[0][0];
+	cam_rot[0][2] = m_view[2][0];
+	cam_rot[2][0] = m_view[0][2];
+	cam_rot[2][2] = m_view[2][2];
+	mat4 rot_mat = cam_rot * rotationY(in_quad.x) * rotationY(float(in_blade.w) / 255.0 * q_PI - qq_PI);
+
+	const float grass_size = float(in_blade.y) / 255.0 * grass_scale * (1.0 - c_min_size) + c_min_size;
+	const int tile_index = (int(in_blade.x) + u_tile_offset) % u_tile_count;
+	const vec2 tile = vec2(tile_index / 4, tile_index % 4);
+	vec4 vertex_position = vec4(in_corner.xy, 0.0, 0.0) * grass_size;
+	gl_Position = m_proj * m_view * (vec4(in_position, 1.0) + wind_mat * rot_mat * vertex_position);
+	vs_out.textCoord = in_corner.zw / n_tiles + tile * n_tile_shift;
+	vs_out.colorVariation = fbm(in_position.xz);
+	vs_out.tint = float(in_blade.z) / 255.0;
+}
+
+mat4 rotationX(in float angle) {
+	return mat4(1.0, 0, 0, 0, 0, cos(angle), -sin(angle), 0, 0, sin(angle), cos(angle), 0, 0, 0, 0, 1);
+}
+
+mat4 rotationY(in float angle) {
+	return mat4(cos(angle), 0, sin(angle), 0, 0, 1.0, 0, 0, -sin(angle), 0, cos(angle), 0, 0, 0, 0, 1);
+}
+
+mat4 rotationZ(in float angle) {
+	return mat4(cos(angle), -sin(angle), 0, 0, sin(angle), cos(angle), 0, 0, 0, 0, 1, 0, 0, 0, 0, 1);
+}
+
+float random(vec2 st) {
+	return fract(sin(dot(st.xy, vec2(12.9898, 78.233))) * 43758.5453123);
+}
+
+float noise(in vec2 st) {
+	const vec2 i = floor(st);
+	const vec2 f = fract(st);
+	// Four corners in 2D of a tile
+	const float a = random(i);
+	const float b = random(i + vec2(1.0, 0.0));
+	const float c = random(i + vec2(0.0, 1.0));
+	const float d = random(i + vec2(1.0, 1.0));
+	// Smooth Interpolation
+	const vec2 u = smoothstep(0., 1., f);
+	// Mix 4 percentages
+	return mix(a, b, u.x) + (c - a) * u.y * (1.0 - u.x) + (d - b) * u.x * u.y;
+}
+
+const vec2 fbm_shift = vec2(100.0);
+const mat2 fbm_rot = mat2(cos(0.5), sin(0.5), -sin(0.5), cos(0.50));
+const int num_octaves = 3;
+float fbm(in vec2 _st) {
+	// Create variation with Fractal Brownian Motion, which we use to vary the color of the grass
+	// Returns a value between 0 and 1
+	float v = 0.0;
+	float a = 0.5;
+	for (int i = 0; i < num_octaves; ++i) {
+		v += a * noise(_st);
+		_st = fbm_rot * _st * 2.0 + fbm_shift;
+		a *= 0.5;
+	}
+	return v;
+}
@@ -0,0 +1,45 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy
+
+# Raise when the arrays built from the same inputs change, so older cache entries are not loaded
+cache_version = 1
+
+
+class BuildCache:
+    '''Arrays built from a height map, saved as .npy files in a directory per key and memory mapped when loaded.
+    The key is a hash of the height samples and the build parameters, so any change to either builds again.'''
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def get_key(self, heights: numpy.ndarray, **params) -> str:
+        '''Key of a build from the height samples and the parameters, which must be JSON values.'''
+        digest = hashlib.sha256(numpy.ascontiguousarray(heights))
+        params = {'version': cache_version, 'dtype': heights.dtype.str, 'shape': heights.shape, **params}
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()[:32]
+
+    def load(self, key: str, names: tuple) -> dict:
+        '''Arrays saved with the key, by name, or None when any is missing. They are copy on write memory maps, so
+        they can be edited without changing the files.'''
+        directory = os.path.join(self.path, key)
+        try:
+            return {name: numpy.load(os.path.join(directory, f'{name}.npy'), mmap_mode='c') for name in names}
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key: str, **arrays):
+        '''Save arrays with the key, written to a temporary directory first so a cut off save is never loaded.'''
+        directory = os.path.join(self.path, key)
+        temporary = f'{directory}.{os.getpid()}.tmp'
+        os.makedirs(temporary, exist_ok=True)
+        for name, array in arrays.items():
+            numpy.save(os.path.join(temporary, f'{name}.npy'), array)
+        try:
+            os.replace(temporary, directory)
+        except OSError:
+            # Saved by another run in the meantime
+            shutil.rmtree(temporary, ignore_errors=True)
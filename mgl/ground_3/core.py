@@ -172,9 +172,9 @@ class Texture:
         image = pygame.surfarray.array3d(image)  # Convert image to numpy array
         return image, width, height
 
-    def random_quad(self):
-        '''Return random texture coordinates for a quad.'''
-        rand_int = numpy.random.randint(4)
+    def random_quad(self, rng: numpy.random.Generator = None):
+        '''Return random texture coordinates for a quad, from rng when given.'''
+        rand_int = numpy.random.randint(4) if rng is None else rng.integers(4)
         texture_coords = []
         if rand_int == 0:
             texture_coords.append((0, 0))
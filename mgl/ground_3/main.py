@@ -4,6 +4,7 @@ import sys
 
 from model import Terrain, Ground, Grass, SkyBox
 from core import Camera, Light, Texture
+from build_cache import BuildCache
 
 
 class GraphicsEngine:
@@ -15,6 +16,13 @@ class GraphicsEngine:
     base_path = '.'
     shader_path = 'shaders'
     texture_path = 'textures'
+    # Rotate the ground texture per cell from a hash in the shader, instead of storing random texture coordinates
+    hash_texcoords = False
+    # Save the built terrain arrays in cache_path and memory map them on the next run with the same inputs; the seed
+    # picks the random texture rotations
+    build_cache = True
+    cache_path = 'cache'
+    seed = 0
     # Variables
     fps = 0
     time = 0
@@ -61,7 +69,8 @@ class GraphicsEngine:
         # Skybox
         self.skybox = SkyBox(self, texture_cube_name='skybox')
         # Terrain
-        self.terrain = Terrain(self)
+        build_cache = BuildCache(f'{self.base_path}/{self.cache_path}') if self.build_cache else None
+        self.terrain = Terrain(self, hash_texcoords=self.hash_texcoords, seed=self.seed, build_cache=build_cache)
         # Light
         self.global_light = Light(position=(0, 50, 0), color=(0.99, 0.95, 0.85), strength=1.0)
         self.light = Light(position=(0, 30, 0), color=(0.9, 0.1, 0.1), strength=24.0)
@@ -4,6 +4,8 @@ import moderngl
 import numpy
 import pygame
 
+from build_cache import BuildCache
+
 
 def generate_vertex_data(vertices, indices):
     data = [vertices[ind] for triangle in indices for ind in triangle]
@@ -37,7 +39,8 @@ def uniform_points_in_3d_triangle(p1, p2, p3, n):
 
 class Terrain:
     def __init__(self, app, position=(0, 0, 0), width=128, depth=128, max_height=75.0,
-                 height_map_path="height_map", scale=1.0, rounding_factor=6):
+                 height_map_path="height_map", scale=1.0, rounding_factor=6, hash_texcoords=False,
+                 grass_step_size=12, seed=0, build_cache: BuildCache = None):
         self.app = app
         self.ctx = app.ctx
         self.position = glm.mat4(glm.translate(glm.mat4(1), glm.vec3(position)))
@@ -55,13 +58,35 @@ class Terrain:
             self.height_map_d = depth
         self.half_width = math.floor(self.height_map_w / 2 * self.scale)
         self.half_depth = math.floor(self.height_map_d / 2 * self.scale)
+        # Leave out the texture coordinates, the ground shader rotates them per cell from a hash of the cell
+        self.hash_texcoords = hash_texcoords
+        self.grass_step_size = grass_step_size
+        # Random texture rotation per cell from the seed, so every build of the same inputs is the same
+        self.seed = seed
 
         # Get value at 0,0 i.e. half_width, half_depth; use this to place the terrain under the camera
         self.base_height = self.lookup_height(self.half_width, self.half_depth) + 1
+        self.load_or_build(build_cache)
+
+    def load_or_build(self, build_cache: BuildCache = None):
+        '''Load vertex_data and vertices_mesh saved by an earlier build of the same inputs, or build and save them.'''
+        if build_cache is not None:
+            key = build_cache.get_key(self.height_map[:self.height_map_d, :self.height_map_w, 0],
+                                      max_height=self.max_height, scale=self.scale,
+                                      rounding_factor=self.rounding_factor, grass_step_size=self.grass_step_size,
+                                      hash_texcoords=self.hash_texcoords, seed=self.seed)
+            arrays = build_cache.load(key, ('vertex_data', 'vertices_mesh'))
+            if arrays is not None:
+                print(f"terrain build cache: loaded {key}")
+                self.vertex_data, self.vertices_mesh = arrays['vertex_data'], arrays['vertices_mesh']
+                return
         self.vertices = self.get_vertices(self.height_map_w, self.height_map_d, self.max_height,
                                           self.base_height, self.height_map,
                                           self.half_width, self.half_depth, self.rounding_factor)
         self.vertex_data = self.generate_vertex_data(self.vertices)
+        if build_cache is not None:
+            build_cache.save(key, vertex_data=self.vertex_data, vertices_mesh=self.vertices_mesh)
+            print(f"terrain build cache: saved {key}")
 
     def lookup_height(self, x, z):
         height = round(self.height_map[z][x][0] / 255 * self.max_height, self.rounding_factor)
@@ -90,7 +115,8 @@ class Terrain:
         return vertices
 
     def generate_vertex_data(self, vertices):
-        grass_step_size = 12
+        grass_step_size = self.grass_step_size
+        rng = numpy.random.default_rng(self.seed)
         grass_vertices = []
         indices = []
         texture_coords = []
@@ -103,9 +129,11 @@ class Terrain:
             v4 = vertices[i + 3]
             indices.append((i, i + 2, i + 3))  # Triangle 1
             indices.append((i, i + 1, i + 2))  # Triangle 2
-            texture_coords.extend(self.app.texture.random_quad())
-            texture_indices.append((0, 2, 3))
-            texture_indices.append((0, 1, 2))
+            if not self.hash_texcoords:
+                texture_coords.extend(self.app.texture.random_quad(rng))
+                # Each cell has its own 4 texture coordinates, in the same order as its vertices
+                texture_indices.append((i, i + 2, i + 3))
+                texture_indices.append((i, i + 1, i + 2))
             # Normals
             normal_1 = glm.normalize(glm.cross(delta_ab(v1, v3), delta_ab(v1, v4)))
             new_normals = [[normal_1] * 3]
@@ -118,9 +146,10 @@ class Terrain:
         self.vertices_mesh = numpy.array(grass_vertices, dtype='f4')
 
         # Pack vertex data
-        texture_coord_data = generate_vertex_data(texture_coords, texture_indices)
         vertex_data = generate_vertex_data(vertices, indices)
-        vertex_data = numpy.hstack([texture_coord_data, vertex_data])
+        if not self.hash_texcoords:
+            texture_coord_data = generate_vertex_data(texture_coords, texture_indices)
+            vertex_data = numpy.hstack([texture_coord_data, vertex_data])
         normals = numpy.array(normals, dtype='f4').reshape(int(len(normals * 6)), 3)
         vertex_data = numpy.hstack([vertex_data, normals])
         return numpy.array(vertex_data, dtype='f4')
@@ -167,6 +196,9 @@ class Ground():
         self.shader_program['material.Kd'].value = self.diffuse
         self.shader_program['material.Ks'].value = self.specular
         self.shader_program['material.Kao'].value = self.ao
+        # Cell size to find the cell of a vertex for the texture coordinate hash
+        if self.terrain.hash_texcoords:
+            self.shader_program['scale'].value = self.terrain.scale
         # self.shader_program['camPos'].write = self.app.camera.position
         # Set point size
         # self.ctx.point_size = 4
@@ -186,6 +218,11 @@ class Ground():
         self.vao.release()
 
     def get_vao(self):
+        if self.terrain.hash_texcoords:
+            vao = self.ctx.vertex_array(self.shader_program, [
+                (self.vbo, '3f 3f', 'in_position', 'in_normal'),
+            ])
+            return vao
         vao = self.ctx.vertex_array(self.shader_program, [
             (self.vbo, '2f 3f 3f', 'in_texcoord_0', 'in_position', 'in_normal'),
         ])
@@ -197,6 +234,9 @@ class Ground():
     def get_shader_program(self, shader_name='default'):
         with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.vert', 'r') as f:
             vertex_shader_source = f.read()
+        if self.terrain.hash_texcoords:
+            version, _, rest = vertex_shader_source.partition('\n')
+            vertex_shader_source = f'{version}\n#define HASH_TEXCOORDS\n{rest}'
         with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.frag', 'r') as f:
             fragment_shader_source = f.read()
         shader_program = self.ctx.program(
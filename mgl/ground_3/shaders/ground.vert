@@ -1,6 +1,9 @@
 #version 460 core
 
+// With HASH_TEXCOORDS, added by the Python side, the texture coordinates are rotated per cell from a hash instead
+#if !defined(HASH_TEXCOORDS)
 layout (location = 0) in vec3 in_texcoord_0;
+#endif
 layout (location = 1) in vec3 in_position;
 layout (location = 2) in vec3 in_normal;
 
@@ -12,19 +15,49 @@ out vec3 normal;
 uniform mat4 m_proj;
 uniform mat4 m_view;
 uniform mat4 m_model;
+uniform float scale = 1.0;
 
+vec2 getTexcoord();
 float random(vec2 st);
 float noise(in vec2 st);
 float fbm(in vec2 _st);
 
 void main() {
-    uv_0 = in_texcoord_0.xy;
+    uv_0 = getTexcoord();
     normal = mat3(transpose(inverse(m_model))) * in_normal;
     fragPos = vec3(m_model * vec4(in_position, 1.0));
     colorVariation = fbm(in_position.xz);
     gl_Position = m_proj * m_view * m_model * vec4(in_position, 1.0);
 }
 
+#if defined(HASH_TEXCOORDS)
+// Each cell is two triangles of vertices v1, v3, v4 and v1, v2, v3, where v1 to v4 go around the cell from -x +z
+const int cell_corners[6] = int[6](0, 2, 3, 0, 1, 2);
+const vec2 corner_signs[4] = vec2[4](vec2(-1.0, 1.0), vec2(1.0, 1.0), vec2(1.0, -1.0), vec2(-1.0, -1.0));
+// Texture coordinates of v1 to v4 without rotation, a rotation of r starts r places along
+const vec2 corner_texcoords[4] = vec2[4](vec2(0.0, 0.0), vec2(1.0, 0.0), vec2(1.0, 1.0), vec2(0.0, 1.0));
+
+uint hashCell(ivec2 cell) {
+    uint h = uint(cell.x) * 73856093u ^ uint(cell.y) * 19349663u;
+    h ^= h >> 13;
+    h *= 0x5bd1e995u;
+    h ^= h >> 15;
+    return h;
+}
+
+vec2 getTexcoord() {
+    // The same four rotations as Texture.random_quad, picked by a hash of the cell so they never change
+    const int corner = cell_corners[gl_VertexID % 6];
+    const vec2 centre = in_position.xz - corner_signs[corner] * scale * 0.5;
+    const int rotation = int(hashCell(ivec2(round(centre / scale))) & 3u);
+    return corner_texcoords[(corner + rotation) % 4];
+}
+#else
+vec2 getTexcoord() {
+    return in_texcoord_0.xy;
+}
+#endif
+
 float random(vec2 st) {
     return fract(sin(dot(st.xy, vec2(12.9898, 78.233))) * 43758.5453123);
 }
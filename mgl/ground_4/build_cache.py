@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy
+
+# Raise when the arrays built from the same inputs change, so older cache entries are not loaded
+cache_version = 2
+
+
+class BuildCache:
+    '''Arrays built from a height map, saved as .npy files in a directory per key and memory mapped when loaded.
+    The key is a hash of the height samples and the build parameters, so any change to either builds again.'''
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def get_key(self, heights: numpy.ndarray, **params) -> str:
+        '''Key of a build from the height samples and the parameters, which must be JSON values.'''
+        digest = hashlib.sha256(numpy.ascontiguousarray(heights))
+        params = {'version': cache_version, 'dtype': heights.dtype.str, 'shape': heights.shape, **params}
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()[:32]
+
+    def load(self, key: str, names: tuple) -> dict:
+        '''Arrays saved with the key, by name, or None when any is missing. They are read only memory maps, so only
+        the parts used are read from the files.'''
+        directory = os.path.join(self.path, key)
+        try:
+            return {name: numpy.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in names}
+        except (OSError, ValueError):
+            return None
+
+    def create(self, key: str, **specs) -> dict:
+        '''Open .npy files to write arrays for the key part by part, each in order with array.tofile, see commit.
+        Args:
+            specs: Shape and dtype of each array by name
+        Returns:
+            dict: Open files by name
+        '''
+        temporary = f'{os.path.join(self.path, key)}.{os.getpid()}.tmp'
+        os.makedirs(temporary, exist_ok=True)
+        files = {}
+        for name, (shape, dtype) in specs.items():
+            files[name] = open(os.path.join(temporary, f'{name}.npy'), 'wb')
+            numpy.lib.format.write_array_header_1_0(
+                files[name], {'descr': numpy.dtype(dtype).str, 'fortran_order': False, 'shape': tuple(shape)})
+        return files
+
+    def commit(self, key: str, files: dict):
+        '''Close the files from create once every part is written, and move them in place to be loaded. They are
+        written to a temporary directory first, so a cut off save is never loaded.'''
+        for file in files.values():
+            file.close()
+        directory = os.path.join(self.path, key)
+        temporary = f'{directory}.{os.getpid()}.tmp'
+        try:
+            os.replace(temporary, directory)
+        except OSError:
+            # Saved by another run in the meantime
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    def save(self, key: str, **arrays):
+        '''Save whole arrays with the key.'''
+        files = self.create(key, **{name: (array.shape, array.dtype) for name, array in arrays.items()})
+        for name, array in arrays.items():
+            numpy.ascontiguousarray(array).tofile(files[name])
+        self.commit(key, files)
@@ -164,6 +164,23 @@ class Texture:
         self.textures.append(texture)
         return self.texture_count
 
+    def get_height_texture(self, name, heights):
+        '''Upload a 2D array of 0 to 1 heights indexed [z][x] as a one channel 16 bit normalized texture, read with
+        texelFetch.'''
+        if name in self.texture_map:
+            return self.texture_map[name]
+        depth, width = heights.shape
+        texture = self.ctx.texture(size=(width, depth), components=1, dtype='nu2',
+                                   data=numpy.round(heights * 65535).astype('u2').tobytes())
+        texture.filter = (moderngl.NEAREST, moderngl.NEAREST)
+        texture.repeat_x = False
+        texture.repeat_y = False
+        # Add to list
+        self.texture_count += 1
+        self.texture_map[name] = self.texture_count
+        self.textures.append(texture)
+        return self.texture_count
+
     def get_image_data(self, path):
         '''Return image data and size for in image file.'''
         image = pygame.image.load(path)
@@ -0,0 +1,73 @@
+import math
+import os
+import numpy
+
+# Height maps opened with numpy.memmap, so only the samples read are paged in from the file
+memmap_extensions = ('.npy', '.raw')
+
+
+class HeightMapFile:
+    '''A height map in a .npy file, or a headerless .raw file of little endian 16 bit samples, indexed [z][x].
+    The file is memory mapped and read tile by tile, so a region of a very large map costs only the memory of the
+    region, and opening it reads nothing.'''
+
+    def __init__(self, path: str, size: tuple = None, dtype: str = '<u2', tile_size: int = 512):
+        '''
+        Args:
+            path (str): .npy or .raw file
+            size (tuple): Width and depth of a .raw file, square when not given
+            dtype (str): Sample type of a .raw file
+            tile_size (int): Samples per side of the tiles read
+        '''
+        if path.endswith('.npy'):
+            self.data = numpy.load(path, mmap_mode='r')
+        else:
+            count = os.path.getsize(path) // numpy.dtype(dtype).itemsize
+            width, depth = size or (math.isqrt(count), math.isqrt(count))
+            if width * depth != count:
+                raise ValueError(f"{path} has {count} samples, not {width} x {depth}")
+            self.data = numpy.memmap(path, dtype=dtype, mode='r', shape=(depth, width))
+        if self.data.ndim != 2:
+            raise ValueError(f"{path} has shape {self.data.shape}, expected depth x width")
+        self.depth, self.width = self.data.shape
+        # Sample value of the greatest height
+        self.max_value = numpy.iinfo(self.data.dtype).max if self.data.dtype.kind in 'ui' else 1.0
+        self.tile_size = tile_size
+
+    def get_tiles(self, x0: int, x1: int, z0: int, z1: int):
+        '''Slices z, x of the tiles that cover samples x0 to x1 and z0 to z1, aligned to the tile grid.'''
+        size = self.tile_size
+        for z in range(z0 - z0 % size, z1, size):
+            for x in range(x0 - x0 % size, x1, size):
+                yield slice(max(z, z0), min(z + size, z1)), slice(max(x, x0), min(x + size, x1))
+
+    def read(self, x0: int, x1: int, z0: int, z1: int) -> numpy.ndarray:
+        '''Heights from 0 to 1 of samples x0 to x1 and z0 to z1, converted to float32 one tile at a time.'''
+        heights = numpy.empty((z1 - z0, x1 - x0), dtype='f4')
+        for rows, columns in self.get_tiles(x0, x1, z0, z1):
+            tile = heights[rows.start - z0:rows.stop - z0, columns.start - x0:columns.stop - x0]
+            tile[:] = self.data[rows, columns]
+            tile *= 1 / self.max_value
+        return heights
+
+
+def read_height_map(texture, path: str, width: int, depth: int, offset: tuple = (0, 0)) -> tuple:
+    '''Heights from 0 to 1 indexed [z][x] of up to width x depth samples from offset x, z of a height map file.
+    .npy and .raw files are memory mapped and only the region is read, an image is loaded whole with the red
+    channel as the height.
+    Args:
+        texture (Texture): Loads images
+        path (str): Height map file
+        width, depth (int): Most samples to read, the map may have fewer
+        offset (tuple): First sample x, z
+    Returns:
+        tuple: Heights, width and depth read
+    '''
+    x0, z0 = offset
+    if path.endswith(memmap_extensions):
+        height_map = HeightMapFile(path)
+        x1, z1 = min(x0 + width, height_map.width), min(z0 + depth, height_map.depth)
+        return height_map.read(x0, x1, z0, z1), x1 - x0, z1 - z0
+    image, _, _ = texture.get_image_data(path)
+    heights = image[z0:z0 + depth, x0:x0 + width, 0] / numpy.float32(255)
+    return heights, heights.shape[1], heights.shape[0]
@@ -0,0 +1,174 @@
+import math
+import numpy
+
+
+def reduce_level(low: numpy.ndarray, high: numpy.ndarray) -> tuple:
+    '''Lowest and highest value of each 2 x 2 block, an odd last row or column makes blocks of its own.'''
+    reduced_low, reduced_high = low[::2, ::2].copy(), high[::2, ::2].copy()
+    for i, j in ((0, 1), (1, 0), (1, 1)):
+        part_low, part_high = low[i::2, j::2], high[i::2, j::2]
+        rows, columns = part_low.shape
+        numpy.minimum(reduced_low[:rows, :columns], part_low, out=reduced_low[:rows, :columns])
+        numpy.maximum(reduced_high[:rows, :columns], part_high, out=reduced_high[:rows, :columns])
+    return reduced_low, reduced_high
+
+
+def intersect_triangle(origin: tuple, direction: tuple, a: tuple, b: tuple, c: tuple) -> float:
+    '''Distance along the ray to the triangle a, b, c, by Moller-Trumbore, or None when it misses.'''
+    e1 = (b[0] - a[0], b[1] - a[1], b[2] - a[2])
+    e2 = (c[0] - a[0], c[1] - a[1], c[2] - a[2])
+    p = (direction[1] * e2[2] - direction[2] * e2[1], direction[2] * e2[0] - direction[0] * e2[2],
+         direction[0] * e2[1] - direction[1] * e2[0])
+    det = e1[0] * p[0] + e1[1] * p[1] + e1[2] * p[2]
+    if abs(det) < 1e-12:
+        return None
+    inv_det = 1.0 / det
+    s = (origin[0] - a[0], origin[1] - a[1], origin[2] - a[2])
+    u = (s[0] * p[0] + s[1] * p[1] + s[2] * p[2]) * inv_det
+    if u < 0.0 or u > 1.0:
+        return None
+    q = (s[1] * e1[2] - s[2] * e1[1], s[2] * e1[0] - s[0] * e1[2], s[0] * e1[1] - s[1] * e1[0])
+    v = (direction[0] * q[0] + direction[1] * q[1] + direction[2] * q[2]) * inv_det
+    if v < 0.0 or u + v > 1.0:
+        return None
+    return (e2[0] * q[0] + e2[1] * q[1] + e2[2] * q[2]) * inv_det
+
+
+class HeightQuery:
+    '''Ground height and ray hits on a height field, as drawn by Terrain and GroundGPU: two triangles per cell, split
+    along the diagonal from sample x, z + 1 to sample x + 1, z.
+
+    A min/max quadtree keeps the lowest and highest height under each node, level 0 has one node per cell and each
+    level above joins 2 x 2 nodes of the one below. A ray visits only the nodes whose bounds it passes through,
+    nearest first, and tests the triangles of the cells it reaches, so the first hit found is the nearest.'''
+
+    def __init__(self, heights: numpy.ndarray, origin: tuple = (0.0, 0.0), scale: float = 1.0):
+        '''
+        Args:
+            heights (numpy.ndarray): Heights indexed [z][x], kept by reference so update can follow edits
+            origin (tuple): World x and z of sample 0, 0
+            scale (float): World distance between samples
+        '''
+        self.heights = heights
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.scale = float(scale)
+        self.depth, self.width = heights.shape
+        # Lowest and highest height per node, level 0 indexed [cell z][cell x]
+        self.levels = []
+        self.build()
+
+    def get_cell_bounds(self, x0: int, x1: int, z0: int, z1: int) -> tuple:
+        '''Lowest and highest corner height of cells x0 to x1 and z0 to z1, cell x, z spans samples x to x + 1.'''
+        corners = [self.heights[z0 + i:z1 + i, x0 + j:x1 + j] for i in (0, 1) for j in (0, 1)]
+        return numpy.minimum.reduce(corners), numpy.maximum.reduce(corners)
+
+    def build(self):
+        self.levels = [self.get_cell_bounds(0, self.width - 1, 0, self.depth - 1)]
+        while self.levels[-1][0].size > 1:
+            self.levels.append(reduce_level(*self.levels[-1]))
+
+    def update(self, x0: int, x1: int, z0: int, z1: int):
+        '''Refresh the nodes over the samples x0 to x1 and z0 to z1 after the heights there were changed.'''
+        # Cells x - 1 and x use sample x
+        x0, x1 = max(x0 - 1, 0), min(x1, self.width - 1)
+        z0, z1 = max(z0 - 1, 0), min(z1, self.depth - 1)
+        if x0 >= x1 or z0 >= z1:
+            return
+        low, high = self.get_cell_bounds(x0, x1, z0, z1)
+        self.levels[0][0][z0:z1, x0:x1] = low
+        self.levels[0][1][z0:z1, x0:x1] = high
+        for level in range(1, len(self.levels)):
+            x0, x1, z0, z1 = x0 // 2, (x1 + 1) // 2, z0 // 2, (z1 + 1) // 2
+            below_low, below_high = self.levels[level - 1]
+            low, high = reduce_level(below_low[z0 * 2:z1 * 2, x0 * 2:x1 * 2],
+                                     below_high[z0 * 2:z1 * 2, x0 * 2:x1 * 2])
+            level_low, level_high = self.levels[level][0][z0:z1, x0:x1], self.levels[level][1][z0:z1, x0:x1]
+            # The levels above only depend on this one, most edits stop changing the bounds after a few levels
+            if numpy.array_equal(low, level_low) and numpy.array_equal(high, level_high):
+                break
+            level_low[:] = low
+            level_high[:] = high
+
+    def get_heights(self, x, z) -> numpy.ndarray:
+        '''Ground height at many world positions at once, on the triangles of the cell each is in. Positions off the
+        map take the height of the nearest edge.
+        Args:
+            x, z: World positions, numbers or arrays of the same shape
+        Returns:
+            numpy.ndarray: Heights in the shape of x
+        '''
+        u = numpy.clip((numpy.asarray(x, dtype='f8') - self.origin[0]) / self.scale, 0, self.width - 1)
+        v = numpy.clip((numpy.asarray(z, dtype='f8') - self.origin[1]) / self.scale, 0, self.depth - 1)
+        i = numpy.minimum(u.astype(int), self.width - 2)
+        j = numpy.minimum(v.astype(int), self.depth - 2)
+        fu, fv = u - i, v - j
+        h00, h10 = self.heights[j, i], self.heights[j, i + 1]
+        h01, h11 = self.heights[j + 1, i], self.heights[j + 1, i + 1]
+        # The triangle with corner 0, 0 below the diagonal, and the one with corner 1, 1 above it
+        return numpy.where(fu + fv <= 1.0, h00 + (h10 - h00) * fu + (h01 - h00) * fv,
+                           h11 + (h01 - h11) * (1.0 - fu) + (h10 - h11) * (1.0 - fv))
+
+    def get_node_hit(self, level: int, x: int, z: int, origin: tuple, inverse: tuple, max_distance: float) -> float:
+        '''Distance along the ray to where it enters the bounds of a node, or None when it passes by.'''
+        size = self.scale * (1 << level)
+        low, high = self.levels[level][0][z, x], self.levels[level][1][z, x]
+        bounds = ((self.origin[0] + x * size, self.origin[0] + (x + 1) * size), (low, high),
+                  (self.origin[1] + z * size, self.origin[1] + (z + 1) * size))
+        near, far = 0.0, max_distance
+        for axis in range(3):
+            if inverse[axis] is None:
+                if not bounds[axis][0] <= origin[axis] <= bounds[axis][1]:
+                    return None
+                continue
+            t0 = (bounds[axis][0] - origin[axis]) * inverse[axis]
+            t1 = (bounds[axis][1] - origin[axis]) * inverse[axis]
+            near, far = max(near, min(t0, t1)), min(far, max(t0, t1))
+            if near > far:
+                return None
+        return near
+
+    def get_cell_hit(self, x: int, z: int, origin: tuple, direction: tuple) -> float:
+        '''Distance along the ray to the nearer of the two triangles of a cell, or None.'''
+        x0, z0 = self.origin[0] + x * self.scale, self.origin[1] + z * self.scale
+        x1, z1 = x0 + self.scale, z0 + self.scale
+        heights = self.heights
+        p00, p10 = (x0, float(heights[z, x]), z0), (x1, float(heights[z, x + 1]), z0)
+        p01, p11 = (x0, float(heights[z + 1, x]), z1), (x1, float(heights[z + 1, x + 1]), z1)
+        hits = [t for t in (intersect_triangle(origin, direction, p00, p10, p01),
+                            intersect_triangle(origin, direction, p11, p01, p10)) if t is not None and t >= 0.0]
+        return min(hits) if hits else None
+
+    def raycast(self, origin, direction, max_distance: float = math.inf) -> tuple:
+        '''First point where a ray meets the ground.
+        Args:
+            origin: World start of the ray, any 3 values such as a glm.vec3
+            direction (glm.vec3): Direction of the ray, distances are in its length
+            max_distance (float): Hits further along the ray are ignored
+        Returns:
+            tuple: Distance and world position of the hit, None when the ray misses
+        '''
+        origin = tuple(float(v) for v in origin)
+        direction = tuple(float(v) for v in direction)
+        inverse = tuple(1.0 / d if d != 0.0 else None for d in direction)
+        top = len(self.levels) - 1
+        if self.get_node_hit(top, 0, 0, origin, inverse, max_distance) is None:
+            return None
+        # Depth first, with the children of a node pushed far to near so the nearest is taken next
+        stack = [(top, 0, 0)]
+        while stack:
+            level, x, z = stack.pop()
+            if level == 0:
+                distance = self.get_cell_hit(x, z, origin, direction)
+                if distance is not None and distance <= max_distance:
+                    return distance, tuple(o + d * distance for o, d in zip(origin, direction))
+                continue
+            rows, columns = self.levels[level - 1][0].shape
+            children = []
+            for child_z in range(z * 2, min(z * 2 + 2, rows)):
+                for child_x in range(x * 2, min(x * 2 + 2, columns)):
+                    near = self.get_node_hit(level - 1, child_x, child_z, origin, inverse, max_distance)
+                    if near is not None:
+                        children.append((near, child_x, child_z))
+            for near, child_x, child_z in sorted(children, reverse=True):
+                stack.append((level - 1, child_x, child_z))
+        return None
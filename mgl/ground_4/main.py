@@ -1,24 +1,57 @@
 import pygame
 import moderngl
 import sys
+import time
+import tracemalloc
 
-from model import Terrain, Ground, Grass, SkyBox
+from model import Terrain, HeightMapTerrain, Ground, GroundGPU, Grass, SkyBox
 from core import Camera, Light, Texture
+from vertex_formats import get_format_report
+from build_cache import BuildCache
 
 
 class GraphicsEngine:
     # Settings
     target_fps = 2000
+    # Fly above the ground, or walk on it at eye_height; the camera is kept ground_clearance above the ground
     free_move = True
+    eye_height = 2.0
+    ground_clearance = 0.5
     vertical_sync = 0
     target_display = 0
     base_path = '.'
     shader_path = 'shaders'
     texture_path = 'textures'
+    # Height map in the texture path: a name for the .png image, or a .npy or .raw file of 16 bit samples that is
+    # memory mapped, so only the terrain size from map_offset (first sample x, z) is read from it
+    height_map_path = 'height_map'
+    map_offset = (0, 0)
+    # Save the built terrain arrays in cache_path and memory map them on the next run with the same inputs; the seed
+    # picks the random texture rotations
+    build_cache = True
+    cache_path = 'cache'
+    seed = 0
+    # Rows of cells built and uploaded at a time, and trace the peak memory of the terrain build with tracemalloc
+    slab_rows = 16
+    trace_memory = False
+    # Displace a shared grid patch by the height map texture on the GPU instead of building the mesh in Python,
+    # the flora needs the CPU mesh so it is left out
+    gpu_terrain = False
+    # Vertex format of the ground and grass buffers: 'f4' floats, or the packed 'f2' and 'i2', see vertex_formats.py
+    vertex_format = 'f4'
+    # Rotate the ground texture per cell from a hash in the shader, instead of storing random texture coordinates
+    hash_texcoords = False
+    # Sculpting brush: world radius and height change per second, at the ground under the centre of the view
+    brush_radius = 5.0
+    brush_strength = 10.0
+    brush_keys = {pygame.K_1: 'raise', pygame.K_2: 'lower', pygame.K_3: 'flatten', pygame.K_4: 'smooth'}
     # Variables
     fps = 0
     time = 0
     delta_time = 0
+    # Frames and seconds of the brush stroke in progress, reported when its key is released
+    stroke_frames = 0
+    stroke_time = 0.0
     # State
     paused = False
     full_polygon = True
@@ -61,17 +94,40 @@ class GraphicsEngine:
         # Skybox
         self.skybox = SkyBox(self, texture_cube_name='skybox')
         # Terrain
-        self.terrain = Terrain(self)
+        if self.trace_memory:
+            tracemalloc.start()
+        terrain_start = pygame.time.get_ticks()
+        if self.gpu_terrain:
+            self.terrain = HeightMapTerrain(self, height_map_path=self.height_map_path, map_offset=self.map_offset)
+        else:
+            build_cache = BuildCache(f'{self.base_path}/{self.cache_path}') if self.build_cache else None
+            self.terrain = Terrain(self, hash_texcoords=self.hash_texcoords, height_map_path=self.height_map_path,
+                                   map_offset=self.map_offset, seed=self.seed, build_cache=build_cache,
+                                   slab_rows=self.slab_rows)
+        print(f"terrain ready: {pygame.time.get_ticks() - terrain_start} ms, gpu: {self.gpu_terrain}")
         # Light
         self.global_light = Light(position=(0, 50, 0), color=(0.99, 0.95, 0.85), strength=1.0)
         self.light = Light(position=(0, 30, 0), color=(0.9, 0.1, 0.1), strength=24.0)
         # Lights
         self.lights = [self.light]
         # Grass and Ground
-        self.ground = Ground(self, terrain=self.terrain)
-        self.grass = Grass(self, terrain=self.terrain)
-        # Scene
-        self.scene = [self.ground, self.grass]
+        if self.gpu_terrain:
+            self.ground = GroundGPU(self, terrain=self.terrain)
+            self.scene = [self.ground]
+        else:
+            self.ground = Ground(self, terrain=self.terrain, vertex_format=self.vertex_format)
+            self.grass = Grass(self, terrain=self.terrain, vertex_format=self.vertex_format)
+            self.scene = [self.ground, self.grass]
+            stream_start = pygame.time.get_ticks()
+            self.terrain.stream((self.ground, self.grass))
+            print(f"terrain streamed: {pygame.time.get_ticks() - stream_start} ms, {self.slab_rows} rows per slab")
+            for line in get_format_report(self.terrain.vertex_count, self.terrain.point_count,
+                                          texcoords=not self.hash_texcoords):
+                print(line)
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"terrain memory: {current / 1024 ** 2:.1f} MB kept, {peak / 1024 ** 2:.1f} MB peak")
         # Font
         self.font = pygame.font.SysFont('arial', 64)
 
@@ -84,6 +140,14 @@ class GraphicsEngine:
                 sys.exit()
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_F1:
                 self.paused = not self.paused
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F2:
+                self.free_move = not self.free_move
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                self.pick()
+            elif event.type == pygame.KEYUP and event.key in self.brush_keys and self.stroke_frames:
+                print(f"brush {self.brush_keys[event.key]}: {self.stroke_frames} frames, "
+                      f"{self.stroke_time / self.stroke_frames * 1000:.2f} ms per frame")
+                self.stroke_frames, self.stroke_time = 0, 0.0
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
                 self.full_polygon = not self.full_polygon
                 self.toggle_full_polygon()
@@ -111,8 +175,60 @@ class GraphicsEngine:
         else:
             self.ctx.wireframe = True
 
+    def get_view_hit(self):
+        '''Distance and position of the ground under the centre of the view, None when the ground is out of reach.'''
+        return self.terrain.query.raycast(self.camera.position, self.camera.forward, self.camera.far)
+
+    def pick(self):
+        pick_start = pygame.time.get_ticks()
+        hit = self.get_view_hit()
+        if hit is None:
+            print(f"pick: no ground within {self.camera.far}")
+        else:
+            distance, position = hit
+            print(f"pick: ({position[0]:.2f}, {position[1]:.2f}, {position[2]:.2f}) at {distance:.2f}, "
+                  f"{pygame.time.get_ticks() - pick_start} ms")
+
+    def follow_ground(self):
+        '''Keep the camera above the ground, or on it at eye height when walking. Flying over the GPU terrain passes
+        through the ground instead, so its height query is only built once walking or picking needs it.'''
+        if self.gpu_terrain and self.free_move:
+            return
+        position = self.camera.position
+        ground = float(self.terrain.query.get_heights(position.x, position.z))
+        if not self.free_move:
+            position.y = ground + self.eye_height
+        elif position.y < ground + self.ground_clearance:
+            position.y = ground + self.ground_clearance
+        else:
+            return
+        self.camera.m_view = self.camera.get_view_matrix()
+
+    def apply_brush(self):
+        '''Sculpt the terrain at the centre of the view while a brush key is held, and update the changed cells in
+        the ground and grass buffers.'''
+        if self.gpu_terrain:
+            return
+        keys = pygame.key.get_pressed()
+        for key, brush in self.brush_keys.items():
+            if not keys[key]:
+                continue
+            brush_start = time.perf_counter()
+            hit = self.get_view_hit()
+            if hit is None:
+                continue
+            _, target = hit
+            cells = self.terrain.apply_brush(brush, target[0], target[2], self.brush_radius,
+                                             self.brush_strength * self.delta_time * 0.001,
+                                             targets=(self.ground, self.grass))
+            if cells is not None:
+                self.stroke_frames += 1
+                self.stroke_time += time.perf_counter() - brush_start
+
     def update(self):
+        self.apply_brush()
         self.camera.update()
+        self.follow_ground()
         self.skybox.update()
         for obj in self.scene:
             obj.update()
@@ -1,43 +1,54 @@
 import math
+import os
 import glm
 import moderngl
 import numpy
 
+from vertex_formats import (get_ground_dtype, get_ground_layout, point_dtypes, point_layouts, pack_ground, pack_points,
+                            add_defines)
+from height_query import HeightQuery
+from height_map_file import read_height_map
+from build_cache import BuildCache
 
-def generate_vertex_data(vertices, indices):
-    data = [vertices[ind] for triangle in indices for ind in triangle]
-    return numpy.array(data, dtype='f4')
 
+# Each cell is drawn as the triangles v1, v3, v4 and v1, v2, v3, where v1 to v4 go around the cell from -x +z
+cell_corners = numpy.array([0, 2, 3, 0, 1, 2])
+# Corners of the two edges from v1 of each drawn triangle, and the triangles v1, v2, v3 and v1, v3, v4 of the grass
+triangle_edges = numpy.array([[2, 3], [1, 2]])
+grass_triangles = numpy.array([[0, 1, 2], [0, 2, 3]])
+# Texture coordinates of v1 to v4, a cell rotated by r starts r places along, as in Texture.random_quad
+quad_texcoords = numpy.array([(0, 0), (1, 0), (1, 1), (0, 1)], dtype='f4')
 
-def delta_ab(a, b):
-    return glm.vec3(b[0] - a[0], b[1] - a[1], b[2] - a[2])
+# Brush modes of Terrain.apply_brush
+brushes = ('raise', 'lower', 'flatten', 'smooth')
 
 
-def dot_product(a, b):
-    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+def get_triangle_weights(n):
+    '''Barycentric weights of n * (n + 1) / 2 points spread evenly over a triangle, one row per point.'''
+    weights = [(i, j, n - i - j) for i in range(n) for j in range(n - i)]
+    return numpy.array(weights, dtype='f4') / n
 
 
-def angle_between_vectors(a, b):
-    # unit_vector_of_ground = glm.vec3(0, 1, 0)
-    return math.acos(dot_product(a, b))
+def normalize(vectors):
+    return vectors / numpy.linalg.norm(vectors, axis=-1, keepdims=True)
 
 
-def uniform_points_in_3d_triangle(p1, p2, p3, n):
-    points = []
-    for i in range(n):
-        for j in range(n - i):
-            k = n - i - j
-            x = (i * p1[0] + j * p2[0] + k * p3[0]) / n
-            y = (i * p1[1] + j * p2[1] + k * p3[1]) / n
-            z = (i * p1[2] + j * p2[2] + k * p3[2]) / n
-            points.append((x, y, z))
-    return points
+def cross(a, b):
+    '''numpy.cross over the last axis without its per call overhead, which adds up on the small blocks of a brush.'''
+    return a[..., [1, 2, 0]] * b[..., [2, 0, 1]] - a[..., [2, 0, 1]] * b[..., [1, 2, 0]]
 
 
 class Terrain:
+    '''Ground mesh and grass points from a height map. Only the heights are kept; the vertices and points are
+    built a slab of rows at a time by stream and written straight into the buffers of Ground and Grass, so the
+    whole mesh is never held in memory. The heights can be edited with apply_brush, after which only the cells
+    around the brush are rebuilt and written. Every cell has a fixed place in the buffers so that region can be
+    written over. Grass points of triangles that are too steep are NaN, drawn as nothing.'''
+
     def __init__(self, app, position=(0, 0, 0), width=128, depth=128, max_height=100.0,
                  flora_steepness_degree_max=75, grass_step_size=15,
-                 height_map_path="height_map", scale=1.0, rounding_factor=6):
+                 height_map_path="height_map", scale=1.0, rounding_factor=6, hash_texcoords=False,
+                 map_offset=(0, 0), seed=0, build_cache: BuildCache = None, slab_rows=16):
         self.app = app
         self.ctx = app.ctx
         self.position = glm.mat4(glm.translate(glm.mat4(1), glm.vec3(position)))
@@ -46,101 +57,357 @@ class Terrain:
 
         self.scale = scale
         self.half_scale: float = self.scale / 2
-        self.height_map, self.height_map_w, self.height_map_d = self.load_height_image(height_map_path)
-
-        # Temporary limit for terrain size
-        if width != self.height_map_w and width <= self.height_map_w:
-            self.height_map_w = width
-        if depth != self. height_map_d and depth <= self.height_map_d:
-            self.height_map_d = depth
+        # Only the width x depth samples from map_offset, the terrain size is limited to the map
+        self.height_map, self.height_map_w, self.height_map_d = self.load_height_map(height_map_path, width, depth,
+                                                                                     map_offset)
         self.half_width = math.floor(self.height_map_w / 2 * self.scale)
         self.half_depth = math.floor(self.height_map_d / 2 * self.scale)
 
         # Flora
         self.grass_step_size = grass_step_size
         self.flora_steepness_max = flora_steepness_degree_max
+        self.grass_weights = get_triangle_weights(grass_step_size)
+        # Leave out the texture coordinates, the ground shader rotates them per cell from a hash of the cell
+        self.hash_texcoords = hash_texcoords
 
         # Get value at 0,0 i.e. half_width, half_depth; use this to place the terrain under the camera
         self.base_height = self.lookup_height(self.half_width, self.half_depth) + 1
-        self.vertices = self.get_vertices(self.height_map_w, self.height_map_d, self.max_height,
-                                          self.base_height, self.height_map,
-                                          self.half_width, self.half_depth, self.rounding_factor)
-        self.vertex_data = self.generate_vertex_data(self.vertices, self.grass_step_size)
+        # Heights indexed [z][x] like the height map, relative to base_height, and the lowest and highest allowed
+        self.heights = numpy.round(self.height_map * self.max_height - self.base_height,
+                                   self.rounding_factor).astype('f4')
+        self.height_range = (-self.base_height, self.max_height - self.base_height)
+        # Ground height and ray queries, sample x is at x * scale + half_scale - half_width * scale
+        self.query = HeightQuery(self.heights, (self.half_scale - self.half_width * self.scale,
+                                                self.half_scale - self.half_depth * self.scale), self.scale)
+        # Random texture rotation per cell from the seed, so every build of the same inputs is the same
+        self.seed = seed
+        self.texture_rotations = numpy.random.default_rng(seed).integers(
+            4, size=(self.height_map_d - 1, self.height_map_w - 1)).astype('u1')
+        self.cells = (1, self.height_map_w, 1, self.height_map_d)
+        # Six ground vertices and two triangles of grass points per cell, with 2 texture coordinates unless hashed
+        cell_count = (self.height_map_w - 1) * (self.height_map_d - 1)
+        self.vertex_count = cell_count * 6
+        self.vertex_columns = 6 if self.hash_texcoords else 8
+        self.point_count = cell_count * 2 * len(self.grass_weights)
+        self.slab_rows = slab_rows
+        self.build_cache = build_cache
+        if build_cache is not None:
+            self.cache_key = build_cache.get_key(
+                self.height_map, width=self.height_map_w, depth=self.height_map_d, max_height=self.max_height,
+                scale=self.scale, rounding_factor=self.rounding_factor, grass_step_size=self.grass_step_size,
+                flora_steepness_max=self.flora_steepness_max, hash_texcoords=self.hash_texcoords, seed=self.seed)
+
+    def stream(self, targets: tuple):
+        '''Build the ground vertices and grass points slab_rows rows of cells at a time, and pass each slab to the
+        write_cells of every target, such as Ground and Grass, before building the next one. With a build cache the
+        slabs are read from an earlier build of the same inputs, or saved as they are built.'''
+        row = self.height_map_w - 1
+        points_per_triangle = len(self.grass_weights)
+        arrays, files = None, None
+        if self.build_cache is not None:
+            arrays = self.build_cache.load(self.cache_key, ('vertex_data', 'vertices_mesh'))
+            if arrays is None:
+                files = self.build_cache.create(
+                    self.cache_key, vertex_data=((self.vertex_count, self.vertex_columns), 'f4'),
+                    vertices_mesh=((self.point_count // points_per_triangle, points_per_triangle, 3), 'f4'))
+        for z0 in range(1, self.height_map_d, self.slab_rows):
+            cells = (1, self.height_map_w, z0, min(z0 + self.slab_rows, self.height_map_d))
+            if arrays is not None:
+                first, last = (z0 - 1) * row, (cells[3] - 1) * row
+                vertex_data = arrays['vertex_data'][first * 6:last * 6].reshape(-1, row, 6, self.vertex_columns)
+                points = arrays['vertices_mesh'][first * 2:last * 2].reshape(-1, row, 2, points_per_triangle, 3)
+            else:
+                vertex_data, points = self.generate_vertex_data(*cells)
+                if files is not None:
+                    vertex_data.tofile(files['vertex_data'])
+                    points.tofile(files['vertices_mesh'])
+            for target in targets:
+                target.write_cells(cells, vertex_data, points)
+        if files is not None:
+            self.build_cache.commit(self.cache_key, files)
+            print(f"terrain build cache: saved {self.cache_key}")
+        elif arrays is not None:
+            print(f"terrain build cache: loaded {self.cache_key}")
 
     def lookup_height(self, x, z):
-        height = round(self.height_map[z][x][0] / 255 * self.max_height, self.rounding_factor)
+        height = round(float(self.height_map[z][x]) * self.max_height, self.rounding_factor)
         return height
 
-    def load_height_image(self, height_map_path):
-        return self.app.texture.get_image_data(f'{self.app.base_path}/{self.app.texture_path}/{height_map_path}.png')
-
-    def get_vertices(self, height_map_w: int, height_map_d: int, max_h: float, offset_h: int,
-                     height_map: list, half_width: int, half_depth: int, r_factor=5):
-        vertices = []
-        offset_w = half_width * self.scale
-        offset_d = half_depth * self.scale
-        for z in range(1, height_map_d):
-            for x in range(1, height_map_w):
-                y1 = round(height_map[z][x-1][0] / 255 * max_h - offset_h, r_factor)
-                y2 = round(height_map[z][x][0] / 255 * max_h - offset_h, r_factor)
-                y3 = round(height_map[z-1][x][0] / 255 * max_h - offset_h, r_factor)
-                y4 = round(height_map[z-1][x-1][0] / 255 * max_h - offset_h, r_factor)
-                x_pos = x * self.scale
-                z_pos = z * self.scale
-                vertices.append((x_pos-self.half_scale-offset_w, y1, z_pos+self.half_scale-offset_d))
-                vertices.append((x_pos+self.half_scale-offset_w, y2, z_pos+self.half_scale-offset_d))
-                vertices.append((x_pos+self.half_scale-offset_w, y3, z_pos-self.half_scale-offset_d))
-                vertices.append((x_pos-self.half_scale-offset_w, y4, z_pos-self.half_scale-offset_d))
-        return vertices
-
-    def generate_vertex_data(self, vertices, grass_step_size=12):
-        grass_vertices = []
-        indices = []
-        texture_coords = []
-        texture_indices = []
-        normals = []
-        for i in range(0, len(vertices) - 1, 4):
-            v1 = vertices[i]
-            v2 = vertices[i + 1]
-            v3 = vertices[i + 2]
-            v4 = vertices[i + 3]
-            indices.append((i, i + 2, i + 3))  # Triangle 1
-            indices.append((i, i + 1, i + 2))  # Triangle 2
-            texture_coords.extend(self.app.texture.random_quad())
-            texture_indices.append((0, 2, 3))
-            texture_indices.append((0, 1, 2))
-            # Normals
-            normal_1 = glm.normalize(glm.cross(delta_ab(v1, v3), delta_ab(v1, v4)))
-            new_normals = [[normal_1] * 3]
-            normal_2 = glm.normalize(glm.cross(delta_ab(v1, v2), delta_ab(v1, v3)))
-            new_normals.extend([[normal_2] * 3])
-            normals.append(new_normals)
-
-            # Add grass blade points along each triangle
-            # grass_vertices.append(uniform_points_in_3d_triangle(v1, v2, v3, grass_step_size))
-            # grass_vertices.append(uniform_points_in_3d_triangle(v1, v3, v4, grass_step_size))
-
-            # Add grass only if the triangle is not too steep
-            if angle_between_vectors(normal_1, glm.vec3(0, 1, 0)) < math.radians(self.flora_steepness_max):
-                grass_vertices.append(uniform_points_in_3d_triangle(v1, v2, v3, grass_step_size))
-            if angle_between_vectors(normal_2, glm.vec3(0, 1, 0)) < math.radians(self.flora_steepness_max):
-                grass_vertices.append(uniform_points_in_3d_triangle(v1, v3, v4, grass_step_size))
-
-        self.vertices_mesh = numpy.array(grass_vertices, dtype='f4')
-
-        # Pack vertex data
-        texture_coord_data = generate_vertex_data(texture_coords, texture_indices)
-        vertex_data = generate_vertex_data(vertices, indices)
-        vertex_data = numpy.hstack([texture_coord_data, vertex_data])
-        normals = numpy.array(normals, dtype='f4').reshape(int(len(normals * 6)), 3)
-        vertex_data = numpy.hstack([vertex_data, normals])
-        return numpy.array(vertex_data, dtype='f4')
+    def load_height_map(self, height_map_path, width, depth, offset):
+        '''Heights from 0 to 1 of the region, see read_height_map. A name without an extension is a .png image.'''
+        path = f'{self.app.base_path}/{self.app.texture_path}/{height_map_path}'
+        if not os.path.splitext(height_map_path)[1]:
+            path += '.png'
+        return read_height_map(self.app.texture, path, width, depth, offset)
+
+    def get_bounds(self) -> tuple:
+        '''Centre and half size of every position the ground can have after editing, for the packed formats.'''
+        low = numpy.array([-self.half_width * self.scale, self.height_range[0], -self.half_depth * self.scale])
+        high = numpy.array([(self.height_map_w - self.half_width) * self.scale, self.height_range[1],
+                            (self.height_map_d - self.half_depth) * self.scale])
+        return tuple(float(v) for v in (low + high) / 2), tuple(float(v) for v in (high - low) / 2)
+
+    def get_vertices(self, x0: int, x1: int, z0: int, z1: int) -> numpy.ndarray:
+        '''Corners v1 to v4 of the cells x0 to x1 and z0 to z1, cell x, z spans height samples x - 1 to x.
+        Returns:
+            numpy.ndarray: Positions indexed [z, x, corner]
+        '''
+        heights = self.heights
+        x = (numpy.arange(x0, x1) * self.scale - self.half_width * self.scale)[:, None]
+        z = (numpy.arange(z0, z1) * self.scale - self.half_depth * self.scale)[:, None, None]
+        corners = numpy.empty((z1 - z0, x1 - x0, 4, 3), dtype='f4')
+        corners[:, :, [0, 3], 0] = x - self.half_scale
+        corners[:, :, [1, 2], 0] = x + self.half_scale
+        corners[:, :, [0, 1], 2] = z + self.half_scale
+        corners[:, :, [2, 3], 2] = z - self.half_scale
+        corners[:, :, 0, 1] = heights[z0:z1, x0 - 1:x1 - 1]
+        corners[:, :, 1, 1] = heights[z0:z1, x0:x1]
+        corners[:, :, 2, 1] = heights[z0 - 1:z1 - 1, x0:x1]
+        corners[:, :, 3, 1] = heights[z0 - 1:z1 - 1, x0 - 1:x1 - 1]
+        return corners
+
+    def generate_vertex_data(self, x0: int, x1: int, z0: int, z1: int) -> tuple:
+        '''Ground vertices and grass points of a block of cells.
+        Returns:
+            tuple: Vertex data indexed [z, x, vertex] with the texcoord (unless hashed), position and normal, and
+            grass points indexed [z, x, triangle, point]
+        '''
+        corners = self.get_vertices(x0, x1, z0, z1)
+        # Normals of the triangles v1, v3, v4 and v1, v2, v3, all at once so a brush stroke makes few numpy calls
+        edges = corners[:, :, triangle_edges] - corners[:, :, :1, None]
+        normals = normalize(cross(edges[:, :, :, 0], edges[:, :, :, 1]))
+        vertex_data = [corners[:, :, cell_corners], normals.repeat(3, axis=2)]
+        if not self.hash_texcoords:
+            rotations = self.texture_rotations[z0 - 1:z1 - 1, x0 - 1:x1 - 1, None]
+            vertex_data.insert(0, quad_texcoords[(cell_corners + rotations) % 4])
+        vertex_data = numpy.concatenate(vertex_data, axis=-1)
+
+        # Grass blade points along each triangle, none where the triangle is too steep
+        points = self.grass_weights @ corners.take(grass_triangles, axis=2)
+        steep = normals[:, :, ::-1, 1] < math.cos(math.radians(self.flora_steepness_max))
+        points[steep] = numpy.nan
+        return vertex_data, points
+
+    def apply_brush(self, brush: str, x: float, z: float, radius: float, strength: float = 1.0,
+                    targets: tuple = ()) -> tuple:
+        '''Edit the heights around a world position with a smooth falloff to the radius, then rebuild the cells
+        that use them and write them to the targets, as in stream.
+        Args:
+            brush (str): 'raise' or 'lower' by strength, 'flatten' towards the height at the centre or 'smooth'
+                towards the mean of the neighbours, both by strength as a fraction
+            x, z (float): World position of the centre
+            radius (float): World radius
+            strength (float): Height change at the centre
+            targets (tuple): Objects with write_cells, such as Ground and Grass
+        Returns:
+            tuple: Cells x0, x1, z0, z1 that were rebuilt, None when the brush is off the map
+        '''
+        # Height sample i, j is at world i * scale + half_scale - half_width * scale
+        centre_x = (x + self.half_width * self.scale - self.half_scale) / self.scale
+        centre_z = (z + self.half_depth * self.scale - self.half_scale) / self.scale
+        reach = radius / self.scale
+        sx0, sx1 = max(math.floor(centre_x - reach), 0), min(math.ceil(centre_x + reach) + 1, self.height_map_w)
+        sz0, sz1 = max(math.floor(centre_z - reach), 0), min(math.ceil(centre_z + reach) + 1, self.height_map_d)
+        if sx0 >= sx1 or sz0 >= sz1:
+            return None
+        samples_x, samples_z = numpy.meshgrid(numpy.arange(sx0, sx1), numpy.arange(sz0, sz1))
+        distance = numpy.hypot(samples_x - centre_x, samples_z - centre_z) / reach
+        falloff = numpy.clip(1.0 - distance ** 2, 0.0, 1.0) ** 2
+        region = self.heights[sz0:sz1, sx0:sx1]
+        if brush == 'raise':
+            region += falloff * strength
+        elif brush == 'lower':
+            region -= falloff * strength
+        elif brush == 'flatten':
+            # The nearest sample to the centre, which may be off the map within reach
+            target = region[min(max(round(centre_z) - sz0, 0), sz1 - sz0 - 1),
+                            min(max(round(centre_x) - sx0, 0), sx1 - sx0 - 1)]
+            region += (target - region) * numpy.clip(falloff * strength, 0.0, 1.0)
+        elif brush == 'smooth':
+            # Mean of the 3 x 3 neighbourhood, summed rows then columns, the edges of the map repeat
+            rows = numpy.clip(numpy.arange(sz0 - 1, sz1 + 1), 0, self.height_map_d - 1)
+            columns = numpy.clip(numpy.arange(sx0 - 1, sx1 + 1), 0, self.height_map_w - 1)
+            around = self.heights[rows[:, None], columns]
+            around = around[:-2] + around[1:-1] + around[2:]
+            mean = (around[:, :-2] + around[:, 1:-1] + around[:, 2:]) / 9
+            region += (mean - region) * numpy.clip(falloff * strength, 0.0, 1.0)
+        else:
+            raise ValueError(f"unknown brush {brush}, expected one of {brushes}")
+        numpy.clip(region, *self.height_range, out=region)
+        self.query.update(sx0, sx1, sz0, sz1)
+        # Cells x use samples x - 1 and x
+        cells = (max(sx0, 1), min(sx1 + 1, self.height_map_w), max(sz0, 1), min(sz1 + 1, self.height_map_d))
+        vertex_data, points = self.generate_vertex_data(*cells)
+        for target in targets:
+            target.write_cells(cells, vertex_data, points)
+        return cells
+
+    def write_cell_rows(self, buffer: moderngl.Buffer, cells: tuple, data: numpy.ndarray, per_cell: int):
+        '''Write packed data of a block of cells, per_cell items for each, into a buffer in cell order. A block of
+        whole rows is one write, otherwise each row of the block is a chunk of the data a row of cells apart.'''
+        x0, x1, z0, z1 = cells
+        row = self.height_map_w - 1
+        cell_size = per_cell * data.itemsize
+        start = ((z0 - 1) * row + x0 - 1) * cell_size
+        if x1 - x0 == row:
+            buffer.write(data, offset=start)
+            return
+        buffer.write_chunks(data, start, row * cell_size, z1 - z0)
+
+
+class HeightMapTerrain:
+    '''The height map as a one channel texture for GroundGPU, placed like Terrain with the same max_height, scale and
+    base_height. No vertices are built on the CPU and nothing is kept from the image, unless the ground is queried.'''
+
+    def __init__(self, app, width=128, depth=128, max_height=100.0, height_map_path="height_map", scale=1.0,
+                 patch_size=32, map_offset=(0, 0)):
+        self.app = app
+        self.max_height = max_height
+        self.scale = scale
+        self.half_scale: float = self.scale / 2
+        self.patch_size = patch_size
+        # Same region and size limit as Terrain
+        heights, self.height_map_w, self.height_map_d = self.load_height_map(height_map_path, width, depth,
+                                                                             map_offset)
+        self.half_width = math.floor(self.height_map_w / 2 * self.scale)
+        self.half_depth = math.floor(self.height_map_d / 2 * self.scale)
+        self.base_height = round(float(heights[self.half_depth][self.half_width]) * self.max_height, 6) + 1
+        # Indexed [z][x] like Terrain.lookup_height, so the texture x is the second index
+        self.tex_id = app.texture.get_height_texture(f'height_map:{height_map_path}', heights)
+        # World position of the first sample, Terrain puts sample x at x * scale + half_scale - half_width * scale
+        self.origin = (self.half_scale - self.half_width * self.scale, self.half_scale - self.half_depth * self.scale)
+        # Region of the height map to read again for the query
+        self.height_map_path = height_map_path
+        self.map_offset = map_offset
+        self.height_query = None
+
+    @property
+    def query(self):
+        '''Ground height and ray queries on the heights as the shader reads them, built on first use. It keeps the
+        heights and a quadtree of them in memory, which grow with the map, so the GPU path only pays for them when
+        the ground is queried.'''
+        if self.height_query is None:
+            heights, _, _ = self.load_height_map(self.height_map_path, self.height_map_w, self.height_map_d,
+                                                 self.map_offset)
+            self.height_query = HeightQuery(heights * self.max_height - self.base_height, self.origin, self.scale)
+        return self.height_query
+
+    def load_height_map(self, height_map_path, width, depth, offset):
+        '''Heights from 0 to 1 of the region, see read_height_map. A name without an extension is a .png image.'''
+        path = f'{self.app.base_path}/{self.app.texture_path}/{height_map_path}'
+        if not os.path.splitext(height_map_path)[1]:
+            path += '.png'
+        return read_height_map(self.app.texture, path, width, depth, offset)
+
+    def get_patch_vertices(self):
+        '''Grid of (patch_size + 1)^2 sample offsets and the triangles of its cells, wound like Terrain.'''
+        size = self.patch_size
+        x, z = numpy.meshgrid(numpy.arange(size + 1), numpy.arange(size + 1))
+        vertices = numpy.stack([x.ravel(), z.ravel()], axis=1).astype('f4')
+        cell_x, cell_z = numpy.meshgrid(numpy.arange(size), numpy.arange(size))
+        a = (cell_z * (size + 1) + cell_x).ravel()
+        b, c, d = a + 1, a + size + 2, a + size + 1
+        indices = numpy.stack([d, b, a, d, c, b], axis=1).astype('i4')
+        return vertices, indices
+
+    def get_patch_origins(self):
+        '''First sample of each patch instance, the last row and column of patches may reach past the map.'''
+        cells_x = self.height_map_w - 1
+        cells_z = self.height_map_d - 1
+        x, z = numpy.meshgrid(numpy.arange(0, cells_x, self.patch_size), numpy.arange(0, cells_z, self.patch_size))
+        return numpy.stack([x.ravel(), z.ravel()], axis=1).astype('f4')
+
+
+class GroundGPU():
+    '''Ground drawn from HeightMapTerrain: one flat grid patch instanced over the map, with the height and normal of
+    each vertex read from the height map texture in the vertex shader. Uses the same fragment shader as Ground.'''
+
+    def __init__(self, app, position=(0, 0, 0), texture: str = 'dirt',
+                 terrain: HeightMapTerrain = None, shader_name='ground_gpu', fragment_shader_name='ground',
+                 albedo=(1.0, 1.0, 1.0), diffuse=0.6, specular=0.3, ao: float = 1.0):
+        self.app = app
+        self.ctx = app.ctx
+        self.position = glm.mat4(glm.translate(glm.mat4(1), glm.vec3(position)))
+        self.albedo = 0.06 * glm.vec3(albedo)  # Ambient (Albedo)
+        self.diffuse = diffuse * glm.vec3(albedo)  # Diffuse (Lambert)
+        self.specular = specular * glm.vec3(albedo)  # Specular (Blinn-Phong)
+        self.ao = ao
+        self.terrain = terrain
+        vertices, indices = terrain.get_patch_vertices()
+        self.vbo = self.ctx.buffer(vertices)
+        self.ibo = self.ctx.buffer(indices)
+        self.instance_vbo = self.ctx.buffer(terrain.get_patch_origins())
+        self.shader_program = self.get_shader_program(shader_name, fragment_shader_name)
+        self.vao = self.get_vao()
+        self.tex_id = app.texture.get_alpha_texture(path=f'textures/{texture}.png')
+        self.on_init()
+
+    def on_init(self):
+        # Texture
+        self.shader_program['u_texture_0'] = self.tex_id
+        self.shader_program['u_height_map'] = self.terrain.tex_id
+        # Height map placement
+        self.shader_program['max_height'].value = self.terrain.max_height
+        self.shader_program['base_height'].value = self.terrain.base_height
+        self.shader_program['scale'].value = self.terrain.scale
+        self.shader_program['origin'].value = self.terrain.origin
+        # n lights
+        self.shader_program['num_lights'].value = len(self.app.lights)
+        # Send lights into uniform array of Light struct
+        for i, light in enumerate(self.app.lights):
+            self.shader_program[f'lights[{i}].position'].value = light.position
+            self.shader_program[f'lights[{i}].color'].value = light.color
+            self.shader_program[f'lights[{i}].strength'].value = light.strength
+        # Global light
+        self.shader_program['global_light.color'].value = self.app.global_light.color
+        # Position
+        self.shader_program['m_proj'].write(self.app.camera.m_proj)
+        self.shader_program['m_view'].write(self.app.camera.m_view)
+        self.shader_program['m_model'].write(self.position)
+        # Material: Albedo (rgb)
+        self.shader_program['material.Ka'].value = self.albedo
+        self.shader_program['material.Kd'].value = self.diffuse
+        self.shader_program['material.Ks'].value = self.specular
+        self.shader_program['material.Kao'].value = self.ao
+
+    def update(self):
+        self.shader_program['m_view'].write(self.app.camera.m_view)
+
+    def render(self):
+        self.app.texture.textures[self.terrain.tex_id].use(location=self.terrain.tex_id)
+        self.app.texture.textures[self.tex_id].use(location=self.tex_id)
+        self.vao.render(moderngl.TRIANGLES, instances=self.instance_vbo.size // 8)
+
+    def destroy(self):
+        self.vbo.release()
+        self.ibo.release()
+        self.instance_vbo.release()
+        self.shader_program.release()
+        self.vao.release()
+
+    def get_vao(self):
+        vao = self.ctx.vertex_array(self.shader_program, [
+            (self.vbo, '2f', 'in_grid'),
+            (self.instance_vbo, '2f/i', 'in_patch'),
+        ], index_buffer=self.ibo, index_element_size=4)
+        return vao
+
+    def get_shader_program(self, shader_name='ground_gpu', fragment_shader_name='ground'):
+        with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.vert', 'r') as f:
+            vertex_shader_source = f.read()
+        with open(f'{self.app.base_path}/{self.app.shader_path}/{fragment_shader_name}.frag', 'r') as f:
+            fragment_shader_source = f.read()
+        shader_program = self.ctx.program(
+            vertex_shader=vertex_shader_source,
+            fragment_shader=fragment_shader_source
+        )
+        return shader_program
 
 
 class Ground():
     def __init__(self, app, position=(0, 0, 0), texture: str = 'dirt',
                  terrain: Terrain = None, shader_name='ground',
-                 albedo=(1.0, 1.0, 1.0), diffuse=0.6, specular=0.3, ao: float = 1.0):
+                 albedo=(1.0, 1.0, 1.0), diffuse=0.6, specular=0.3, ao: float = 1.0, vertex_format='f4'):
         self.app = app
         self.ctx = app.ctx
         self.position = glm.mat4(glm.translate(glm.mat4(1), glm.vec3(position)))
@@ -149,6 +416,7 @@ class Ground():
         self.specular = specular * glm.vec3(albedo)  # Specular (Blinn-Phong)
         self.ao = ao
         self.terrain = terrain
+        self.vertex_format = vertex_format
         self.vbo = self.get_vbo()
         self.shader_program = self.get_shader_program(shader_name)
         self.vao = self.get_vao()
@@ -178,6 +446,14 @@ class Ground():
         self.shader_program['material.Kd'].value = self.diffuse
         self.shader_program['material.Ks'].value = self.specular
         self.shader_program['material.Kao'].value = self.ao
+        # Bounds of the packed positions
+        if self.vertex_format != 'f4':
+            self.shader_program['position_origin'].value = self.position_origin
+        if self.vertex_format == 'i2':
+            self.shader_program['position_extent'].value = self.position_extent
+        # Cell size to find the cell of a vertex for the texture coordinate hash
+        if self.terrain.hash_texcoords:
+            self.shader_program['scale'].value = self.terrain.scale
         # self.shader_program['camPos'].write = self.app.camera.position
         # Set point size
         # self.ctx.point_size = 4
@@ -198,16 +474,28 @@ class Ground():
 
     def get_vao(self):
         vao = self.ctx.vertex_array(self.shader_program, [
-            (self.vbo, '2f 3f 3f', 'in_texcoord_0', 'in_position', 'in_normal'),
+            (self.vbo, *get_ground_layout(self.vertex_format, not self.terrain.hash_texcoords)),
         ])
         return vao
 
     def get_vbo(self):
-        return self.ctx.buffer(self.terrain.vertex_data)
+        # Filled by Terrain.stream, packed in the bounds of any height the brushes can reach so every slab and
+        # edited cell fits the same origin and extent
+        self.position_origin, self.position_extent = self.terrain.get_bounds()
+        dtype = get_ground_dtype(self.vertex_format, not self.terrain.hash_texcoords)
+        return self.ctx.buffer(reserve=self.terrain.vertex_count * dtype.itemsize)
+
+    def write_cells(self, cells: tuple, vertex_data: numpy.ndarray, points: numpy.ndarray):
+        '''Write the vertices of a block of cells built by Terrain into the vertex buffer.'''
+        vertex_data, _, _ = pack_ground(vertex_data.reshape(-1, vertex_data.shape[-1]), self.vertex_format,
+                                        (self.position_origin, self.position_extent))
+        # Six vertices per cell
+        self.terrain.write_cell_rows(self.vbo, cells, vertex_data, 6)
 
     def get_shader_program(self, shader_name='default'):
         with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.vert', 'r') as f:
-            vertex_shader_source = f.read()
+            defines = ('HASH_TEXCOORDS',) if self.terrain.hash_texcoords else ()
+            vertex_shader_source = add_defines(f.read(), self.vertex_format, *defines)
         with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.frag', 'r') as f:
             fragment_shader_source = f.read()
         shader_program = self.ctx.program(
@@ -223,7 +511,7 @@ class Ground():
 class Grass:
     def __init__(self, app, position=(0, 0, 0), texture: str = 'grass',
                  terrain: Terrain = None, shader_name='flora',
-                 albedo=(1.0, 1.0, 1.0), diffuse=0.3, specular=0.5, ao: float = 1.0):
+                 albedo=(1.0, 1.0, 1.0), diffuse=0.3, specular=0.5, ao: float = 1.0, vertex_format='f4'):
         self.app = app
         self.ctx = app.ctx
         self.position = glm.mat4(glm.translate(glm.mat4(1), glm.vec3(position)))
@@ -232,6 +520,7 @@ class Grass:
         self.specular = specular * glm.vec3(albedo)
         self.ao = ao
         self.terrain = terrain
+        self.vertex_format = vertex_format
         self.vbo = self.get_vbo()
         self.shader_program = self.get_shader_program(shader_name)
         self.vao = self.get_vao()
@@ -266,6 +555,11 @@ class Grass:
         self.shader_program['material.Kd'].value = self.diffuse
         self.shader_program['material.Ks'].value = self.specular
         self.shader_program['material.Kao'].value = self.ao
+        # Bounds of the packed positions
+        if self.vertex_format != 'f4':
+            self.shader_program['position_origin'].value = self.position_origin
+        if self.vertex_format == 'i2':
+            self.shader_program['position_extent'].value = self.position_extent
         # Set point size
         self.ctx.point_size = 4
 
@@ -288,16 +582,24 @@ class Grass:
 
     def get_vao(self):
         vao = self.ctx.vertex_array(self.shader_program, [
-            (self.vbo, '3f', 'in_position'),
+            (self.vbo, point_layouts[self.vertex_format], 'in_position'),
         ])
         return vao
 
     def get_vbo(self):
-        return self.ctx.buffer(self.terrain.vertices_mesh)
+        # Filled by Terrain.stream, in the same bounds as the ground
+        self.position_origin, self.position_extent = self.terrain.get_bounds()
+        return self.ctx.buffer(reserve=self.terrain.point_count * point_dtypes[self.vertex_format].itemsize)
+
+    def write_cells(self, cells: tuple, vertex_data: numpy.ndarray, points: numpy.ndarray):
+        '''Write the grass points of a block of cells built by Terrain into the vertex buffer.'''
+        points, _, _ = pack_points(points, self.vertex_format, (self.position_origin, self.position_extent))
+        # Two triangles of points per cell
+        self.terrain.write_cell_rows(self.vbo, cells, points, 2 * len(self.terrain.grass_weights))
 
     def get_shader_program(self, shader_name='default'):
         with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.vert', 'r') as f:
-            vertex_shader_source = f.read()
+            vertex_shader_source = add_defines(f.read(), self.vertex_format)
         with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.frag', 'r') as f:
             fragment_shader_source = f.read()
         with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.geom', 'r') as f:
@@ -1,6 +1,16 @@
 #version 460 core
 
+// The vertex format define is added by the Python side, see vertex_formats.py
+#if defined(VERTEX_FORMAT_F2)
+layout (location = 0) in vec4 in_position; // Half float from position_origin
+#elif defined(VERTEX_FORMAT_I2)
+layout (location = 0) in ivec4 in_position; // snorm16 in the bounds from position_origin to position_extent
+#else
 layout (location = 0) in vec3 in_position;
+#endif
+
+uniform vec3 position_origin;
+uniform vec3 position_extent;
 
 // uniform mat4 m_proj;
 // uniform mat4 m_view;
@@ -9,5 +19,17 @@ layout (location = 0) in vec3 in_position;
 void main() {
     // Not using m_proj, m_view, m_model but passing into Geometry Shader
     // gl_Position = m_proj * m_view * m_model * vec4(in_position, 1.0);
+#if defined(VERTEX_FORMAT_F2)
+    gl_Position = vec4(position_origin + in_position.xyz, 1.0);
+#elif defined(VERTEX_FORMAT_I2)
+    gl_Position = vec4(position_origin + max(vec3(in_position.xyz) / 32767.0, -1.0) * position_extent, 1.0);
+#else
     gl_Position = vec4(in_position, 1.0);
+#endif
+    // Points of steep or removed triangles, see hidden_y in vertex_formats.py; w = 0 tells the geometry shader
+#if defined(VERTEX_FORMAT_I2)
+    if (in_position.y == -32768) gl_Position.w = 0.0;
+#else
+    if (in_position.y == -65504.0) gl_Position.w = 0.0;
+#endif
 }
\ No newline at end of file
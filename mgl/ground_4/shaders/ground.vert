@@ -1,8 +1,24 @@
 #version 460 core
 
+// The vertex format defines are added by the Python side, see vertex_formats.py
+// With HASH_TEXCOORDS there are no texture coordinates, they are rotated per cell from a hash in the shader
+#if !defined(HASH_TEXCOORDS)
+#if defined(VERTEX_FORMAT_F2) || defined(VERTEX_FORMAT_I2)
+layout (location = 0) in uvec2 in_texcoord_0; // unorm16
+#else
 layout (location = 0) in vec3 in_texcoord_0;
+#endif
+#endif
+#if defined(VERTEX_FORMAT_F2)
+layout (location = 1) in vec4 in_position; // Half float from position_origin
+layout (location = 2) in ivec2 in_normal; // Octahedral snorm16
+#elif defined(VERTEX_FORMAT_I2)
+layout (location = 1) in ivec4 in_position; // snorm16 in the bounds from position_origin to position_extent
+layout (location = 2) in uint in_normal; // 10_10_10_2
+#else
 layout (location = 1) in vec3 in_position;
 layout (location = 2) in vec3 in_normal;
+#endif
 
 out vec2 uv_0;
 out vec3 fragPos;
@@ -12,19 +28,91 @@ out vec3 normal;
 uniform mat4 m_proj;
 uniform mat4 m_view;
 uniform mat4 m_model;
+uniform vec3 position_origin;
+uniform vec3 position_extent;
+uniform float scale = 1.0;
 
+vec2 getTexcoord(vec3 position);
+vec3 getPosition();
+vec3 getNormal();
 float random(vec2 st);
 float noise(in vec2 st);
 float fbm(in vec2 _st);
 
 void main() {
-    uv_0 = in_texcoord_0.xy;
-    normal = mat3(transpose(inverse(m_model))) * in_normal;
-    fragPos = vec3(m_model * vec4(in_position, 1.0));
-    colorVariation = fbm(in_position.xz);
-    gl_Position = m_proj * m_view * m_model * vec4(in_position, 1.0);
+    const vec3 position = getPosition();
+    uv_0 = getTexcoord(position);
+    normal = mat3(transpose(inverse(m_model))) * getNormal();
+    fragPos = vec3(m_model * vec4(position, 1.0));
+    colorVariation = fbm(position.xz);
+    gl_Position = m_proj * m_view * m_model * vec4(position, 1.0);
 }
 
+#if defined(HASH_TEXCOORDS)
+// Each cell is two triangles of vertices v1, v3, v4 and v1, v2, v3, where v1 to v4 go around the cell from -x +z
+const int cell_corners[6] = int[6](0, 2, 3, 0, 1, 2);
+const vec2 corner_signs[4] = vec2[4](vec2(-1.0, 1.0), vec2(1.0, 1.0), vec2(1.0, -1.0), vec2(-1.0, -1.0));
+// Texture coordinates of v1 to v4 without rotation, a rotation of r starts r places along
+const vec2 corner_texcoords[4] = vec2[4](vec2(0.0, 0.0), vec2(1.0, 0.0), vec2(1.0, 1.0), vec2(0.0, 1.0));
+
+uint hashCell(ivec2 cell) {
+    uint h = uint(cell.x) * 73856093u ^ uint(cell.y) * 19349663u;
+    h ^= h >> 13;
+    h *= 0x5bd1e995u;
+    h ^= h >> 15;
+    return h;
+}
+
+vec2 getTexcoord(vec3 position) {
+    // The same four rotations as Texture.random_quad, picked by a hash of the cell so they never change
+    const int corner = cell_corners[gl_VertexID % 6];
+    const vec2 centre = position.xz - corner_signs[corner] * scale * 0.5;
+    const int rotation = int(hashCell(ivec2(round(centre / scale))) & 3u);
+    return corner_texcoords[(corner + rotation) % 4];
+}
+#elif defined(VERTEX_FORMAT_F2) || defined(VERTEX_FORMAT_I2)
+vec2 getTexcoord(vec3 position) {
+    return vec2(in_texcoord_0) / 65535.0;
+}
+#else
+vec2 getTexcoord(vec3 position) {
+    return in_texcoord_0.xy;
+}
+#endif
+
+#if defined(VERTEX_FORMAT_F2)
+vec3 getPosition() {
+    return position_origin + in_position.xyz;
+}
+
+vec3 getNormal() {
+    // Unfold the octahedron around Y
+    const vec2 e = max(vec2(in_normal) / 32767.0, -1.0);
+    vec3 n = vec3(e.x, 1.0 - abs(e.x) - abs(e.y), e.y);
+    if (n.y < 0.0) {
+        n.xz = (1.0 - abs(n.zx)) * vec2(n.x >= 0.0 ? 1.0 : -1.0, n.z >= 0.0 ? 1.0 : -1.0);
+    }
+    return normalize(n);
+}
+#elif defined(VERTEX_FORMAT_I2)
+vec3 getPosition() {
+    return position_origin + max(vec3(in_position.xyz) / 32767.0, -1.0) * position_extent;
+}
+
+vec3 getNormal() {
+    const uvec3 bits = uvec3(in_normal, in_normal >> 10, in_normal >> 20) & 1023u;
+    return normalize(vec3(bits) / 1023.0 * 2.0 - 1.0);
+}
+#else
+vec3 getPosition() {
+    return in_position;
+}
+
+vec3 getNormal() {
+    return in_normal;
+}
+#endif
+
 float random(vec2 st) {
     return fract(sin(dot(st.xy, vec2(12.9898, 78.233))) * 43758.5453123);
 }
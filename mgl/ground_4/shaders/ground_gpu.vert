@@ -0,0 +1,84 @@
+#version 460 core
+
+// Vertex of the shared flat grid patch, in height map samples
+layout (location = 0) in vec2 in_grid;
+// Per instance: first sample of the patch
+layout (location = 1) in vec2 in_patch;
+
+out vec2 uv_0;
+out vec3 fragPos;
+out float colorVariation;
+out vec3 normal;
+
+uniform mat4 m_proj;
+uniform mat4 m_view;
+uniform mat4 m_model;
+
+uniform sampler2D u_height_map;
+uniform float max_height;
+uniform float base_height;
+uniform float scale;
+// World position of the first sample
+uniform vec2 origin;
+
+float random(vec2 st);
+float noise(in vec2 st);
+float fbm(in vec2 _st);
+
+float height(ivec2 sample_position) {
+    // Clamped so the patches past the last sample fold onto the edge
+    sample_position = clamp(sample_position, ivec2(0), textureSize(u_height_map, 0) - 1);
+    return texelFetch(u_height_map, sample_position, 0).r * max_height - base_height;
+}
+
+void main() {
+    ivec2 sample_position = min(ivec2(in_patch + in_grid), textureSize(u_height_map, 0) - 1);
+    vec3 position = vec3(origin.x + sample_position.x * scale, height(sample_position),
+                         origin.y + sample_position.y * scale);
+    // Normal from the central differences of the neighbouring samples
+    float left = height(sample_position - ivec2(1, 0));
+    float right = height(sample_position + ivec2(1, 0));
+    float back = height(sample_position - ivec2(0, 1));
+    float front = height(sample_position + ivec2(0, 1));
+    vec3 local_normal = normalize(vec3(left - right, 2.0 * scale, back - front));
+
+    uv_0 = vec2(sample_position);
+    normal = mat3(transpose(inverse(m_model))) * local_normal;
+    fragPos = vec3(m_model * vec4(position, 1.0));
+    colorVariation = fbm(position.xz);
+    gl_Position = m_proj * m_view * m_model * vec4(position, 1.0);
+}
+
+float random(vec2 st) {
+    return fract(sin(dot(st.xy, vec2(12.9898, 78.233))) * 43758.5453123);
+}
+
+float noise(in vec2 st) {
+    const vec2 i = floor(st);
+    const vec2 f = fract(st);
+	// Four corners in 2D of a tile
+    const float a = random(i);
+    const float b = random(i + vec2(1.0, 0.0));
+    const float c = random(i + vec2(0.0, 1.0));
+    const float d = random(i + vec2(1.0, 1.0));
+	// Smooth Interpolation
+    const vec2 u = smoothstep(0., 1., f);
+	// Mix 4 percentages
+    return mix(a, b, u.x) + (c - a) * u.y * (1.0 - u.x) + (d - b) * u.x * u.y;
+}
+
+const vec2 fbm_shift = vec2(100.0);
+const mat2 fbm_rot = mat2(cos(0.5), sin(0.5), -sin(0.5), cos(0.50));
+const int num_octaves = 4;
+float fbm(in vec2 _st) {
+	// Craete variation with Fractal Brownian Motion, which we use to vary the color of the grass
+	// Returns a value between 0 and 1
+    float v = 0.0;
+    float a = 0.5;
+    for (int i = 0; i < num_octaves; ++i) {
+        v += a * noise(_st);
+        _st = fbm_rot * _st * 2.0 + fbm_shift;
+        a *= 0.5;
+    }
+    return v;
+}
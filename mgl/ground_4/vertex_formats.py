@@ -0,0 +1,157 @@
+import numpy
+
+# Vertex formats of the ground mesh (texture coordinates, position, normal) and the grass points
+#   f4: 32-bit floats, as built by Terrain
+#   f2: half float positions from the mesh centre, octahedral normals in 2 x snorm16, unorm16 texture coordinates
+#   i2: snorm16 positions in the mesh bounds, normals in 10_10_10_2, unorm16 texture coordinates
+# The shaders decode the packed formats, picked with a define added after the #version line
+vertex_formats = ('f4', 'f2', 'i2')
+# Raw y of the grass points hidden by NaN rows, e.g. on steep triangles, which the flora shader drops
+hidden_y = {
+    'f4': -65504.0,
+    'f2': -65504.0,
+    'i2': -32768,
+}
+
+ground_dtypes = {
+    'f4': numpy.dtype([('texcoord', '<f4', 2), ('position', '<f4', 3), ('normal', '<f4', 3)]),
+    'f2': numpy.dtype([('texcoord', '<u2', 2), ('position', '<f2', 4), ('normal', '<i2', 2)]),
+    'i2': numpy.dtype([('texcoord', '<u2', 2), ('position', '<i2', 4), ('normal', '<u4')]),
+}
+ground_layouts = {
+    'f4': '2f 3f 3f',
+    'f2': '2u2 4f2 2i2',
+    'i2': '2u2 4i2 u4',
+}
+point_dtypes = {
+    'f4': numpy.dtype([('position', '<f4', 3)]),
+    'f2': numpy.dtype([('position', '<f2', 4)]),
+    'i2': numpy.dtype([('position', '<i2', 4)]),
+}
+point_layouts = {
+    'f4': '3f',
+    'f2': '4f2',
+    'i2': '4i2',
+}
+
+
+def encode_unorm16(values: numpy.ndarray) -> numpy.ndarray:
+    return numpy.round(numpy.clip(values, 0.0, 1.0) * 65535).astype('<u2')
+
+
+def encode_snorm16(values: numpy.ndarray) -> numpy.ndarray:
+    return numpy.round(numpy.clip(values, -1.0, 1.0) * 32767).astype('<i2')
+
+
+def sign_not_zero(values: numpy.ndarray) -> numpy.ndarray:
+    return numpy.where(values >= 0.0, 1.0, -1.0)
+
+
+def encode_octahedral(normals: numpy.ndarray) -> numpy.ndarray:
+    '''Map unit normals onto the octahedron folded around Y, so the upward normals of the ground keep the most
+    precision, and store the x and z of the fold in snorm16.'''
+    normals = normals / numpy.abs(normals).sum(axis=1, keepdims=True)
+    encoded = normals[:, [0, 2]]
+    lower = normals[:, 1] < 0.0
+    encoded[lower] = (1.0 - numpy.abs(encoded[lower][:, ::-1])) * sign_not_zero(encoded[lower])
+    return encode_snorm16(encoded)
+
+
+def pack_10_10_10_2(normals: numpy.ndarray) -> numpy.ndarray:
+    '''Store unit normals as 10 bits per axis in one uint32, from -1 to 1 as 0 to 1023, the top 2 bits unused.'''
+    values = numpy.round((numpy.clip(normals, -1.0, 1.0) * 0.5 + 0.5) * 1023).astype('<u4')
+    return values[:, 0] | (values[:, 1] << 10) | (values[:, 2] << 20)
+
+
+def get_bounds(positions: numpy.ndarray) -> tuple:
+    '''Centre and half size of the positions, the origin and extent uniforms of the packed formats.'''
+    low = numpy.nanmin(positions, axis=0)
+    high = numpy.nanmax(positions, axis=0)
+    origin = (low + high) / 2
+    extent = numpy.maximum((high - low) / 2, 1e-6)
+    return tuple(float(v) for v in origin), tuple(float(v) for v in extent)
+
+
+def pack_positions(positions: numpy.ndarray, vertex_format: str, origin: tuple, extent: tuple) -> numpy.ndarray:
+    if vertex_format == 'f4':
+        return positions.astype('<f4', copy=False)
+    packed = numpy.zeros((len(positions), 4), dtype=point_dtypes[vertex_format]['position'].base)
+    # One axis at a time in float32, numpy is slow over rows of 3 values and float64 bounds would widen the array
+    for axis in range(3):
+        offsets = positions[:, axis] - numpy.float32(origin[axis])
+        if vertex_format == 'f2':
+            packed[:, axis] = offsets
+        else:
+            packed[:, axis] = encode_snorm16(offsets / numpy.float32(extent[axis]))
+    return packed
+
+
+def get_ground_dtype(vertex_format: str, texcoords: bool = True) -> numpy.dtype:
+    dtype = ground_dtypes[vertex_format]
+    return dtype if texcoords else numpy.dtype([field for field in dtype.descr if field[0] != 'texcoord'])
+
+
+def get_ground_layout(vertex_format: str, texcoords: bool = True) -> tuple:
+    '''Buffer format and attribute names of the ground, without the texture coordinates when they are hashed.'''
+    if texcoords:
+        return ground_layouts[vertex_format], 'in_texcoord_0', 'in_position', 'in_normal'
+    return ground_layouts[vertex_format].split(' ', 1)[1], 'in_position', 'in_normal'
+
+
+def pack_ground(vertex_data: numpy.ndarray, vertex_format: str, bounds: tuple = None) -> tuple:
+    '''Pack the interleaved texcoord, position and normal floats built by Terrain.
+    Args:
+        vertex_data (numpy.ndarray): float rows of 2 texture coordinates, 3 position and 3 normal values, or only
+            the position and normal
+        vertex_format (str): One of vertex_formats
+        bounds (tuple): Origin and extent to pack with, as from get_bounds, for parts of a buffer packed earlier
+    Returns:
+        tuple: Packed structured array, origin and extent of the positions
+    '''
+    texcoords = vertex_data.shape[1] == 8
+    positions, normals = vertex_data[:, -6:-3], vertex_data[:, -3:]
+    origin, extent = bounds or get_bounds(positions)
+    packed = numpy.empty(len(vertex_data), dtype=get_ground_dtype(vertex_format, texcoords))
+    packed['position'] = pack_positions(positions, vertex_format, origin, extent)
+    if vertex_format == 'f4':
+        packed['normal'] = normals
+    else:
+        packed['normal'] = encode_octahedral(normals) if vertex_format == 'f2' else pack_10_10_10_2(normals)
+    if texcoords:
+        packed['texcoord'] = vertex_data[:, 0:2] if vertex_format == 'f4' else encode_unorm16(vertex_data[:, 0:2])
+    return packed, origin, extent
+
+
+def pack_points(points: numpy.ndarray, vertex_format: str, bounds: tuple = None) -> tuple:
+    '''Pack grass points, the NaN points are stored with hidden_y.
+    Returns:
+        tuple: Packed structured array, origin and extent of the points
+    '''
+    points = points.reshape(-1, 3)
+    origin, extent = bounds or get_bounds(points)
+    hidden = numpy.isnan(points[:, 1])
+    if hidden.any():
+        points = numpy.where(hidden[:, None], numpy.float32(0.0), points)
+    packed = numpy.empty(len(points), dtype=point_dtypes[vertex_format])
+    packed['position'] = pack_positions(points, vertex_format, origin, extent)
+    packed['position'][hidden, 1] = hidden_y[vertex_format]
+    return packed, origin, extent
+
+
+def add_defines(source: str, vertex_format: str, *defines: str) -> str:
+    '''Insert the define of the vertex format and any other defines after the #version line of a shader.'''
+    version, _, rest = source.partition('\n')
+    lines = ''.join(f'#define {define}\n' for define in (f'VERTEX_FORMAT_{vertex_format.upper()}', *defines))
+    return f'{version}\n{lines}{rest}'
+
+
+def get_format_report(ground_vertices: int, points: int, texcoords: bool = True) -> list:
+    '''Bytes per vertex and buffer size of every format, for the ground and grass counts given.'''
+    lines = []
+    for vertex_format in vertex_formats:
+        ground_size = get_ground_dtype(vertex_format, texcoords).itemsize
+        point_size = point_dtypes[vertex_format].itemsize
+        total = ground_size * ground_vertices + point_size * points
+        lines.append(f"vertex format {vertex_format}: ground {ground_size} bytes/vertex, grass {point_size} "
+                     f"bytes/point, {total / 1024 ** 2:.2f} MB for {ground_vertices} vertices and {points} points")
+    return lines
@@ -1,5 +1,8 @@
+import hashlib
+import os
 import moderngl
 import glm
+import numpy
 import pygame
 
 
@@ -107,12 +110,36 @@ class Shader():
         self.programs = []
         self.programs_count = -1
         self.programs_map = {}
+        # Hot reload state: geometry flag and source modified times per program, and objects using each program
+        self.geometry = {}
+        self.mtimes = {}
+        self.users = {}
+
+    def get_paths(self, shader_name, geometry=False):
+        extensions = ['vert', 'frag', 'geom'] if geometry else ['vert', 'frag']
+        return [f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.{ext}' for ext in extensions]
+
+    def get_mtimes(self, shader_name, geometry=False):
+        '''Modified time of each source file, None for a file missing while an editor saves it.'''
+        return [os.path.getmtime(path) if os.path.isfile(path) else None
+                for path in self.get_paths(shader_name, geometry)]
 
     def get_shader(self, shader_name, geometry=False):
         if shader_name in self.programs_map:
             # print(f"Reuse shader: {shader_name} at index: {self.programs_map[shader_name]}")
             return self.programs[self.programs_map[shader_name]]
 
+        shader_program = self.compile(shader_name, geometry)
+        self.programs_count += 1
+        self.programs_map[shader_name] = self.programs_count
+        self.programs.append(shader_program)
+        self.geometry[shader_name] = geometry
+        self.mtimes[shader_name] = self.get_mtimes(shader_name, geometry)
+        self.users[shader_name] = []
+        print(f"loaded shader: {shader_name} at index: {self.programs_count}")
+        return shader_program
+
+    def compile(self, shader_name, geometry=False):
         with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.vert', 'r') as f:
             vertex_shader_source = f.read()
         with open(f'{self.app.base_path}/{self.app.shader_path}/{shader_name}.frag', 'r') as f:
@@ -131,17 +158,58 @@ class Shader():
                 vertex_shader=vertex_shader_source,
                 fragment_shader=fragment_shader_source,
             )
-        self.programs_count += 1
-        self.programs_map[shader_name] = self.programs_count
-        self.programs.append(shader_program)
-        print(f"loaded shader: {shader_name} at index: {self.programs_count}")
         return shader_program
 
+    def add_user(self, shader_name, obj):
+        '''Register an object to be given the new program on reload, via obj.on_shader_reload(shader_name, program).'''
+        self.users[shader_name].append(obj)
+
+    def check_reload(self):
+        '''Reload every program whose source files changed on disk.'''
+        for shader_name in self.programs_map:
+            mtimes = self.get_mtimes(shader_name, self.geometry[shader_name])
+            # Wait for every source to be back before reloading
+            if None not in mtimes and mtimes != self.mtimes[shader_name]:
+                self.mtimes[shader_name] = mtimes
+                self.reload(shader_name)
+
+    def reload(self, shader_name):
+        '''Recompile one program, replay its uniform values and swap it into the objects using it.'''
+        index = self.programs_map[shader_name]
+        old_program = self.programs[index]
+        try:
+            new_program = self.compile(shader_name, self.geometry[shader_name])
+        except (moderngl.Error, OSError) as error:
+            # Keep the old program running until the source compiles again
+            print(f"failed to reload shader: {shader_name}\n{error}")
+            return
+        copy_uniforms(old_program, new_program)
+        self.programs[index] = new_program
+        for obj in self.users[shader_name]:
+            obj.on_shader_reload(shader_name, new_program)
+        old_program.release()
+        print(f"reloaded shader: {shader_name} at index: {index}")
+
     def destroy(self):
         for program in self.programs:
             program.release()
 
 
+def copy_uniforms(old_program, new_program):
+    '''Copy the last-known uniform values, sampler bindings included, into a recompiled program.'''
+    for name in old_program:
+        old_member = old_program[name]
+        if not isinstance(old_member, moderngl.Uniform) or name not in new_program:
+            continue
+        new_member = new_program[name]
+        if not isinstance(new_member, moderngl.Uniform):
+            continue
+        if (old_member.dimension, old_member.array_length) != (new_member.dimension, new_member.array_length):
+            # The declaration changed, the new default is used until the value is set again
+            continue
+        new_member.value = old_member.value
+
+
 class Texture:
     def __init__(self, app):
         self.app = app
@@ -199,6 +267,63 @@ class Texture:
         print(f"loaded color texture: {name} at index: {self.texture_count}")
         return self.texture_count
 
+    def get_texture_cube(self, path, ext='png'):
+        if path in self.texture_map:
+            return self.texture_map[path]
+        faces = ['right', 'left', 'top', 'bottom'] + ['front', 'back'][::-1]
+        textures = []
+        for face in faces:
+            texture = pygame.image.load(f'{path}/{face}.{ext}').convert()
+            if face in ['right', 'left', 'front', 'back']:
+                texture = pygame.transform.flip(texture, flip_x=True, flip_y=False)
+            else:
+                texture = pygame.transform.flip(texture, flip_x=False, flip_y=True)
+            textures.append(texture)
+        size = textures[0].get_size()
+        texture_cube = self.ctx.texture_cube(size=size, components=3, data=None)
+        for i in range(6):
+            texture_data = pygame.image.tostring(textures[i], 'RGB')
+            texture_cube.write(face=i, data=texture_data)
+        # Add to list
+        self.texture_count += 1
+        self.texture_map[path] = self.texture_count
+        self.textures.append(texture_cube)
+        print(f"loaded texture cube: {path} at index: {self.texture_count}")
+        return self.texture_count
+
+    def get_float_texture_cube(self, faces, name):
+        '''Create a half float cube map from an array of faces shaped (6, size, size, components).'''
+        if name in self.texture_map:
+            return self.texture_map[name]
+        size = (faces.shape[2], faces.shape[1])
+        texture_cube = self.ctx.texture_cube(size=size, components=faces.shape[3], data=None, dtype='f2')
+        for i in range(6):
+            texture_cube.write(face=i, data=numpy.ascontiguousarray(faces[i], dtype='f2').tobytes())
+        texture_cube.filter = (moderngl.LINEAR, moderngl.LINEAR)
+        # Add to list
+        self.texture_count += 1
+        self.texture_map[name] = self.texture_count
+        self.textures.append(texture_cube)
+        print(f"loaded float texture cube: {name} at index: {self.texture_count}")
+        return self.texture_count
+
+    def get_float_texture(self, data, name):
+        '''Create a half float texture from an array shaped (height, width, components).'''
+        if name in self.texture_map:
+            return self.texture_map[name]
+        texture = self.ctx.texture(size=(data.shape[1], data.shape[0]), components=data.shape[2],
+                                   data=numpy.ascontiguousarray(data, dtype='f2').tobytes(), dtype='f2')
+        texture.filter = (moderngl.LINEAR, moderngl.LINEAR)
+        # Remove repetition
+        texture.repeat_x = False
+        texture.repeat_y = False
+        # Add to list
+        self.texture_count += 1
+        self.texture_map[name] = self.texture_count
+        self.textures.append(texture)
+        print(f"loaded float texture: {name} at index: {self.texture_count}")
+        return self.texture_count
+
     def destroy(self):
         for texture in self.textures:
             texture.release()
@@ -220,3 +345,122 @@ class Shadow():
     def destroy(self):
         self.depth_fbo.release()
         self.depth_texture.release()
+
+
+class ImageBasedLighting():
+    '''Precompute image based lighting from a skybox cube map.
+
+    Bakes a diffuse irradiance cube map, a chain of prefiltered specular cube maps (one per roughness level)
+    and the split-sum BRDF lookup table. The results are cached in an .npz file keyed by a hash of the cube map
+    faces and the bake settings, so the convolution runs once and later startups only upload the baked data.
+    '''
+    faces = ['right', 'left', 'top', 'bottom'] + ['front', 'back'][::-1]
+    irradiance_size = 32
+    irradiance_sample_delta = 0.025
+    prefilter_size = 128
+    prefilter_levels = 5  # Must match PREFILTER_LEVELS in default.frag
+    prefilter_sample_count = 1024
+    brdf_lut_size = 512
+    brdf_sample_count = 1024
+    version = 1
+
+    def __init__(self, app, texture_cube_name='skybox', ext='png'):
+        self.app = app
+        self.ctx = app.ctx
+        self.path = f'{self.app.texture_path}/{texture_cube_name}'
+        self.ext = ext
+        self.env_tex_id = self.app.texture.get_texture_cube(path=self.path, ext=ext)
+        self.cache_file = f'{self.app.base_path}/{self.app.cache_path}/ibl_{self.get_cache_key()}.npz'
+        if os.path.isfile(self.cache_file):
+            baked = self.load_cache()
+            print(f"loaded baked ibl: {self.cache_file}")
+        else:
+            baked = self.bake()
+            self.save_cache(baked)
+            print(f"baked ibl: {self.cache_file}")
+        # Upload the baked data
+        self.irradiance_tex_id = self.app.texture.get_float_texture_cube(baked['irradiance'], name='ibl_irradiance')
+        self.prefilter_tex_ids = []
+        for level in range(self.prefilter_levels):
+            self.prefilter_tex_ids.append(self.app.texture.get_float_texture_cube(
+                baked[f'prefilter_{level}'], name=f'ibl_prefilter_{level}'))
+        self.brdf_lut_tex_id = self.app.texture.get_float_texture(baked['brdf_lut'], name='ibl_brdf_lut')
+
+    def get_cache_key(self):
+        '''Hash the cube map faces and the bake settings.'''
+        digest = hashlib.sha1()
+        for face in self.faces:
+            with open(f'{self.app.base_path}/{self.path}/{face}.{self.ext}', 'rb') as f:
+                digest.update(f.read())
+        settings = (self.irradiance_size, self.irradiance_sample_delta, self.prefilter_size, self.prefilter_levels,
+                    self.prefilter_sample_count, self.brdf_lut_size, self.brdf_sample_count, self.version)
+        digest.update(repr(settings).encode())
+        return digest.hexdigest()
+
+    def load_cache(self):
+        with numpy.load(self.cache_file) as data:
+            return {key: data[key] for key in data.files}
+
+    def save_cache(self, baked):
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        numpy.savez(self.cache_file, **baked)
+
+    def bake(self):
+        # Full screen triangle used by every bake pass
+        vbo = self.ctx.buffer(numpy.array([(-1, -1), (3, -1), (-1, 3)], dtype='f4'))
+        # Blending and depth testing are not wanted when writing raw values
+        self.ctx.disable(moderngl.BLEND | moderngl.DEPTH_TEST)
+        env_texture = self.app.texture.textures[self.env_tex_id]
+        env_texture.use(location=self.env_tex_id)
+        baked = {}
+        # Diffuse irradiance
+        program = self.app.shader.get_shader('ibl_irradiance')
+        program['u_environment'] = self.env_tex_id
+        program['u_sample_delta'].value = self.irradiance_sample_delta
+        baked['irradiance'] = self.render_cube(program, vbo, self.irradiance_size)
+        # Prefiltered specular, one cube map per roughness level with the size halved each level
+        program = self.app.shader.get_shader('ibl_prefilter')
+        program['u_environment'] = self.env_tex_id
+        program['u_sample_count'].value = self.prefilter_sample_count
+        for level in range(self.prefilter_levels):
+            program['u_roughness'].value = level / (self.prefilter_levels - 1)
+            size = max(self.prefilter_size >> level, 8)
+            baked[f'prefilter_{level}'] = self.render_cube(program, vbo, size)
+        # Split-sum BRDF lookup table
+        program = self.app.shader.get_shader('ibl_brdf')
+        program['u_sample_count'].value = self.brdf_sample_count
+        baked['brdf_lut'] = self.render_face(program, vbo, self.brdf_lut_size)[:, :, :2]
+        # Restore state
+        vbo.release()
+        self.ctx.screen.use()
+        self.ctx.enable(flags=moderngl.DEPTH_TEST | moderngl.CULL_FACE | moderngl.BLEND)
+        return baked
+
+    def render_cube(self, program, vbo, size):
+        faces = []
+        for face in range(6):
+            program['u_face'].value = face
+            faces.append(self.render_face(program, vbo, size)[:, :, :3])
+        return numpy.stack(faces)
+
+    def render_face(self, program, vbo, size):
+        texture = self.ctx.texture((size, size), components=4, dtype='f2')
+        fbo = self.ctx.framebuffer(color_attachments=[texture])
+        vao = self.ctx.vertex_array(program, [(vbo, '2f', 'in_position')])
+        fbo.use()
+        vao.render()
+        data = numpy.frombuffer(fbo.read(components=4, dtype='f2'), dtype='f2').reshape(size, size, 4)
+        vao.release()
+        fbo.release()
+        texture.release()
+        return data.copy()
+
+    def use(self, shader_program):
+        '''Bind the baked textures to a shader program using the ibl uniforms.'''
+        shader_program['u_irradiance_map'] = self.irradiance_tex_id
+        self.app.texture.textures[self.irradiance_tex_id].use(location=self.irradiance_tex_id)
+        for level, tex_id in enumerate(self.prefilter_tex_ids):
+            shader_program[f'u_prefilter_map_{level}'] = tex_id
+            self.app.texture.textures[tex_id].use(location=tex_id)
+        shader_program['u_brdf_lut'] = self.brdf_lut_tex_id
+        self.app.texture.textures[self.brdf_lut_tex_id].use(location=self.brdf_lut_tex_id)
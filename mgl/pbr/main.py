@@ -2,8 +2,8 @@ import pygame
 import moderngl
 import sys
 
-from model import Cube, Floor
-from core import Camera, Light, Shadow, Texture, Shader
+from model import Cube, Floor, SkyBox
+from core import Camera, Light, Shadow, Texture, Shader, ImageBasedLighting
 
 
 class GraphicsEngine:
@@ -14,10 +14,16 @@ class GraphicsEngine:
     target_display = 0
     base_path = '.'
     shader_path = 'shaders'
+    texture_path = 'textures'
+    cache_path = 'cache'
+    # Recompile shaders when their files change, checked every interval in seconds
+    hot_reload = True
+    hot_reload_interval = 0.5
     # Variables
     fps = 0
     time = 0
     delta_time = 0
+    last_reload_check = 0
     # State
     paused = False
     full_polygon = True
@@ -53,6 +59,9 @@ class GraphicsEngine:
         self.texture = Texture(self)
         self.shader = Shader(self)
         self.shadow = Shadow(self)
+        # Image based lighting baked from the skybox, cached on disk after the first run
+        self.ibl = ImageBasedLighting(self, texture_cube_name='skybox')
+        self.skybox = SkyBox(self, texture_cube_name='skybox')
         # Light
         self.light = Light(position=(-5, 2, 5), color=(1.0, 0.0, 0.0), strength=10.0)
         # Light 2
@@ -87,6 +96,7 @@ class GraphicsEngine:
             if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
                 for obj in self.scene:
                     obj.destroy()
+                self.skybox.destroy()
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_F1:
@@ -102,7 +112,13 @@ class GraphicsEngine:
             self.ctx.wireframe = True
 
     def update(self):
+        if self.hot_reload:
+            ticks = pygame.time.get_ticks() * 0.001
+            if ticks - self.last_reload_check > self.hot_reload_interval:
+                self.last_reload_check = ticks
+                self.shader.check_reload()
         self.camera.update()
+        self.skybox.update()
         for obj in self.scene:
             obj.update()
 
@@ -121,6 +137,7 @@ class GraphicsEngine:
         # Render scene
         for obj in self.scene:
             obj.render()
+        self.skybox.render()
 
         # Swap buffers
         pygame.display.flip()
@@ -31,8 +31,21 @@ class Cube:
         self.tex_id = app.texture.get_texture(path=f'textures/{texture}.png')
         self.depth_tex_id = app.shadow.depth_tex_id
         self.m_model = self.position
+        app.shader.add_user('default', self)
+        app.shader.add_user('shadow', self)
         self.on_init()
 
+    def on_shader_reload(self, shader_name, program):
+        # VAOs are bound to a program, so rebuild the ones using the reloaded program
+        if shader_name == 'default':
+            self.vao.release()
+            self.shader_program = program
+            self.vao = self.get_vao()
+        elif shader_name == 'shadow':
+            self.shadow_vao.release()
+            self.shadow_program = program
+            self.shadow_vao = self.get_shadow_vao()
+
     def on_init(self):
         # Set resolution
         self.shader_program['u_resolution'].write(glm.vec2(self.app.win_size))
@@ -57,7 +70,9 @@ class Cube:
         self.shader_program['u_shadow_map'] = self.depth_tex_id
         self.app.texture.textures[self.depth_tex_id].use(location=self.depth_tex_id)
         # Camera
-        self.shader_program['camPos'].write = self.app.camera.position
+        self.shader_program['camPos'].write(self.app.camera.position)
+        # Image based lighting
+        self.app.ibl.use(self.shader_program)
         # Shadow program
         self.shadow_program['m_proj'].write(self.app.camera.m_proj)
         self.shadow_program['m_view_light'].write(self.app.light.m_view_light)
@@ -88,7 +103,9 @@ class Cube:
         self.shader_program['u_shadow_map'] = self.depth_tex_id
         self.app.texture.textures[self.depth_tex_id].use(location=self.depth_tex_id)
         # Camera
-        self.shader_program['camPos'].write = self.app.camera.position
+        self.shader_program['camPos'].write(self.app.camera.position)
+        # Image based lighting
+        self.app.ibl.use(self.shader_program)
         # Texture
         self.shader_program['u_texture_0'] = self.tex_id
         self.app.texture.textures[self.tex_id].use(location=self.tex_id)
@@ -178,3 +195,49 @@ class Floor(Cube):
         # m_model = glm.rotate(self.position, self.app.time, glm.vec3(0, 1, 0))
         self.shader_program['m_view'].write(self.app.camera.m_view)
         # self.shader_program['m_model'].write(m_model)
+
+
+class SkyBox():
+    def __init__(self, app, texture_cube_name='skybox'):
+        self.app = app
+        self.ctx = app.ctx
+        self.tex_id = app.texture.get_texture_cube(path=f'{app.texture_path}/{texture_cube_name}')
+        self.vbo = self.get_vbo()
+        self.shader_program = app.shader.get_shader('skybox')
+        self.vao = self.get_vao()
+        self.camera = self.app.camera
+        app.shader.add_user('skybox', self)
+
+    def on_shader_reload(self, shader_name, program):
+        self.vao.release()
+        self.shader_program = program
+        self.vao = self.get_vao()
+
+    def get_vertex_data(self):
+        # In clip space
+        z = 0.9999
+        vertices = [(-1, -1, z), (3, -1, z), (-1, 3, z)]
+        vertex_data = numpy.array(vertices, dtype='f4')
+        return vertex_data
+
+    def get_vbo(self):
+        return self.ctx.buffer(self.get_vertex_data())
+
+    def get_vao(self):
+        vao = self.ctx.vertex_array(self.shader_program, [
+            (self.vbo, '3f', 'in_position'),
+        ])
+        return vao
+
+    def update(self):
+        m_view = glm.mat4(glm.mat3(self.camera.m_view))
+        self.shader_program['m_invProjView'].write(glm.inverse(self.camera.m_proj * m_view))
+
+    def render(self):
+        self.shader_program['u_texture_skybox'] = self.tex_id
+        self.app.texture.textures[self.tex_id].use(location=self.tex_id)
+        self.vao.render()
+
+    def destroy(self):
+        self.vbo.release()
+        self.vao.release()
@@ -27,10 +27,19 @@ uniform Material material;
 uniform sampler2D u_texture_0;
 uniform sampler2DShadow u_shadow_map;
 uniform vec2 u_resolution;
+// Image based lighting, baked from the skybox
+uniform samplerCube u_irradiance_map;
+uniform samplerCube u_prefilter_map_0;
+uniform samplerCube u_prefilter_map_1;
+uniform samplerCube u_prefilter_map_2;
+uniform samplerCube u_prefilter_map_3;
+uniform samplerCube u_prefilter_map_4;
+uniform sampler2D u_brdf_lut;
 
 const float PI = 3.14159265359;
 const vec3 gamma = vec3(2.2);
 const vec3 i_gamma = vec3(1 / 2.2);
+const int PREFILTER_LEVELS = 5;
 
 float lookup(float ox, float oy) {
   vec2 pixelOffset = 1 / u_resolution;
@@ -97,6 +106,9 @@ vec3 fresnelSchlick(float cosTheta, vec3 F0);
 vec3 fresnelSchlick(float cosTheta, vec3 F0) {
   return F0 + (1.0 - F0) * pow(clamp(1.0 - cosTheta, 0.0, 1.0), 5.0);
 }
+vec3 fresnelSchlickRoughness(float cosTheta, vec3 F0, float roughness) {
+  return F0 + (max(vec3(1.0 - roughness), F0) - F0) * pow(clamp(1.0 - cosTheta, 0.0, 1.0), 5.0);
+}
 float DistributionGGX(vec3 N, vec3 H, float roughness) {
   float a = roughness * roughness;
   float a2 = a * a;
@@ -145,13 +157,47 @@ vec3 calculateLight(vec3 N, vec3 V, Light light, vec3 F0) {
   return Lo * light.strength;
 }
 
+vec3 samplePrefilterLevel(int level, vec3 R) {
+  if (level == 0) {
+    return texture(u_prefilter_map_0, R).rgb;
+  } else if (level == 1) {
+    return texture(u_prefilter_map_1, R).rgb;
+  } else if (level == 2) {
+    return texture(u_prefilter_map_2, R).rgb;
+  } else if (level == 3) {
+    return texture(u_prefilter_map_3, R).rgb;
+  }
+  return texture(u_prefilter_map_4, R).rgb;
+}
+
+vec3 samplePrefiltered(vec3 R, float roughness) {
+  // Each roughness level is a separate cube map, blend the two nearest like a trilinear mip lookup
+  float level = roughness * float(PREFILTER_LEVELS - 1);
+  int level_low = int(floor(level));
+  int level_high = min(level_low + 1, PREFILTER_LEVELS - 1);
+  return mix(samplePrefilterLevel(level_low, R), samplePrefilterLevel(level_high, R), fract(level));
+}
+
+vec3 getAmbient(vec3 N, vec3 V, vec3 F0) {
+  // Split sum image based lighting: diffuse irradiance plus prefiltered specular scaled by the BRDF LUT
+  float NdotV = max(dot(N, V), 0.0);
+  vec3 F = fresnelSchlickRoughness(NdotV, F0, material.Kr);
+  vec3 kD = (vec3(1.0) - F) * (1.0 - material.Km);
+  vec3 diffuse = texture(u_irradiance_map, N).rgb * material.Ka;
+  vec3 R = reflect(-V, N);
+  vec2 brdf = texture(u_brdf_lut, vec2(NdotV, material.Kr)).rg;
+  vec3 specular = samplePrefiltered(R, material.Kr) * (F * brdf.x + brdf.y);
+  return (kD * diffuse + specular) * material.Kao;
+}
+
 vec3 getLight(vec3 tex_color) {
   vec3 N = normalize(normal);
 	// Outgoing light direction V (vector from world-space fragment position to the "eye")
   vec3 V = normalize(camPos - fragPos);
   vec3 F0 = vec3(0.04);
   F0 = mix(F0, material.Ka, material.Km);
-  vec3 ambient = vec3(0.03) * material.Ka * material.Kao;
+  // vec3 ambient = vec3(0.03) * material.Ka * material.Kao;
+  vec3 ambient = getAmbient(N, V, F0);
 
   vec3 Lo = vec3(0.0);
   for (int i = 0; i < num_lights; i++) {
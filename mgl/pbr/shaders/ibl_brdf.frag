@@ -0,0 +1,67 @@
+#version 460 core
+
+layout (location = 0) out vec4 fragColor;
+
+in vec2 uv;
+
+uniform int u_sample_count;
+
+const float PI = 3.14159265359;
+
+vec2 hammersley(uint i, uint n) {
+  // Low discrepancy sequence, the radical inverse is the bit reversal of i
+  float radical_inverse = float(bitfieldReverse(i)) * 2.3283064365386963e-10;
+  return vec2(float(i) / float(n), radical_inverse);
+}
+
+vec3 importanceSampleGGX(vec2 xi, vec3 N, float roughness) {
+  float a = roughness * roughness;
+  float phi = 2.0 * PI * xi.x;
+  float cos_theta = sqrt((1.0 - xi.y) / (1.0 + (a * a - 1.0) * xi.y));
+  float sin_theta = sqrt(1.0 - cos_theta * cos_theta);
+  vec3 H = vec3(cos(phi) * sin_theta, sin(phi) * sin_theta, cos_theta);
+  vec3 up = abs(N.z) < 0.999 ? vec3(0.0, 0.0, 1.0) : vec3(1.0, 0.0, 0.0);
+  vec3 tangent = normalize(cross(up, N));
+  vec3 bitangent = cross(N, tangent);
+  return normalize(tangent * H.x + bitangent * H.y + N * H.z);
+}
+
+float GeometrySchlickGGX(float NdotV, float roughness) {
+  // IBL uses k = a^2 / 2 rather than the direct lighting remap
+  float k = (roughness * roughness) / 2.0;
+  return NdotV / (NdotV * (1.0 - k) + k);
+}
+
+float GeometrySmith(float NdotV, float NdotL, float roughness) {
+  return GeometrySchlickGGX(NdotV, roughness) * GeometrySchlickGGX(NdotL, roughness);
+}
+
+vec2 integrateBRDF(float NdotV, float roughness) {
+  vec3 V = vec3(sqrt(1.0 - NdotV * NdotV), 0.0, NdotV);
+  vec3 N = vec3(0.0, 0.0, 1.0);
+  float scale = 0.0;
+  float bias = 0.0;
+  uint sample_count = uint(u_sample_count);
+  for (uint i = 0u; i < sample_count; i++) {
+    vec2 xi = hammersley(i, sample_count);
+    vec3 H = importanceSampleGGX(xi, N, roughness);
+    vec3 L = normalize(2.0 * dot(V, H) * H - V);
+    float NdotL = max(L.z, 0.0);
+    float NdotH = max(H.z, 0.0);
+    float VdotH = max(dot(V, H), 0.0);
+    if (NdotL > 0.0) {
+      float G = GeometrySmith(NdotV, NdotL, roughness);
+      float G_vis = (G * VdotH) / (NdotH * NdotV);
+      float Fc = pow(1.0 - VdotH, 5.0);
+      scale += (1.0 - Fc) * G_vis;
+      bias += Fc * G_vis;
+    }
+  }
+  return vec2(scale, bias) / float(sample_count);
+}
+
+void main() {
+  // x is NdotV and y is roughness, the result is the scale and bias applied to F0
+  vec2 brdf = integrateBRDF(max(uv.x, 0.001), uv.y);
+  fragColor = vec4(brdf, 0.0, 1.0);
+}
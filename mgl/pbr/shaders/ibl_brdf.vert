@@ -0,0 +1,11 @@
+#version 460 core
+
+layout (location = 0) in vec2 in_position;
+
+out vec2 uv;
+
+void main() {
+    // Full screen triangle, uv covers 0..1 over the render target
+    uv = in_position * 0.5 + 0.5;
+    gl_Position = vec4(in_position, 0.0, 1.0);
+}
@@ -0,0 +1,54 @@
+#version 460 core
+
+layout (location = 0) out vec4 fragColor;
+
+in vec2 uv;
+
+uniform samplerCube u_environment;
+uniform int u_face;
+uniform float u_sample_delta;
+
+const float PI = 3.14159265359;
+const vec3 gamma = vec3(2.2);
+
+vec3 getCubeDirection(int face, vec2 uv) {
+  // Map a texel of a cube face to its world direction, following the OpenGL cube map layout
+  vec2 st = uv * 2.0 - 1.0;
+  vec3 dir;
+  if (face == 0) {
+    dir = vec3(1.0, -st.y, -st.x);
+  } else if (face == 1) {
+    dir = vec3(-1.0, -st.y, st.x);
+  } else if (face == 2) {
+    dir = vec3(st.x, 1.0, st.y);
+  } else if (face == 3) {
+    dir = vec3(st.x, -1.0, -st.y);
+  } else if (face == 4) {
+    dir = vec3(st.x, -st.y, 1.0);
+  } else {
+    dir = vec3(-st.x, -st.y, -1.0);
+  }
+  return normalize(dir);
+}
+
+void main() {
+  vec3 N = getCubeDirection(u_face, uv);
+  vec3 up = abs(N.y) < 0.999 ? vec3(0.0, 1.0, 0.0) : vec3(0.0, 0.0, 1.0);
+  vec3 right = normalize(cross(up, N));
+  up = normalize(cross(N, right));
+
+  // Convolve the hemisphere around N, weighted by the cosine of the incoming angle
+  vec3 irradiance = vec3(0.0);
+  float n_samples = 0.0;
+  for (float phi = 0.0; phi < 2.0 * PI; phi += u_sample_delta) {
+    for (float theta = 0.0; theta < 0.5 * PI; theta += u_sample_delta) {
+      vec3 tangent_sample = vec3(sin(theta) * cos(phi), sin(theta) * sin(phi), cos(theta));
+      vec3 sample_dir = tangent_sample.x * right + tangent_sample.y * up + tangent_sample.z * N;
+      vec3 color = pow(texture(u_environment, sample_dir).rgb, gamma);
+      irradiance += color * cos(theta) * sin(theta);
+      n_samples++;
+    }
+  }
+  irradiance = PI * irradiance / n_samples;
+  fragColor = vec4(irradiance, 1.0);
+}
@@ -0,0 +1,74 @@
+#version 460 core
+
+layout (location = 0) out vec4 fragColor;
+
+in vec2 uv;
+
+uniform samplerCube u_environment;
+uniform int u_face;
+uniform float u_roughness;
+uniform int u_sample_count;
+
+const float PI = 3.14159265359;
+const vec3 gamma = vec3(2.2);
+
+vec3 getCubeDirection(int face, vec2 uv) {
+  // Map a texel of a cube face to its world direction, following the OpenGL cube map layout
+  vec2 st = uv * 2.0 - 1.0;
+  vec3 dir;
+  if (face == 0) {
+    dir = vec3(1.0, -st.y, -st.x);
+  } else if (face == 1) {
+    dir = vec3(-1.0, -st.y, st.x);
+  } else if (face == 2) {
+    dir = vec3(st.x, 1.0, st.y);
+  } else if (face == 3) {
+    dir = vec3(st.x, -1.0, -st.y);
+  } else if (face == 4) {
+    dir = vec3(st.x, -st.y, 1.0);
+  } else {
+    dir = vec3(-st.x, -st.y, -1.0);
+  }
+  return normalize(dir);
+}
+
+vec2 hammersley(uint i, uint n) {
+  // Low discrepancy sequence, the radical inverse is the bit reversal of i
+  float radical_inverse = float(bitfieldReverse(i)) * 2.3283064365386963e-10;
+  return vec2(float(i) / float(n), radical_inverse);
+}
+
+vec3 importanceSampleGGX(vec2 xi, vec3 N, float roughness) {
+  float a = roughness * roughness;
+  float phi = 2.0 * PI * xi.x;
+  float cos_theta = sqrt((1.0 - xi.y) / (1.0 + (a * a - 1.0) * xi.y));
+  float sin_theta = sqrt(1.0 - cos_theta * cos_theta);
+  vec3 H = vec3(cos(phi) * sin_theta, sin(phi) * sin_theta, cos_theta);
+  vec3 up = abs(N.z) < 0.999 ? vec3(0.0, 0.0, 1.0) : vec3(1.0, 0.0, 0.0);
+  vec3 tangent = normalize(cross(up, N));
+  vec3 bitangent = cross(N, tangent);
+  return normalize(tangent * H.x + bitangent * H.y + N * H.z);
+}
+
+void main() {
+  // Split sum approximation assumes the view direction equals the normal and the reflection direction
+  vec3 N = getCubeDirection(u_face, uv);
+  vec3 R = N;
+  vec3 V = R;
+
+  uint sample_count = uint(u_sample_count);
+  float total_weight = 0.0;
+  vec3 prefiltered = vec3(0.0);
+  for (uint i = 0u; i < sample_count; i++) {
+    vec2 xi = hammersley(i, sample_count);
+    vec3 H = importanceSampleGGX(xi, N, u_roughness);
+    vec3 L = normalize(2.0 * dot(V, H) * H - V);
+    float NdotL = max(dot(N, L), 0.0);
+    if (NdotL > 0.0) {
+      prefiltered += pow(texture(u_environment, L).rgb, gamma) * NdotL;
+      total_weight += NdotL;
+    }
+  }
+  prefiltered = prefiltered / max(total_weight, 0.0001);
+  fragColor = vec4(prefiltered, 1.0);
+}
@@ -0,0 +1,60 @@
+import os
+import re
+import moderngl
+
+include_pattern = re.compile(r'^\s*#include\s+(\S+)', re.MULTILINE)
+
+
+class ProgramWatcher:
+    '''Track the modified times of a program's source files, includes resolved recursively.'''
+
+    def __init__(self, resource_dir, *files):
+        self.resource_dir = resource_dir
+        self.files = files
+        self.mtimes = self.get_mtimes()
+
+    def get_sources(self):
+        '''Return every file the program is built from, following #include lines.'''
+        sources = []
+        pending = list(self.files)
+        while pending:
+            name = pending.pop()
+            if name in sources:
+                continue
+            sources.append(name)
+            path = os.path.join(self.resource_dir, name)
+            if os.path.isfile(path):
+                with open(path, 'r') as f:
+                    pending.extend(include_pattern.findall(f.read()))
+        return sources
+
+    def get_mtimes(self):
+        mtimes = {}
+        for name in self.get_sources():
+            path = os.path.join(self.resource_dir, name)
+            mtimes[name] = os.path.getmtime(path) if os.path.isfile(path) else None
+        return mtimes
+
+    def changed(self):
+        '''Return True once per change of any source file, includes added or removed since the last check too.
+        While a source is missing, as during an editor's save, the change waits until it is back.'''
+        mtimes = self.get_mtimes()
+        if mtimes == self.mtimes or None in mtimes.values():
+            return False
+        self.mtimes = mtimes
+        return True
+
+
+def copy_uniforms(old_program, new_program):
+    '''Copy the last-known uniform values, sampler bindings included, into a recompiled program.'''
+    for name in old_program:
+        old_member = old_program[name]
+        if not isinstance(old_member, moderngl.Uniform) or name not in new_program:
+            continue
+        new_member = new_program[name]
+        if not isinstance(new_member, moderngl.Uniform):
+            continue
+        if (old_member.dimension, old_member.array_length) != (new_member.dimension, new_member.array_length):
+            # The declaration changed, the new default is used until the value is set again
+            continue
+        new_member.value = old_member.value
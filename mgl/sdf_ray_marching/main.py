@@ -1,16 +1,48 @@
 import math
+import moderngl
 import moderngl_window
+import numpy
+from moderngl_window.exceptions import ImproperlyConfigured
+
+from hot_reload import ProgramWatcher, copy_uniforms
+from render_scale import RenderScaleController
+from sdf import bake_distance_field
 
 
 class App(moderngl_window.WindowConfig):
     window_size = 1600, 900
     resource_dir = 'programs'
+    # Render scale mode: march into a lower resolution FBO and upscale to the window
+    render_scale_mode = True
+    adaptive_scale = True
+    temporal_reprojection = True
+    history_blend = 0.8
+    target_fps = 60
+    # Baked distance field used to skip empty space while marching
+    sdf_volume_mode = True
+    sdf_volume_min = (-64, -16, -64)
+    sdf_volume_max = (64, 48, 64)
+    sdf_volume_resolution = (128, 64, 128)
+    cache_path = 'cache'
+    # Recompile programs when their sources or includes change, checked every interval in seconds
+    hot_reload = True
+    hot_reload_interval = 0.5
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.quad = moderngl_window.geometry.quad_fs()
         self.program = self.load_program(vertex_shader='vertex.glsl', fragment_shader='fragment.glsl')
+        self.upscale_program = self.load_program(vertex_shader='vertex.glsl', fragment_shader='upscale.glsl')
+        # Program attribute name and shader files, watched for hot reload
+        self.program_sources = {
+            'program': ('vertex.glsl', 'fragment.glsl'),
+            'upscale_program': ('vertex.glsl', 'upscale.glsl'),
+        }
+        self.watchers = {name: ProgramWatcher(self.resource_dir, *files)
+                         for name, files in self.program_sources.items()}
+        self.reload_timer = 0.0
         self.u_scroll = 3.0
+        self.u_mouse = (0.0, 0.0)
         # Textures
         self.texture1 = self.load_texture_2d('../textures/test0.png')
         self.texture2 = self.load_texture_2d('../textures/hex.png')  # floor
@@ -36,16 +68,166 @@ class App(moderngl_window.WindowConfig):
         self.texture5.use(location=5)
         self.texture6.use(location=6)
         self.texture7.use(location=7)
+        # Distance field volume, baked on the CPU once and cached on disk
+        field = bake_distance_field(self.sdf_volume_min, self.sdf_volume_max, self.sdf_volume_resolution,
+                                    cache_path=self.cache_path)
+        self.sdf_volume = self.ctx.texture3d(self.sdf_volume_resolution, components=1,
+                                             data=numpy.ascontiguousarray(field).tobytes(), dtype='f4')
+        self.sdf_volume.filter = (moderngl.LINEAR, moderngl.LINEAR)
+        self.sdf_volume.repeat_x = False
+        self.sdf_volume.repeat_y = False
+        self.sdf_volume.repeat_z = False
+        self.sdf_volume.use(location=9)
+        voxel = [(self.sdf_volume_max[i] - self.sdf_volume_min[i]) / self.sdf_volume_resolution[i] for i in range(3)]
+        self.program['u_sdf_volume'] = 9
+        self.program['u_sdf_volume_min'] = self.sdf_volume_min
+        self.program['u_sdf_volume_max'] = self.sdf_volume_max
+        self.program['u_sdf_voxel_diagonal'] = math.sqrt(sum(v * v for v in voxel))
+        self.program['u_use_sdf_volume'] = self.sdf_volume_mode
+        # Render scale, the controller holds the target fps by trading resolution and march steps
+        self.scaler = RenderScaleController(target_fps=self.target_fps)
+        self.program['u_max_steps'] = self.scaler.steps
+        # GPU timer queries, alternated so reading last frame's result does not stall the pipeline
+        self.queries = [self.ctx.query(time=True), self.ctx.query(time=True)]
+        self.query_index = 0
+        self.query_ready = False
+        self.march_fbo = None
+        self.history_fbos = []
+        self.create_render_targets()
+
+    def create_render_targets(self):
+        self.release_render_targets()
+        self.render_size = self.scaler.get_size(self.wnd.buffer_size)
+        # Color in rgb and hit distance in alpha
+        self.march_texture = self.ctx.texture(self.render_size, components=4, dtype='f2')
+        self.march_texture.filter = (moderngl.LINEAR, moderngl.LINEAR)
+        self.march_texture.repeat_x = False
+        self.march_texture.repeat_y = False
+        self.march_fbo = self.ctx.framebuffer(color_attachments=[self.march_texture])
+        # Full resolution history, ping-ponged between frames
+        self.history_fbos = []
+        for _ in range(2):
+            texture = self.ctx.texture(self.wnd.buffer_size, components=4)
+            texture.filter = (moderngl.LINEAR, moderngl.LINEAR)
+            texture.repeat_x = False
+            texture.repeat_y = False
+            self.history_fbos.append(self.ctx.framebuffer(color_attachments=[texture]))
+        self.history_index = 0
+        self.history_valid = False
+        print(f"render scale: {self.scaler.scale:.2f} size: {self.render_size} steps: {self.scaler.steps}")
+
+    def release_render_targets(self):
+        if self.march_fbo is not None:
+            self.march_fbo.release()
+            self.march_texture.release()
+        for fbo in self.history_fbos:
+            fbo.color_attachments[0].release()
+            fbo.release()
+
+    def check_reload(self, frame_time):
+        self.reload_timer += frame_time
+        if self.reload_timer < self.hot_reload_interval:
+            return
+        self.reload_timer = 0.0
+        for name, watcher in self.watchers.items():
+            if watcher.changed():
+                self.reload_program(name)
+
+    def reload_program(self, name):
+        '''Recompile a program, keep the old one when the new source fails to build.'''
+        vertex_shader, fragment_shader = self.program_sources[name]
+        old_program = getattr(self, name)
+        try:
+            new_program = self.load_program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
+        except (moderngl.Error, ValueError, OSError, ImproperlyConfigured) as error:
+            # Keep the old program running until the source builds again
+            print(f"failed to reload program: {name}\n{error}")
+            return
+        copy_uniforms(old_program, new_program)
+        setattr(self, name, new_program)
+        old_program.release()
+        print(f"reloaded program: {name}")
 
     def render(self, time, frame_time):
+        if self.hot_reload:
+            self.check_reload(frame_time)
         self.update(time)
-        self.ctx.clear()
-        self.quad.render(self.program)
+        if not self.render_scale_mode:
+            self.program['u_resolution'] = self.wnd.buffer_size
+            self.program['u_write_distance'] = False
+            self.ctx.clear()
+            self.quad.render(self.program)
+            return
+        # Pass 1 - Ray march into the low resolution FBO, timed on the GPU
+        self.program['u_resolution'] = self.render_size
+        self.program['u_write_distance'] = True
+        self.march_fbo.use()
+        query = self.queries[self.query_index]
+        with query:
+            self.quad.render(self.program)
+        # Pass 2 - Upscale with optional temporal reprojection into the history FBO, then copy to the window
+        history_read = self.history_fbos[self.history_index]
+        history_write = self.history_fbos[1 - self.history_index]
+        self.march_texture.use(location=0)
+        history_read.color_attachments[0].use(location=8)
+        self.upscale_program['u_color'] = 0
+        self.upscale_program['u_history'] = 8
+        self.upscale_program['u_resolution'] = self.wnd.buffer_size
+        self.upscale_program['u_low_resolution'] = self.render_size
+        self.upscale_program['u_mouse'] = self.u_mouse
+        self.upscale_program['u_scroll'] = self.u_scroll
+        self.upscale_program['u_prev_mouse'] = self.prev_mouse
+        self.upscale_program['u_prev_scroll'] = self.prev_scroll
+        use_history = self.temporal_reprojection and self.history_valid
+        self.upscale_program['u_history_blend'] = self.history_blend if use_history else 0.0
+        history_write.use()
+        self.quad.render(self.upscale_program)
+        self.ctx.copy_framebuffer(self.wnd.fbo, history_write)
+        self.wnd.fbo.use()
+        self.history_index = 1 - self.history_index
+        self.history_valid = True
+        # Feed the controller with the previous frame's GPU time
+        self.query_index = 1 - self.query_index
+        if self.query_ready and self.adaptive_scale:
+            gpu_time = self.queries[self.query_index].elapsed * 1e-6
+            if self.scaler.update(gpu_time, frame_time):
+                self.create_render_targets()
+            self.program['u_max_steps'] = self.scaler.steps
+        self.query_ready = True
 
     def update(self, time):
+        # The mouse is in window pixels, scaled to the render target so the camera is the same at any render scale
+        self.prev_mouse = self.u_mouse
+        self.prev_scroll = self.u_scroll
+        self.u_mouse = (math.sin(time) * 200, math.sin(time) * 100)
+        self.u_scroll = math.sin(time) * 0.5 + 3.0
+        scale = self.render_size[0] / self.wnd.buffer_size[0] if self.render_scale_mode else 1.0
         self.program['u_time'] = time
-        self.program['u_mouse'] = (math.sin(time) * 200, math.sin(time) * 100)
-        self.program['u_scroll'] = math.sin(time) * 0.5 + 3.0
+        self.program['u_mouse'] = (self.u_mouse[0] * scale, self.u_mouse[1] * scale)
+        self.program['u_scroll'] = self.u_scroll
+
+    def key_event(self, key, action, modifiers):
+        keys = self.wnd.keys
+        if action != keys.ACTION_PRESS:
+            return
+        if key == keys.R:
+            # Toggle render scale mode
+            self.render_scale_mode = not self.render_scale_mode
+            self.history_valid = False
+            print(f"render scale mode: {self.render_scale_mode}")
+        elif key == keys.A:
+            # Toggle the adaptive controller, when off the current scale and steps are kept
+            self.adaptive_scale = not self.adaptive_scale
+            print(f"adaptive scale: {self.adaptive_scale}")
+        elif key == keys.T:
+            # Toggle temporal reprojection
+            self.temporal_reprojection = not self.temporal_reprojection
+            print(f"temporal reprojection: {self.temporal_reprojection}")
+        elif key == keys.V:
+            # Toggle empty space skipping with the baked distance field
+            self.sdf_volume_mode = not self.sdf_volume_mode
+            self.program['u_use_sdf_volume'] = self.sdf_volume_mode
+            print(f"sdf volume: {self.sdf_volume_mode}")
 
     # def mouse_position_event(self, x, y, dx, dy):
     #     self.program['u_mouse'] = (x, y)
@@ -6,6 +6,16 @@ uniform vec2 u_resolution;
 uniform vec2 u_mouse;
 uniform float u_time;
 uniform float u_scroll;
+// Ray march step budget, lowered by the render scale controller
+uniform int u_max_steps = 128;
+// Write the hit distance into alpha for temporal reprojection when rendering to an FBO
+uniform bool u_write_distance = false;
+// Baked distance field for empty space skipping, see sdf.py
+uniform bool u_use_sdf_volume = false;
+uniform sampler3D u_sdf_volume;
+uniform vec3 u_sdf_volume_min;
+uniform vec3 u_sdf_volume_max;
+uniform float u_sdf_voxel_diagonal;
 uniform sampler2D u_texture1;
 uniform sampler2D u_texture2;
 uniform sampler2D u_texture3;
@@ -15,7 +25,6 @@ uniform sampler2D u_texture6;
 uniform sampler2D u_texture7;
 
 const float FOV = 1.0;
-const int MAX_STEPS = 128;
 const float MAX_DIST = 500;
 const float EPSILON = 0.01;
 
@@ -35,6 +44,9 @@ float roofBumpFactor = 0.31;
 float sphereBumpFactor = 0.21;
 float wallBumpFactor = 0.06;
 
+// Distance along the ray of the last rendered sample
+float hitDist = MAX_DIST;
+
 void translateSphere(inout vec3 p) {
     p.y -= 4.4;
 }
@@ -99,10 +111,29 @@ vec2 fOpUnionChamferID(vec2 res1, vec2 res2, float r) {
 #include material.glsl
 /*--------------------------------*/
 
+float getVolumeDistance(vec3 p) {
+    // Lower bound of the scene distance from the baked volume, 0.0 outside of it
+    vec3 uvw = (p - u_sdf_volume_min) / (u_sdf_volume_max - u_sdf_volume_min);
+    if (any(lessThan(uvw, vec3(0.0))) || any(greaterThan(uvw, vec3(1.0))))
+        return 0.0;
+    // Trilinear filtering of a distance field is off by at most the voxel diagonal
+    return texture(u_sdf_volume, uvw).r - u_sdf_voxel_diagonal;
+}
+
 vec2 rayMarch(vec3 ro, vec3 rd) {
     vec2 hit, object;
-    for (int i = 0; i < MAX_STEPS; i++) {
+    for (int i = 0; i < u_max_steps; i++) {
         vec3 p = ro + object.x * rd;
+        if (u_use_sdf_volume) {
+            // Skip empty space with one texture fetch instead of evaluating the full map
+            float skip = getVolumeDistance(p);
+            if (skip > u_sdf_voxel_diagonal) {
+                object.x += skip;
+                if (object.x > MAX_DIST)
+                    break;
+                continue;
+            }
+        }
         hit = map(p);
         object.x += hit.x;
         object.y = hit.y;
@@ -122,7 +153,7 @@ float getSoftShadow(vec3 p, vec3 lightPos) {
     float res = 1.0;
     float dist = 0.01;
     float lightSize = 0.03;
-    for (int i = 0; i < MAX_STEPS; i++) {
+    for (int i = 0; i < u_max_steps; i++) {
         float hit = map(p + lightPos * dist).x;
         res = min(res, hit / (dist * lightSize));
         dist += hit;
@@ -190,6 +221,7 @@ vec3 render(vec2 uv) {
     vec3 rd = getCam(ro, lookAt) * normalize(vec3(uv, FOV));
 
     vec2 object = rayMarch(ro, rd);
+    hitDist = min(object.x, MAX_DIST);
 
     if (object.x < MAX_DIST) {
         vec3 p = ro + object.x * rd;
@@ -236,5 +268,5 @@ void main() {
     vec3 color = (AA == 1) ? renderAAx1() : (AA == 2) ? renderAAx2() : (AA == 3) ? renderAAx3() : renderAAx4();
     // gamma correction
     color = pow(color, vec3(0.4545));
-    fragColor = vec4(color, 1.0);
+    fragColor = vec4(color, u_write_distance ? hitDist : 1.0);
 }
\ No newline at end of file
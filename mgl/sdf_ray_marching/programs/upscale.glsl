@@ -0,0 +1,80 @@
+#version 460 core
+layout (location = 0) out vec4 fragColor;
+
+// Low resolution ray march output, rgb color and hit distance in alpha
+uniform sampler2D u_color;
+// Previous full resolution output
+uniform sampler2D u_history;
+uniform vec2 u_resolution;
+uniform vec2 u_low_resolution;
+// Camera state of this frame and the previous frame, in full resolution pixels
+uniform vec2 u_mouse;
+uniform float u_scroll;
+uniform vec2 u_prev_mouse;
+uniform float u_prev_scroll;
+// 0.0 disables temporal reprojection
+uniform float u_history_blend;
+
+const float PI = 3.14159265;
+const float TAU = 2.0 * PI;
+const float FOV = 1.0;
+const float MAX_DIST = 500;
+
+// Must match the camera in fragment.glsl
+void pR(inout vec2 p, float a) {
+    p = cos(a) * p + sin(a) * vec2(p.y, -p.x);
+}
+
+mat3 getCam(vec3 ro, vec3 lookAt) {
+    vec3 camF = normalize(vec3(lookAt - ro));
+    vec3 camR = normalize(cross(vec3(0, 1, 0), camF));
+    vec3 camU = cross(camF, camR);
+    return mat3(camR, camU, camF);
+}
+
+vec3 getCameraPosition(vec2 mouse, float scroll) {
+    vec3 ro = vec3(36.0, 19.0, -36.0) / scroll;
+    vec2 m = mouse / u_resolution;
+    pR(ro.yz, m.y * PI * 0.39 - 0.39);
+    pR(ro.xz, m.x * TAU);
+    return ro;
+}
+
+vec2 reproject(vec2 uv, float dist) {
+    // Rebuild the world position of this pixel and project it with the previous camera
+    const vec3 lookAt = vec3(0, 1, 0);
+    vec3 ro = getCameraPosition(u_mouse, u_scroll);
+    vec3 rd = getCam(ro, lookAt) * normalize(vec3(uv, FOV));
+    vec3 prev_ro = getCameraPosition(u_prev_mouse, u_prev_scroll);
+    // The background has no depth, so only the direction is reprojected
+    vec3 local = (dist < MAX_DIST) ? transpose(getCam(prev_ro, lookAt)) * (ro + rd * dist - prev_ro)
+                                   : transpose(getCam(prev_ro, lookAt)) * rd;
+    if (local.z <= 0.0) {
+        return vec2(-1.0);
+    }
+    vec2 prev_uv = local.xy * FOV / local.z;
+    return (prev_uv * u_resolution.y + u_resolution) / (2.0 * u_resolution);
+}
+
+void main() {
+    vec2 tex_coord = gl_FragCoord.xy / u_resolution;
+    vec4 current = texture(u_color, tex_coord);
+    vec3 color = current.rgb;
+    if (u_history_blend > 0.0) {
+        vec2 uv = (2.0 * gl_FragCoord.xy - u_resolution) / u_resolution.y;
+        vec2 prev_coord = reproject(uv, current.a);
+        if (all(greaterThanEqual(prev_coord, vec2(0.0))) && all(lessThanEqual(prev_coord, vec2(1.0)))) {
+            // Clamp the history to the neighbourhood of the low resolution sample to limit ghosting
+            vec2 texel = 1.0 / u_low_resolution;
+            vec3 n0 = texture(u_color, tex_coord + vec2(texel.x, 0.0)).rgb;
+            vec3 n1 = texture(u_color, tex_coord - vec2(texel.x, 0.0)).rgb;
+            vec3 n2 = texture(u_color, tex_coord + vec2(0.0, texel.y)).rgb;
+            vec3 n3 = texture(u_color, tex_coord - vec2(0.0, texel.y)).rgb;
+            vec3 color_min = min(color, min(min(n0, n1), min(n2, n3)));
+            vec3 color_max = max(color, max(max(n0, n1), max(n2, n3)));
+            vec3 history = clamp(texture(u_history, prev_coord).rgb, color_min, color_max);
+            color = mix(color, history, u_history_blend);
+        }
+    }
+    fragColor = vec4(color, 1.0);
+}
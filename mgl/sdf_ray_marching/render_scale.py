@@ -0,0 +1,63 @@
+class RenderScaleController:
+    '''Adjust the render scale and the ray march step budget from the measured GPU frame time.
+
+    Over budget the resolution drops first, then the step count; under budget the steps come back first,
+    then the resolution. Changes wait for a short cooldown so the FBOs are not rebuilt every frame.
+    '''
+
+    def __init__(self, target_fps=60, min_scale=0.25, max_scale=1.0, scale_step=0.05,
+                 min_steps=32, max_steps=128, steps_step=8, smoothing=0.1, cooldown=0.25,
+                 upper_ratio=1.05, lower_ratio=0.8):
+        self.target_fps = target_fps
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.scale_step = scale_step
+        self.min_steps = min_steps
+        self.max_steps = max_steps
+        self.steps_step = steps_step
+        self.smoothing = smoothing
+        self.cooldown = cooldown
+        self.upper_ratio = upper_ratio
+        self.lower_ratio = lower_ratio
+        # State
+        self.scale = max_scale
+        self.steps = max_steps
+        self.gpu_time = None  # Smoothed GPU time in ms
+        self.cooldown_left = 0.0
+
+    @property
+    def budget(self):
+        '''Frame time budget in ms for the target fps.'''
+        return 1000.0 / self.target_fps
+
+    def get_size(self, window_size):
+        '''Return the render target size for the current scale.'''
+        return max(1, int(window_size[0] * self.scale)), max(1, int(window_size[1] * self.scale))
+
+    def update(self, gpu_time, frame_time):
+        '''Feed a GPU time sample in ms and the frame time in seconds, return True when the scale changed.'''
+        if self.gpu_time is None:
+            self.gpu_time = gpu_time
+        else:
+            self.gpu_time += (gpu_time - self.gpu_time) * self.smoothing
+        self.cooldown_left -= frame_time
+        if self.cooldown_left > 0.0:
+            return False
+        last_scale = self.scale
+        last_steps = self.steps
+        if self.gpu_time > self.budget * self.upper_ratio:
+            if self.scale > self.min_scale:
+                self.scale = max(self.min_scale, round(self.scale - self.scale_step, 2))
+            elif self.steps > self.min_steps:
+                self.steps = max(self.min_steps, self.steps - self.steps_step)
+        elif self.gpu_time < self.budget * self.lower_ratio:
+            if self.steps < self.max_steps:
+                self.steps = min(self.max_steps, self.steps + self.steps_step)
+            elif self.scale < self.max_scale:
+                self.scale = min(self.max_scale, round(self.scale + self.scale_step, 2))
+        if self.steps != last_steps:
+            self.cooldown_left = self.cooldown
+        if self.scale != last_scale:
+            self.cooldown_left = self.cooldown
+            return True
+        return False
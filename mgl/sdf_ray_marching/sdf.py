@@ -0,0 +1,271 @@
+import hashlib
+import math
+import os
+import numpy
+
+# NumPy mirror of the hg_sdf primitives and operators used by programs/map.glsl.
+# Points are passed as a tuple of component arrays (x, y, z) so the domain operators can work on any pair of axes
+# like the GLSL swizzles do, and millions of points are evaluated in one batch.
+
+sqrt_half = math.sqrt(0.5)
+map_path = 'programs/map.glsl'
+
+# Bump factors from fragment.glsl, the CPU mirror has no textures so the bump is replaced by its bound
+sphere_bump_factor = 0.21
+
+
+# Primitives
+
+def f_sphere(p, r):
+    x, y, z = p
+    return numpy.sqrt(x * x + y * y + z * z) - r
+
+
+def f_plane(p, n, distance_from_origin):
+    x, y, z = p
+    return x * n[0] + y * n[1] + z * n[2] + distance_from_origin
+
+
+def f_box_cheap(p, b):
+    x, y, z = p
+    return numpy.maximum(numpy.maximum(numpy.abs(x) - b[0], numpy.abs(y) - b[1]), numpy.abs(z) - b[2])
+
+
+def f_box2_cheap(x, y, b):
+    return numpy.maximum(numpy.abs(x) - b[0], numpy.abs(y) - b[1])
+
+
+def f_cylinder(p, r, height):
+    x, y, z = p
+    d = numpy.sqrt(x * x + z * z) - r
+    return numpy.maximum(d, numpy.abs(y) - height)
+
+
+# Domain operators, these return the new components instead of modifying in place
+
+def p_r(x, y, a):
+    c, s = math.cos(a), math.sin(a)
+    return c * x + s * y, c * y - s * x
+
+
+def p_r45(x, y):
+    return (x + y) * sqrt_half, (y - x) * sqrt_half
+
+
+def p_mod1(p, size):
+    half_size = size * 0.5
+    cell = numpy.floor((p + half_size) / size)
+    return numpy.mod(p + half_size, size) - half_size, cell
+
+
+def p_mirror(p, dist):
+    return numpy.abs(p) - dist
+
+
+def p_mirror_octant(x, y, dist):
+    x = p_mirror(x, dist[0])
+    y = p_mirror(y, dist[1])
+    swap = y > x
+    return numpy.where(swap, y, x), numpy.where(swap, x, y)
+
+
+# Combination operators
+
+def f_op_union_chamfer(a, b, r):
+    return numpy.minimum(numpy.minimum(a, b), (a - r + b) * sqrt_half)
+
+
+def f_op_union_stairs(a, b, r, n):
+    s = r / n
+    u = b - r
+    return numpy.minimum(numpy.minimum(a, b), 0.5 * (u + a + numpy.abs(numpy.mod(u - a + s, 2 * s) - s)))
+
+
+def f_op_difference_columns(a, b, r, n):
+    a = -a
+    m = numpy.minimum(a, b)
+    column_radius = r * math.sqrt(2) / ((n - 1) * 2 + math.sqrt(2))
+    x, y = p_r45(a, b)
+    y = y + column_radius
+    x = x - math.sqrt(2) / 2 * r
+    x = x - column_radius * math.sqrt(2) / 2
+    if n % 2 == 1:
+        y = y + column_radius
+    y, _ = p_mod1(y, column_radius * 2)
+    result = -numpy.sqrt(x * x + y * y) + column_radius
+    result = numpy.maximum(result, x)
+    result = numpy.minimum(result, a)
+    result = -numpy.minimum(result, b)
+    # Only near both surfaces is the column shape used, like the branch in hg_sdf
+    return numpy.where((a < r) & (b < r), result, -m)
+
+
+# Operators carrying the material ID, res is a (distance, id) pair
+
+def f_op_union_id(res1, res2):
+    mask = res1[0] < res2[0]
+    return numpy.where(mask, res1[0], res2[0]), numpy.where(mask, res1[1], res2[1])
+
+
+def f_op_difference_columns_id(res1, res2, r, n):
+    dist = f_op_difference_columns(res1[0], res2[0], r, n)
+    return dist, numpy.where(res1[0] > -res2[0], res1[1], res2[1])
+
+
+def f_op_union_stairs_id(res1, res2, r, n):
+    dist = f_op_union_stairs(res1[0], res2[0], r, n)
+    return dist, numpy.where(res1[0] < res2[0], res1[1], res2[1])
+
+
+def f_op_union_chamfer_id(res1, res2, r):
+    dist = f_op_union_chamfer(res1[0], res2[0], r)
+    return dist, numpy.where(res1[0] < res2[0], res1[1], res2[1])
+
+
+# Scene, keep in sync with programs/map.glsl
+
+def get_pedestal(p):
+    x, y, z = p
+    # box 1
+    y = y + 13.8
+    box1 = f_box_cheap((x, y, z), (8, 0.4, 8))
+    # box 2
+    y = y - 6.4
+    box2 = f_box_cheap((x, y, z), (7, 6, 7))
+    # box 3
+    z, x = p_mirror_octant(z, x, (7.5, 7.5))
+    box3 = f_box_cheap((x, y, z), (5, 4, 1))
+    # res
+    res_dist = numpy.minimum(box1, box2)
+    res_dist = f_op_difference_columns(res_dist, box3, 1.9, 10.0)
+    return res_dist, numpy.full_like(res_dist, 9.0)
+
+
+def scene_map(p):
+    '''Evaluate map.glsl for points as (x, y, z) arrays, return the (distance, id) arrays.
+
+    Bump mapping needs the textures, so bumped surfaces use the bound of the bump instead. The result is then a
+    lower bound of the shader distance, which is what empty space skipping needs. The sphere rotation does not
+    change its distance, so the scene does not depend on time.
+    '''
+    x, y, z = p
+    # plane
+    plane_dist = f_plane(p, (0, 1, 0), 14.0)
+    plane = plane_dist, numpy.full_like(plane_dist, 6.0)
+
+    # pedestal
+    pedestal = get_pedestal(p)
+
+    # sphere, the bump only ever adds distance
+    sphere_dist = f_sphere((x, y - 4.4, z), 6.0) + sphere_bump_factor
+    sphere = sphere_dist, numpy.full_like(sphere_dist, 10.0)
+
+    # manipulation operators
+    x, z = p_mirror_octant(x, z, (50, 50))
+    x = -numpy.abs(x) + 20
+    z, _ = p_mod1(z, 15)
+
+    # roof, the bump removes at most the roof bump factor that was added back
+    rx, ry = p_r(x, y - 15.7, 0.6)
+    rx = rx - 18.0
+    roof_dist = f_box2_cheap(rx, ry, (20, 0.5))
+    roof = roof_dist, numpy.full_like(roof_dist, 8.0)
+
+    # box
+    box_dist = f_box_cheap((x, y, z), (3, 9, 4))
+    box = box_dist, numpy.full_like(box_dist, 7.0)
+
+    # cylinder
+    cylinder_dist = f_cylinder((y - 9.0, x, z), 4, 3)
+    cylinder = cylinder_dist, numpy.full_like(cylinder_dist, 7.0)
+
+    # wall, same bound as the roof
+    wall_dist = f_box2_cheap(x, y, (1, 15))
+    wall = wall_dist, numpy.full_like(wall_dist, 7.0)
+
+    # result
+    res = f_op_union_id(box, cylinder)
+    res = f_op_difference_columns_id(wall, res, 0.6, 3.0)
+    res = f_op_union_chamfer_id(res, roof, 0.6)
+    res = f_op_union_stairs_id(res, plane, 4.0, 5.0)
+    res = f_op_union_id(res, sphere)
+    res = f_op_union_id(res, pedestal)
+    return res
+
+
+def evaluate(points, chunk_size=1 << 20):
+    '''Evaluate the scene for an (n, 3) array of points in chunks, return the (distance, id) arrays.'''
+    points = numpy.asarray(points, dtype='f4').reshape(-1, 3)
+    distance = numpy.empty(len(points), dtype='f4')
+    ids = numpy.empty(len(points), dtype='f4')
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size]
+        distance[start:start + chunk_size], ids[start:start + chunk_size] = scene_map(
+            (chunk[:, 0], chunk[:, 1], chunk[:, 2]))
+    return distance, ids
+
+
+def get_normal(points, epsilon=0.01):
+    '''Scene normals for an (n, 3) array of points, from the same differences as getNormal in fragment.glsl.'''
+    points = numpy.asarray(points, dtype='f4').reshape(-1, 3)
+    d = evaluate(points)[0]
+    normals = numpy.empty_like(points)
+    for axis in range(3):
+        offset = numpy.zeros(3, dtype='f4')
+        offset[axis] = epsilon
+        normals[:, axis] = d - evaluate(points - offset)[0]
+    return normals / numpy.maximum(numpy.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+
+
+def ray_march(origins, directions, max_steps=128, max_dist=500.0, epsilon=0.01):
+    '''Sphere trace a batch of rays, return the hit distance (inf on a miss) and the material id per ray.'''
+    origins = numpy.asarray(origins, dtype='f4').reshape(-1, 3)
+    directions = numpy.asarray(directions, dtype='f4').reshape(-1, 3)
+    t = numpy.zeros(len(origins), dtype='f4')
+    ids = numpy.zeros(len(origins), dtype='f4')
+    hit = numpy.zeros(len(origins), dtype=bool)
+    active = numpy.ones(len(origins), dtype=bool)
+    for _ in range(max_steps):
+        index = numpy.nonzero(active)[0]
+        if len(index) == 0:
+            break
+        d, step_ids = evaluate(origins[index] + directions[index] * t[index, None])
+        t[index] += d
+        ids[index] = step_ids
+        done = numpy.abs(d) < epsilon
+        hit[index[done]] = True
+        active[index[done | (t[index] > max_dist)]] = False
+    return numpy.where(hit, t, numpy.inf), ids
+
+
+def get_cache_key(bounds_min, bounds_max, resolution):
+    digest = hashlib.sha1()
+    with open(map_path, 'rb') as f:
+        digest.update(f.read())
+    with open(__file__, 'rb') as f:
+        digest.update(f.read())
+    digest.update(repr((tuple(bounds_min), tuple(bounds_max), tuple(resolution))).encode())
+    return digest.hexdigest()
+
+
+def bake_distance_field(bounds_min=(-64, -16, -64), bounds_max=(64, 48, 64), resolution=(128, 64, 128),
+                        cache_path='cache'):
+    '''Sample the scene at voxel centres into a float32 array shaped (z, y, x) for a 3D texture.
+
+    The array is cached as .npy keyed by map.glsl, this module and the grid settings, and memory mapped on load.
+    '''
+    cache_file = f'{cache_path}/sdf_volume_{get_cache_key(bounds_min, bounds_max, resolution)}.npy'
+    if os.path.isfile(cache_file):
+        print(f"loaded sdf volume: {cache_file}")
+        return numpy.load(cache_file, mmap_mode='r')
+    axes = []
+    for axis in range(3):
+        voxel = (bounds_max[axis] - bounds_min[axis]) / resolution[axis]
+        axes.append(bounds_min[axis] + (numpy.arange(resolution[axis], dtype='f4') + 0.5) * voxel)
+    zs, ys, xs = numpy.meshgrid(axes[2], axes[1], axes[0], indexing='ij')
+    points = numpy.stack([xs.ravel(), ys.ravel(), zs.ravel()], axis=1)
+    field = evaluate(points)[0].reshape(resolution[2], resolution[1], resolution[0])
+    os.makedirs(cache_path, exist_ok=True)
+    numpy.save(cache_file, field)
+    print(f"baked sdf volume: {cache_file}")
+    return field
@@ -0,0 +1,38 @@
+#version 330
+
+#define MAX_LIGHTS 4
+
+uniform sampler2DArray block_textures;
+
+uniform struct p3d_LightModelParameters {
+    vec4 ambient;
+} p3d_LightModel;
+
+uniform struct p3d_LightSourceParameters {
+    vec4 color;
+    // View space, w is 0 for a directional light and xyz points towards it
+    vec4 position;
+} p3d_LightSource[MAX_LIGHTS];
+
+in vec3 view_position;
+in vec3 view_normal;
+in vec3 uv_layer;
+in float emission;
+
+out vec4 p3d_FragColor;
+
+void main() {
+    vec4 albedo = texture(block_textures, uv_layer);
+    if (albedo.a < 0.5) {
+        discard;
+    }
+    vec3 normal = normalize(view_normal);
+    vec3 light = p3d_LightModel.ambient.rgb;
+    for (int i = 0; i < MAX_LIGHTS; i++) {
+        vec4 position = p3d_LightSource[i].position;
+        vec3 direction = normalize(position.xyz - view_position * position.w);
+        light += p3d_LightSource[i].color.rgb * max(dot(normal, direction), 0.0);
+    }
+    light = max(light, vec3(emission));
+    p3d_FragColor = vec4(albedo.rgb * min(light, vec3(1.0)), albedo.a);
+}
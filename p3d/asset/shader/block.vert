@@ -0,0 +1,24 @@
+#version 330
+
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat4 p3d_ModelViewMatrix;
+uniform mat3 p3d_NormalMatrix;
+
+in vec4 p3d_Vertex;
+in vec3 p3d_Normal;
+in vec2 p3d_MultiTexCoord0;
+// Texture array layer of the face and light emission of the block
+in vec2 block;
+
+out vec3 view_position;
+out vec3 view_normal;
+out vec3 uv_layer;
+out float emission;
+
+void main() {
+    view_position = vec3(p3d_ModelViewMatrix * p3d_Vertex);
+    view_normal = normalize(p3d_NormalMatrix * p3d_Normal);
+    uv_layer = vec3(p3d_MultiTexCoord0, block.x);
+    emission = block.y;
+    gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
+}
@@ -0,0 +1,72 @@
+import numpy
+
+
+max_block_types: int = 256
+
+
+class BlockType:
+    '''Properties of one block type, the ID is the value stored in the chunk arrays.'''
+
+    def __init__(self, block_id: int, name: str, solid: bool = True, transparent: bool = False,
+                 light_emission: float = 0.0, model: str = None):
+        self.id = block_id
+        self.name = name
+        # Solid blocks stop the player, transparent blocks do not hide the faces behind them
+        self.solid = solid
+        self.transparent = transparent
+        # Brightness added in the block shader, 0 to 1
+        self.light_emission = light_emission
+        # Model the face textures are taken from, None for blocks that are never drawn
+        self.model = model
+
+
+class BlockRegistry:
+    '''Block types by numeric ID, with their properties also kept in arrays indexed by ID so whole chunk arrays
+    can be tested at once, for example registry.solid[chunk.blocks].'''
+
+    def __init__(self):
+        self.types = []
+        self.ids = {}
+        self.solid = numpy.zeros(max_block_types, dtype=bool)
+        self.opaque = numpy.zeros(max_block_types, dtype=bool)
+        self.light_emission = numpy.zeros(max_block_types, dtype=numpy.float32)
+
+    def register(self, name: str, solid: bool = True, transparent: bool = False, light_emission: float = 0.0,
+                 model: str = None) -> int:
+        '''Add a block type with the next free ID.
+        Args:
+            name (str): Unique name
+            solid (bool): Blocks movement
+            transparent (bool): Faces behind it stay visible
+            light_emission (float): Brightness from 0 to 1
+            model (str): Name of the block model with the face textures
+        Returns:
+            int: Block ID
+        '''
+        if name in self.ids:
+            raise ValueError(f"block type {name} is already registered")
+        block_id = len(self.types)
+        if block_id >= max_block_types:
+            raise ValueError(f"no more than {max_block_types} block types fit in the uint8 chunk arrays")
+        self.types.append(BlockType(block_id, name, solid, transparent, light_emission, model))
+        self.ids[name] = block_id
+        self.solid[block_id] = solid
+        self.opaque[block_id] = not transparent
+        self.light_emission[block_id] = light_emission
+        return block_id
+
+    def get(self, key) -> BlockType:
+        '''Block type by name or ID.'''
+        return self.types[self.ids[key] if isinstance(key, str) else key]
+
+    @property
+    def names(self) -> list:
+        return [block_type.name for block_type in self.types]
+
+
+registry = BlockRegistry()
+registry.register("air", solid=False, transparent=True)
+registry.register("grass", model="grass")
+registry.register("dirt", model="dirt")
+registry.register("sand", model="sand")
+registry.register("stone", model="stone")
@@ -0,0 +1,349 @@
+from panda3d.core import Geom, GeomNode, GeomTriangles, GeomVertexArrayFormat, GeomVertexData, GeomVertexFormat
+from panda3d.core import GeomVertexReader, InternalName, NodePath, PNMImage, SamplerState, Texture, TextureAttrib
+from panda3d.core import CullFaceAttrib, RenderState, Shader, ShaderAttrib
+
+import numpy
+import voxel
+from blocks import BlockRegistry, max_block_types, registry
+
+
+def get_face_corners() -> list:
+    '''Corner signs of the six faces in neighbour_offsets order, counter-clockwise seen from outside.
+    Returns:
+        list: For each face a (4, 3) array of -1 or 1 per axis
+    '''
+    faces = []
+    for offset in voxel.neighbour_offsets:
+        axis = next(i for i in range(3) if offset[i] != 0)
+        u, v = (axis + 1) % 3, (axis + 2) % 3
+        corners = numpy.zeros((4, 3), dtype=numpy.int8)
+        corners[:, axis] = offset[axis]
+        # (u, v) in this order turns counter-clockwise around +axis, so it is reversed for the -axis faces
+        corners[:, u] = (-1, 1, 1, -1)
+        corners[:, v] = (-1, -1, 1, 1)
+        if offset[axis] < 0:
+            corners = corners[::-1]
+        faces.append(corners)
+    return faces
+
+
+face_corners = get_face_corners()
+face_normals = numpy.array(voxel.neighbour_offsets, dtype=numpy.float32)
+quad_indices = numpy.array([0, 1, 2, 0, 2, 3], dtype=numpy.uint32)
+
+
+def get_face_uvs(model: NodePath) -> numpy.ndarray:
+    '''Read the texture coordinates of each face corner from a unit block model, so the mesh looks the same.
+    Args:
+        model (NodePath): Block model with one geom spanning -1 to 1 on each axis
+    Returns:
+        numpy.ndarray: (6, 4, 2) texture coordinates in face_corners order
+    '''
+    geom_node = model.find('**/+GeomNode')
+    matrix = geom_node.getNetTransform().getMat()
+    vertex_data = geom_node.node().getGeom(0).getVertexData()
+    vertex_reader = GeomVertexReader(vertex_data, 'vertex')
+    normal_reader = GeomVertexReader(vertex_data, 'normal')
+    texcoord_reader = GeomVertexReader(vertex_data, 'texcoord.0')
+    uv_map = {}
+    while not vertex_reader.isAtEnd():
+        position = matrix.xformPoint(vertex_reader.getData3())
+        normal = matrix.xformVec(normal_reader.getData3())
+        axis = max(range(3), key=lambda i: abs(normal[i]))
+        direction = [0, 0, 0]
+        direction[axis] = 1 if normal[axis] > 0 else -1
+        signs = tuple(1 if position[i] > 0 else -1 for i in range(3))
+        uv_map[(tuple(direction), signs)] = tuple(texcoord_reader.getData2())
+    face_uvs = numpy.zeros((6, 4, 2), dtype=numpy.float32)
+    for face, offset in enumerate(voxel.neighbour_offsets):
+        for corner, signs in enumerate(face_corners[face]):
+            face_uvs[face, corner] = uv_map.get((offset, tuple(int(s) for s in signs)), (0, 0))
+    return face_uvs
+
+
+def get_tile_uvs(face_uvs: numpy.ndarray) -> tuple:
+    '''Split each face's texture coordinates into its pixel rectangle in the block texture and the corner
+    coordinates within that rectangle, so a face texture can repeat across a merged quad.
+    Returns:
+        tuple: (6, 4) rectangles as u_min, v_min, u_max, v_max and the (6, 4, 2) corner coordinates from 0 to 1
+    '''
+    rects = numpy.zeros((6, 4), dtype=numpy.float32)
+    unit_uvs = numpy.zeros((6, 4, 2), dtype=numpy.float32)
+    for face in range(6):
+        uv_min = face_uvs[face].min(axis=0)
+        uv_max = face_uvs[face].max(axis=0)
+        rects[face] = (*uv_min, *uv_max)
+        unit_uvs[face] = numpy.round((face_uvs[face] - uv_min) / numpy.maximum(uv_max - uv_min, 1e-6))
+    return rects, unit_uvs
+
+
+def get_vertex_format() -> GeomVertexFormat:
+    '''Position, normal and texture coordinates, plus the texture array layer and light emission of the block.'''
+    array_format = GeomVertexArrayFormat()
+    array_format.addColumn(InternalName.getVertex(), 3, Geom.NT_float32, Geom.C_point)
+    array_format.addColumn(InternalName.getNormal(), 3, Geom.NT_float32, Geom.C_normal)
+    array_format.addColumn(InternalName.getTexcoord(), 2, Geom.NT_float32, Geom.C_texcoord)
+    array_format.addColumn(InternalName.make('block'), 2, Geom.NT_float32, Geom.C_other)
+    return GeomVertexFormat.registerFormat(GeomVertexFormat(array_format))
+
+
+vertex_format = get_vertex_format()
+vertex_columns = 10
+
+
+def get_model_texture(model: NodePath) -> Texture:
+    '''The texture on the first stage of a block model's geom.'''
+    state = model.find('**/+GeomNode').node().getGeomState(0)
+    texture_attrib = state.getAttrib(TextureAttrib)
+    if texture_attrib is None or texture_attrib.getNumOnStages() == 0:
+        return None
+    return texture_attrib.getOnTexture(texture_attrib.getOnStage(0))
+
+
+def get_face_pixels(image: PNMImage, rect: numpy.ndarray, width: int, height: int) -> numpy.ndarray:
+    '''Copy one face of a block texture, scaled to width by height, as RGBA bytes in Panda3D's texture memory
+    layout, BGRA with the bottom row first.'''
+    image_width, image_height = image.getXSize(), image.getYSize()
+    # The face rectangles are inset by a fraction of a pixel, so snap them to whole pixels
+    x = int(round(rect[0] * image_width))
+    y = int(round((1 - rect[3]) * image_height))
+    face_width = max(1, int(round((rect[2] - rect[0]) * image_width)))
+    face_height = max(1, int(round((rect[3] - rect[1]) * image_height)))
+    face_image = PNMImage(face_width, face_height, 4, 255)
+    face_image.copySubImage(image, 0, 0, x, y, face_width, face_height)
+    if not image.hasAlpha():
+        face_image.alphaFill(1.0)
+    if (face_width, face_height) != (width, height):
+        scaled = PNMImage(width, height, 4, 255)
+        scaled.quickFilterFrom(face_image)
+        face_image = scaled
+    pixels = numpy.empty((height, width, 4), dtype=numpy.uint8)
+    for row in range(height):
+        for column in range(width):
+            red, green, blue, alpha = face_image.getXelA(column, height - 1 - row)
+            pixels[row, column] = (blue * 255, green * 255, red * 255, alpha * 255)
+    return pixels
+
+
+class BlockTextureArray:
+    '''Every face texture of every block type as a layer of one 2D texture array, drawn with one shader.
+
+    The face textures are cut out of the cube net texture of each block type's model. Identical faces share a
+    layer, and chunk vertices carry their layer, so a whole chunk is one Geom with one render state.
+    '''
+
+    def __init__(self, registry: BlockRegistry, models: dict, shader: Shader, face_size: int = 16):
+        self.registry = registry
+        # Layer and corner texture coordinates per block ID and face direction
+        self.face_layers = numpy.zeros((max_block_types, 6), dtype=numpy.float32)
+        self.unit_uvs = numpy.zeros((max_block_types, 6, 4, 2), dtype=numpy.float32)
+        self.drawable = numpy.zeros(max_block_types, dtype=bool)
+        layers = []
+        layer_keys = {}
+        filters = None
+        for block_type in registry.types:
+            model = models.get(block_type.model)
+            if model is None:
+                continue
+            texture = get_model_texture(model)
+            if texture is None:
+                continue
+            if filters is None:
+                filters = texture.getMinfilter(), texture.getMagfilter()
+            image = PNMImage()
+            texture.store(image)
+            rects, self.unit_uvs[block_type.id] = get_tile_uvs(get_face_uvs(model))
+            for face in range(6):
+                pixels = get_face_pixels(image, rects[face], face_size, face_size)
+                key = pixels.tobytes()
+                if key not in layer_keys:
+                    layer_keys[key] = len(layers)
+                    layers.append(key)
+                self.face_layers[block_type.id, face] = layer_keys[key]
+            self.drawable[block_type.id] = True
+        self.layer_count = len(layers)
+        self.texture = Texture('block_textures')
+        self.texture.setup2dTextureArray(face_size, face_size, max(1, self.layer_count), Texture.T_unsigned_byte,
+                                         Texture.F_rgba8)
+        if layers:
+            self.texture.setRamImage(b''.join(layers))
+        self.texture.setWrapU(SamplerState.WM_repeat)
+        self.texture.setWrapV(SamplerState.WM_repeat)
+        if filters is not None:
+            self.texture.setMinfilter(filters[0])
+            self.texture.setMagfilter(filters[1])
+        # The chunk faces all point outwards, so the back faces can be culled
+        self.state = RenderState.make(CullFaceAttrib.makeDefault(),
+                                      ShaderAttrib.make(shader).setShaderInput('block_textures', self.texture))
+        print(f"block texture array: {self.layer_count} layers of {face_size}x{face_size}")
+
+
+def get_exposed_faces(world: voxel.VoxelWorld, chunk: voxel.Chunk) -> list:
+    '''Find the faces of blocks that are not hidden by an opaque neighbour or a neighbour of the same type, with
+    one vectorised neighbour test per direction.
+    Returns:
+        list: For each face direction the (n, 3) local block coordinates and the (n,) block IDs
+    '''
+    padded = world.get_padded_blocks(chunk)
+    size = chunk.size
+    blocks = chunk.blocks
+    filled = blocks != voxel.air
+    opaque = registry.opaque
+    faces = []
+    for dx, dy, dz in voxel.neighbour_offsets:
+        neighbour = padded[1 + dx:size + 1 + dx, 1 + dy:size + 1 + dy, 1 + dz:size + 1 + dz]
+        local = numpy.argwhere(filled & ~opaque[neighbour] & (neighbour != blocks))
+        faces.append((local, blocks[local[:, 0], local[:, 1], local[:, 2]]))
+    return faces
+
+
+def build_vertices(world: voxel.VoxelWorld, chunk: voxel.Chunk, textures: BlockTextureArray) -> numpy.ndarray:
+    '''Build the vertex rows of the exposed faces of a chunk, all block types together.
+    Returns:
+        numpy.ndarray: (n, 10) float32 rows of position, normal, texcoord, layer and emission, 4 per face
+    '''
+    origin = numpy.array(chunk.get_origin(), dtype=numpy.float32)
+    half = world.block_size / 2
+    parts = []
+    for face, (local, block_ids) in enumerate(get_exposed_faces(world, chunk)):
+        drawn = textures.drawable[block_ids]
+        local, block_ids = local[drawn], block_ids[drawn]
+        if len(local) == 0:
+            continue
+        centres = (origin + local) * world.block_size
+        vertices = numpy.empty((len(local), 4, vertex_columns), dtype=numpy.float32)
+        vertices[:, :, 0:3] = centres[:, None, :] + face_corners[face] * half
+        vertices[:, :, 3:6] = face_normals[face]
+        vertices[:, :, 6:8] = textures.unit_uvs[block_ids, face]
+        vertices[:, :, 8] = textures.face_layers[block_ids, face][:, None]
+        vertices[:, :, 9] = textures.registry.light_emission[block_ids][:, None]
+        parts.append(vertices.reshape(-1, vertex_columns))
+    if not parts:
+        return numpy.zeros((0, vertex_columns), dtype=numpy.float32)
+    return numpy.concatenate(parts)
+
+
+def get_quad_indices(vertex_count: int) -> numpy.ndarray:
+    quad_count = vertex_count // 4
+    return (quad_indices[None, :] + (numpy.arange(quad_count, dtype=numpy.uint32) * 4)[:, None]).ravel()
+
+
+def make_geom(vertices: numpy.ndarray, indices: numpy.ndarray) -> Geom:
+    '''Copy the vertex rows and triangle indices into a Geom without a Python loop per vertex.'''
+    vertex_data = GeomVertexData('chunk', vertex_format, Geom.UHStatic)
+    vertex_data.uncleanSetNumRows(len(vertices))
+    memoryview(vertex_data.modifyArray(0)).cast('B')[:] = vertices.tobytes()
+    triangles = GeomTriangles(Geom.UHStatic)
+    triangles.setIndexType(Geom.NT_uint32)
+    index_array = triangles.modifyVertices()
+    index_array.uncleanSetNumRows(len(indices))
+    memoryview(index_array).cast('B')[:] = indices.tobytes()
+    geom = Geom(vertex_data)
+    geom.addPrimitive(triangles)
+    return geom
+
+
+def get_greedy_quads(mask: numpy.ndarray) -> list:
+    '''Merge equal neighbouring cells of a 2D array of block IDs into rectangles, 0 is empty.
+    Returns:
+        list: Rectangles as (block_id, u, v, width, height)
+    '''
+    mask = mask.copy()
+    size_u, size_v = mask.shape
+    quads = []
+    for u, v in numpy.argwhere(mask):
+        block_id = mask[u, v]
+        if block_id == voxel.air:
+            # Already merged into an earlier rectangle
+            continue
+        # Grow along v, then add rows along u while the whole row matches
+        row = mask[u, v:]
+        height = int(numpy.argmin(numpy.append(row == block_id, False)))
+        width = 1
+        while u + width < size_u and (mask[u + width, v:v + height] == block_id).all():
+            width += 1
+        mask[u:u + width, v:v + height] = voxel.air
+        quads.append((int(block_id), int(u), int(v), width, height))
+    return quads
+
+
+def get_tile_corner_uvs(unit_uvs: numpy.ndarray, steps_u: numpy.ndarray, steps_v: numpy.ndarray,
+                        width: int, height: int) -> numpy.ndarray:
+    '''Stretch a face's corner coordinates over a width by height rectangle, keeping the face orientation.
+    Args:
+        unit_uvs (numpy.ndarray): (4, 2) corner coordinates of one block face from 0 to 1
+        steps_u, steps_v (numpy.ndarray): (4,) 0 or 1 for each corner's side of the face along u and v
+        width, height (int): Rectangle size in blocks along u and v
+    Returns:
+        numpy.ndarray: (4, 2) corner coordinates repeating the face texture once per block
+    '''
+    corner = {(int(a), int(b)): unit_uvs[i] for i, (a, b) in enumerate(zip(steps_u, steps_v))}
+    uv_origin = corner[(0, 0)]
+    uv_u = corner[(1, 0)] - uv_origin
+    uv_v = corner[(0, 1)] - uv_origin
+    return uv_origin + uv_u * (steps_u * width)[:, None] + uv_v * (steps_v * height)[:, None]
+
+
+def build_greedy_vertices(world: voxel.VoxelWorld, chunk: voxel.Chunk, textures: BlockTextureArray) -> numpy.ndarray:
+    '''Build the vertex rows of the exposed faces merged into the largest rectangles per slice.
+    Returns:
+        numpy.ndarray: (n, 10) float32 rows as in build_vertices, texture coordinates repeat once per block
+    '''
+    size = chunk.size
+    origin = numpy.array(chunk.get_origin(), dtype=numpy.float32)
+    half = world.block_size / 2
+    parts = []
+    for face, (local, block_ids) in enumerate(get_exposed_faces(world, chunk)):
+        if len(local) == 0:
+            continue
+        offset = voxel.neighbour_offsets[face]
+        axis = next(i for i in range(3) if offset[i] != 0)
+        u_axis, v_axis = (axis + 1) % 3, (axis + 2) % 3
+        exposed = numpy.zeros((size, size, size), dtype=numpy.uint8)
+        exposed[local[:, 0], local[:, 1], local[:, 2]] = block_ids
+        # Slices across the face axis, indexed [u, v] within each slice
+        slices = exposed.transpose(axis, u_axis, v_axis)
+        corners = face_corners[face]
+        # Corners at -1 stay on the first block, corners at +1 move to the last block of the rectangle
+        steps = (corners > 0).astype(numpy.float32)
+        for layer in numpy.unique(local[:, axis]):
+            for block_id, u, v, width, height in get_greedy_quads(slices[layer]):
+                if not textures.drawable[block_id]:
+                    continue
+                low = numpy.zeros(3, dtype=numpy.float32)
+                low[axis], low[u_axis], low[v_axis] = layer, u, v
+                extent = numpy.ones(3, dtype=numpy.float32)
+                extent[u_axis], extent[v_axis] = width, height
+                vertices = numpy.empty((4, vertex_columns), dtype=numpy.float32)
+                block_position = low + steps * (extent - 1)
+                vertices[:, 0:3] = (origin + block_position) * world.block_size + corners * half
+                vertices[:, 3:6] = face_normals[face]
+                vertices[:, 6:8] = get_tile_corner_uvs(textures.unit_uvs[block_id, face], steps[:, u_axis],
+                                                       steps[:, v_axis], width, height)
+                vertices[:, 8] = textures.face_layers[block_id, face]
+                vertices[:, 9] = textures.registry.light_emission[block_id]
+                parts.append(vertices)
+    if not parts:
+        return numpy.zeros((0, vertex_columns), dtype=numpy.float32)
+    return numpy.concatenate(parts)
+
+
+def build_chunk_mesh(world: voxel.VoxelWorld, chunk: voxel.Chunk, textures: BlockTextureArray,
+                     greedy: bool = False) -> GeomNode:
+    '''Build one GeomNode with one Geom for a chunk, with only the faces that can be seen.
+    Args:
+        world (VoxelWorld): World holding the chunk and its neighbours
+        chunk (Chunk): Chunk to mesh
+        textures (BlockTextureArray): Texture layers of the block types and the render state of the chunks
+        greedy (bool): Merge coplanar faces of the same block type into larger quads
+    Returns:
+        GeomNode: Chunk mesh in world coordinates
+    '''
+    geom_node = GeomNode(f'chunk_mesh_{chunk.position[0]}_{chunk.position[1]}_{chunk.position[2]}')
+    if greedy:
+        vertices = build_greedy_vertices(world, chunk, textures)
+    else:
+        vertices = build_vertices(world, chunk, textures)
+    if len(vertices):
+        geom_node.addGeom(make_geom(vertices, get_quad_indices(len(vertices))), textures.state)
+    return geom_node
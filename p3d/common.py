@@ -4,6 +4,7 @@ from panda3d.core import loadPrcFile
 from panda3d.core import DirectionalLight
 from panda3d.core import AmbientLight
 from panda3d.core import WindowProperties
+from panda3d.core import Shader
 from direct.gui.OnscreenText import OnscreenText, TextNode
 import os
 
@@ -12,6 +13,7 @@ asset_dir = "asset"
 full_model_dir = f"{asset_dir}/model"
 full_sky_box_dir = f"{asset_dir}/sky_box"
 full_image_dir = f"{asset_dir}/image"
+full_shader_dir = f"{asset_dir}/shader"
 
 
 def load_prc_file():
@@ -75,6 +77,20 @@ def load_models(self: ShowBase, model_dir: str = None, model_type: str = "glb")
         print(f"loaded model: {model_name}")
 
 
+def load_shader(name: str, shader_dir: str = None) -> Shader:
+    '''Load a GLSL shader from a vertex and fragment file pair
+    Args:
+        name (str): File name of both files without the extension
+        shader_dir (str): Directory to load the shader from
+    Returns:
+        Shader: The shader, None when it failed to load
+    '''
+    source_path = full_shader_dir if shader_dir is None else shader_dir
+    shader = Shader.load(Shader.SL_GLSL, vertex=f"{source_path}/{name}.vert", fragment=f"{source_path}/{name}.frag")
+    print(f"loaded shader: {name}")
+    return shader
+
+
 def load_images(self: ShowBase, image_dir: str = None, image_type: str = "png", image_scale: float = 1.0) -> None:
     '''Load images from the specified directory
     Args:
@@ -0,0 +1,70 @@
+class FixedStepLoop:
+    '''Run a simulation tick at a fixed rate from a variable frame rate loop.
+
+    Frame time goes into an accumulator and the tick runs once per whole step in it, so the simulation does the
+    same work and gets the same results at any frame rate. The leftover fraction of a step is returned as alpha,
+    to draw transforms between the previous and current tick. After a long frame at most max_steps ticks run and
+    the rest of the backlog is dropped, so a slow frame cannot cause an ever slower catch up.
+    '''
+
+    def __init__(self, tick, step: float = 1 / 60, max_steps: int = 8):
+        '''
+        Args:
+            tick (callable): Called with the step in seconds for each simulation tick
+            step (float): Simulation step in seconds
+            max_steps (int): Most ticks run in one frame
+        '''
+        self.tick = tick
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.alpha = 0.0
+        self.tick_count = 0
+        self.dropped_time = 0.0
+        self.last_time = None
+
+    def advance(self, frame_time: float) -> float:
+        '''Run the ticks due after frame_time seconds.
+        Returns:
+            float: Interpolation factor from 0 at the previous tick to 1 at the current one
+        '''
+        self.accumulator += max(frame_time, 0.0)
+        steps = 0
+        while self.accumulator >= self.step and steps < self.max_steps:
+            self.tick(self.step)
+            self.accumulator -= self.step
+            steps += 1
+        self.tick_count += steps
+        if self.accumulator >= self.step:
+            self.dropped_time += self.accumulator - self.accumulator % self.step
+            self.accumulator %= self.step
+        self.alpha = self.accumulator / self.step
+        return self.alpha
+
+    def advance_to(self, time: float) -> float:
+        '''Advance to an absolute clock time in seconds, the first call only starts the clock.'''
+        frame_time = 0.0 if self.last_time is None else time - self.last_time
+        self.last_time = time
+        return self.advance(frame_time)
+
+    def reset(self):
+        '''Forget the accumulated time, after a pause or a teleport.'''
+        self.accumulator = 0.0
+        self.alpha = 0.0
+        self.last_time = None
+
+    def add_task(self, task_mgr, name: str = "fixed_step", render=None, sort: int = 0):
+        '''Drive the loop from a Panda3D task manager, calling render with alpha after the ticks of each frame.'''
+        def update(task):
+            alpha = self.advance_to(task.time)
+            if render is not None:
+                render(alpha)
+            return task.cont
+        return task_mgr.add(update, name, sort=sort)
+
+
+def interpolate(previous, current, alpha: float):
+    '''Blend two states, numbers, vectors or arrays that support arithmetic, or lists and tuples of those.'''
+    if isinstance(current, (list, tuple)):
+        return type(current)(interpolate(p, c, alpha) for p, c in zip(previous, current))
+    return previous + (current - previous) * alpha
@@ -1,15 +1,24 @@
 from direct.showbase.ShowBase import ShowBase
 from direct.gui.OnscreenImage import OnscreenImage
-from panda3d.core import CollisionTraverser, CollisionNode, CollisionBox, CollisionSphere, CollisionRay, CollisionHandlerQueue
 from panda3d.physics import ForceNode, LinearVectorForce, PhysicsCollisionHandler, PhysicsManager, PhysicsObject, AngularVectorForce, PhysicsCollisionHandler, ActorNode
 from panda3d.core import ClockObject
 from panda3d.core import DirectionalLight
 from panda3d.core import AmbientLight
 from panda3d.core import TransparencyAttrib
+from panda3d.core import Vec3
 from panda3d.core import WindowProperties
 
+import blocks
+import chunk_mesh
 import common
 import math
+import os
+import region
+import terrain_gen
+import time
+import voxel
+from fixed_step import FixedStepLoop, interpolate
+from player import PlayerController
 
 
 block_size: int = 2
@@ -28,13 +37,29 @@ world_bounds_z = -8
 
 start_z = 4
 
-camera_width = 1
-camera_radius = 2.0
-soft_radius = 1.9
-hard_radius = 1.75
-soft_scaler = 0.5
+# Player box around the camera, from the feet at eye height below to the top of the head
+player_half_width = 0.6
+player_eye_height = 3.0
+player_head_height = 0.4
 
-frame_lock = 1 / 120
+# Fixed physics timestep, decoupled from the render rate, the camera is drawn between the last two steps
+physics_step = 1 / 120
+max_physics_steps = 8
+
+# Merge coplanar faces of the same block type into larger quads when meshing chunks
+greedy_meshing = True
+
+# Noise terrain streamed in around the camera by worker processes, or the flat slab when False
+procedural_terrain = True
+world_seed = 1
+view_radius = 4
+chunk_z_range = (-1, 1)
+chunk_workers = None
+max_meshes_per_frame = 4
+
+# Edited chunks are saved in region files under this directory, on a background thread
+save_directory = "save"
+autosave_interval = 30.0
 
 
 key_map = [
@@ -49,12 +74,13 @@ key_map = [
 
 class Application(ShowBase):
 
-    jump_velocity = 0
     place_block_type = 'grass'
-    dt_counter = 0
+    move_input = (0.0, 0.0)
     last_time = 0.0
+    last_save_time = 0.0
 
     free_look = False
+    greedy_meshing = greedy_meshing
 
     def __init__(self):
         ShowBase.__init__(self)
@@ -67,8 +93,21 @@ class Application(ShowBase):
         common.add_directional_light(self)
         common.add_ambient_light(self)
 
-        self.generate_terrain()
-        self.setup_fps_camera()
+        # Voxel world, blocks are stored in chunk arrays and each chunk is one merged mesh in the scene graph
+        self.world = voxel.VoxelWorld(block_size)
+        self.chunk_nodes = {}
+        # Every block face is a layer of one texture array, so each chunk is one Geom drawn with one shader
+        self.block_textures = chunk_mesh.BlockTextureArray(blocks.registry, self.models, common.load_shader("block"))
+        self.spawn_position = (0, 0, start_z)
+        self.world_bounds_z = world_bounds_z
+        self.streamer = None
+        world_name = f"seed_{world_seed}" if procedural_terrain else "flat"
+        self.store = region.RegionStore(os.path.join(save_directory, world_name), self.world.chunk_size)
+        if procedural_terrain:
+            self.setup_streaming()
+        else:
+            self.generate_terrain()
+        self.setup_fps_camera(self.spawn_position)
         self.setup_controls()
 
         # Add game update task to the task manager
@@ -84,157 +123,66 @@ class Application(ShowBase):
         self.on_screen_keys_4 = common.add_text_object(self, text="f1 : toggle free look", pos=(0.9, 0.6))
         self.on_screen_keys_5 = common.add_text_object(self, text="space : jump", pos=(0.9, 0.5))
         self.on_screen_keys_6 = common.add_text_object(self, text="ctrl : down in free look", pos=(0.9, 0.4))
+        self.on_screen_keys_7 = common.add_text_object(self, text="f2 : toggle greedy meshing", pos=(0.9, 0.3))
+        self.on_screen_keys_8 = common.add_text_object(self, text="f5 : save world", pos=(0.9, 0.2))
 
     def game_update(self, task):
         if task.time == 0.0:
             print("game update started")
             return task.cont
         self.last_time = task.time
+        if task.time - self.last_save_time >= autosave_interval:
+            self.last_save_time = task.time
+            self.save_world()
 
         # dt = globalClock.getDt()  # The Panda3D way form the samples
         dt = ClockObject.getGlobalClock().getDt()  # Cleaner dt from the clock
         # dt = task.time - self.last_time  # Third way to get dt
 
-        # Frame lock Testing
-        # self.dt_counter += dt
-        # if self.dt_counter < frame_lock:
-        #     return task.cont
-        # self.dt_counter -= frame_lock
-        # dt = frame_lock
-
-        # Movement
+        # Wanted movement direction from the camera heading
         x_movement = 0
         y_movement = 0
-        z_movement = 0
-        c_x = self.camera.getX()
-        c_y = self.camera.getY()
-        c_z = self.camera.getZ()
         c_h = math.radians(self.camera.getH())
         cos_c_h = math.cos(c_h)
         sin_c_h = math.sin(c_h)
         if self.key_state['forward']:
-            x_movement -= dt * camera_move_speed * sin_c_h
-            y_movement += dt * camera_move_speed * cos_c_h
+            x_movement -= sin_c_h
+            y_movement += cos_c_h
         if self.key_state['backward']:
-            x_movement += dt * camera_move_speed * sin_c_h
-            y_movement -= dt * camera_move_speed * cos_c_h
+            x_movement += sin_c_h
+            y_movement -= cos_c_h
         if self.key_state['left']:
-            x_movement -= dt * camera_move_speed * cos_c_h
-            y_movement -= dt * camera_move_speed * sin_c_h
+            x_movement -= cos_c_h
+            y_movement -= sin_c_h
         if self.key_state['right']:
-            x_movement += dt * camera_move_speed * cos_c_h
-            y_movement += dt * camera_move_speed * sin_c_h
-
-        # Collision detection
-        num_hits = 0
-        if self.free_look == False and self.cTrav2 is not None:
-            self.cTrav2.traverse(self.render)
-            num_hits = self.camera_collision_queue.getNumEntries()
-            hit_xyz = []
-            if num_hits > 0:
-                # self.camera_collision_queue.sortEntries()
-                for i in range(num_hits):
-                    hit = self.camera_collision_queue.getEntry(i)
-                    hit_path = hit.getIntoNodePath()
-                    hit_object = hit_path.getPythonTag('owner')
-                    hit_block_position = hit_object.getPos()
-                    hit_xyz.append(hit_block_position)
-        # Gravity and Jump
-        if self.free_look == False:
-            if self.jump_velocity > 0:
-                if num_hits > 0:
-                    continue_jump = True
-                    if continue_jump:
-                        self.jump_velocity -= dt * gravity
-                        z_movement += dt * self.jump_velocity
-                        # print(f"jumping {round(self.jump_velocity, 2)}")
-                else:
-                    self.jump_velocity -= dt * gravity
-                    z_movement += dt * self.jump_velocity
-                    # print(f"jumping {round(self.jump_velocity, 2)}")
-            elif self.key_state['up'] and self.jump_velocity == 0:
-                self.jump_velocity = jump_speed
-                # print(f"start jump {round(self.jump_velocity, 2)}")
-            else:
-                current_grid = self.camera.getPos() // block_size
-                if current_grid.z < world_bounds_z:
-                    self.camera.setZ(world_bounds_z)
-                    self.jump_velocity = 0
-                    c_x, c_y = 0, 0
-                    c_z = start_z
-                    # print(f"world bounds x{current_grid.x} y{current_grid.y} z{current_grid.z}")
-                add_velocity = True
-                if num_hits > 0:
-                    for this_xyz in hit_xyz:
-                        if this_xyz[2] <= c_z:
-                            self.jump_velocity = 0
-                            add_velocity = False
-                            # print(f"hit ground {this_xyz[2]} <= {round(c_z, 2)}")
-                            break
-                if add_velocity:
-                    self.jump_velocity -= dt * gravity
-                    z_movement += dt * self.jump_velocity
-        else:
+            x_movement += cos_c_h
+            y_movement += sin_c_h
+        length = math.sqrt(x_movement ** 2 + y_movement ** 2)
+        if length > 1:
+            x_movement /= length
+            y_movement /= length
+
+        if self.streamer is not None:
+            self.update_streaming()
+
+        if self.free_look:
+            z_movement = 0
             if self.key_state['up']:
-                z_movement += dt * camera_move_speed
+                z_movement += 1
             if self.key_state['down']:
-                z_movement -= dt * camera_move_speed
-
-            # Soft and hard collision
-        if num_hits > 0:
-            for this_xyz in hit_xyz:
-                collision_stop = False
-                hit_delta_x = abs(c_x + x_movement - this_xyz[0])
-                hit_delta_y = abs(c_y + y_movement - this_xyz[1])
-                hit_delta_z = abs(c_z + z_movement - this_xyz[2])
-                hit_delta_x2 = abs(c_x - this_xyz[0])
-                hit_delta_y2 = abs(c_y - this_xyz[1])
-                hit_delta_z2 = abs(c_z - this_xyz[2])
-                hit_distance_x = math.sqrt(hit_delta_x ** 2 + hit_delta_y2 ** 2 + hit_delta_z2 ** 2)
-                # if this_xyz[2] == c_z_block:
-                if hit_distance_x <= soft_radius:
-                    x_movement *= soft_scaler ** 2
-                    y_movement *= soft_scaler
-                    if self.jump_velocity > 0:
-                        z_movement *= soft_scaler ** 2
-                        self.jump_velocity -= dt * gravity
-                    collision_stop = True
-                    # print(f"soft x {round(hit_distance_x, 2)} < {soft_radius}")
-                hit_distance_y = math.sqrt(hit_delta_x2 ** 2 + hit_delta_y ** 2 + hit_delta_z2 ** 2)
-                if hit_distance_y <= soft_radius:
-                    x_movement *= soft_scaler
-                    y_movement *= soft_scaler ** 2
-                    if self.jump_velocity > 0:
-                        z_movement *= soft_scaler ** 2
-                        self.jump_velocity -= dt * gravity
-                    collision_stop = True
-                    # print(f"soft y {round(hit_distance_y, 2)} < {soft_radius}")
-                hit_distance_z = math.sqrt(hit_delta_x2 ** 2 + hit_delta_y2 ** 2 + hit_delta_z ** 2)
-                if hit_distance_z <= soft_radius:
-                    x_movement *= soft_scaler ** 2
-                    y_movement *= soft_scaler ** 2
-                    if self.jump_velocity > 0:
-                        z_movement *= soft_scaler ** 2
-                        self.jump_velocity -= dt * gravity
-                    collision_stop = True
-                    # print(f"soft z {round(hit_distance_z, 2)} < {soft_radius}")
-                hit_distance = math.sqrt(hit_delta_x ** 2 + hit_delta_y ** 2 + hit_delta_z ** 2)
-                if hit_distance <= hard_radius:
-                    x_movement = 0
-                    y_movement = 0
-                    z_movement = 0
-                    self.jump_velocity = 0
-                    collision_stop = True
-                    # print(f"hit xyx {round(hit_distance, 2)} < {hard_radius}")
-                if collision_stop == True:
-                    break
-
-        self.camera.setPos(
-            c_x + x_movement,
-            c_y + y_movement,
-            c_z + z_movement,
-        )
-        # print(f"x {x_movement} y {y_movement} z {z_movement} jump {self.jump_velocity}")
+                z_movement -= 1
+            self.camera.setPos(self.camera.getPos() + Vec3(x_movement, y_movement, z_movement) * dt * camera_move_speed)
+            self.player.position = list(self.camera.getPos())
+            self.player.velocity = [0.0, 0.0, 0.0]
+            self.hold_player()
+        elif self.streamer is not None and not self.streamer.is_loaded(self.get_player_block()):
+            # Hold the player still until the chunk under them has been generated
+            self.hold_player()
+        else:
+            # Fixed physics steps, the rest of the frame time carries over to the next frame
+            self.move_input = (x_movement, y_movement)
+            alpha = self.physics_loop.advance(dt)
+            self.camera.setPos(*interpolate(self.previous_player_position, self.player.position, alpha))
 
         # Look around
         mouse_pointer = self.mouseWatcherNode
@@ -289,16 +237,96 @@ class Application(ShowBase):
         return task.cont
 
     def generate_terrain(self, size: tuple = (16, 16, 8)):
-        last_z = size[2] - 1
-        for z in range(size[2]):
-            for x in range(size[0]):
-                for y in range(size[1]):
-                    if z == 0:
-                        self.create_block(x * block_size - size[0], y * block_size - size[1], -z * block_size, "grass")
-                    elif z == last_z:
-                        self.create_block(x * block_size - size[0], y * block_size - size[1], -z * block_size, "stone")
-                    else:
-                        self.create_block(x * block_size - size[0], y * block_size - size[1], -z * block_size, "dirt")
+        # Block coordinates of the same slab as before: x and y centred on the origin, z from 0 down
+        start_x, start_y = -size[0] // 2, -size[1] // 2
+        end_x, end_y = start_x + size[0] - 1, start_y + size[1] - 1
+        last_z = -(size[2] - 1)
+        self.world.fill((start_x, start_y, 0), (end_x, end_y, 0), voxel.block_ids["grass"])
+        self.world.fill((start_x, start_y, last_z + 1), (end_x, end_y, -1), voxel.block_ids["dirt"])
+        self.world.fill((start_x, start_y, last_z), (end_x, end_y, last_z), voxel.block_ids["stone"])
+        # The generated slab is rebuilt on every start, only edits need saving
+        self.world.take_modified()
+        saved_positions = self.store.get_positions()
+        for position in saved_positions:
+            self.world.set_chunk(position, self.store.load_chunk(position))
+        self.update_chunks()
+        print(f"generated terrain: {len(self.world.chunks)} chunks, {len(saved_positions)} loaded from save, "
+              f"{self.world.get_memory_size()} bytes")
+
+    def setup_streaming(self):
+        self.streamer = terrain_gen.ChunkStreamer(self.world, seed=world_seed, view_radius=view_radius,
+                                                  chunk_z_range=chunk_z_range, workers=chunk_workers,
+                                                  store=self.store)
+        # Stand on the surface at the origin, and fall back there from below the bedrock
+        surface_z = self.streamer.get_spawn_height(0, 0)
+        self.spawn_position = (0, 0, surface_z * block_size + block_size // 2 + player_eye_height)
+        self.world_bounds_z = terrain_gen.bedrock_z - 1
+        memory = terrain_gen.get_memory_estimate(view_radius, chunk_z_range, self.world.chunk_size)
+        print(f"streaming terrain: seed {world_seed}, view radius {view_radius} chunks, up to {memory} bytes of blocks")
+
+    def update_streaming(self):
+        '''Take in finished chunks, drop the far ones and mesh a few dirty chunks per frame.'''
+        for position in self.streamer.update(self.get_player_block()):
+            node = self.chunk_nodes.pop(position, None)
+            if node is not None:
+                node.removeNode()
+        self.update_chunks(max_meshes_per_frame)
+
+    def get_player_block(self) -> tuple:
+        '''Block coordinates at the player's feet.'''
+        x, y, z = self.player.position
+        return self.world.world_to_block((x, y, z - player_eye_height))
+
+    def update_chunks(self, limit: int = None):
+        '''Mesh the dirty chunks, or only the limit nearest to the player to spread the work over frames.'''
+        dirty = self.world.get_dirty_chunks()
+        if limit is not None and len(dirty) > limit:
+            centre = self.world.get_chunk_position(*self.get_player_block())
+            dirty.sort(key=lambda chunk: sum((chunk.position[i] - centre[i]) ** 2 for i in range(3)))
+            dirty = dirty[:limit]
+        for chunk in dirty:
+            self.build_chunk_node(chunk)
+
+    def build_chunk_node(self, chunk: voxel.Chunk):
+        '''Replace the chunk's node with a merged mesh of its faces exposed to air.'''
+        old_node = self.chunk_nodes.pop(chunk.position, None)
+        if old_node is not None:
+            old_node.removeNode()
+        chunk.dirty = False
+        if chunk.is_empty():
+            return
+        mesh_start = time.perf_counter()
+        mesh = chunk_mesh.build_chunk_mesh(self.world, chunk, self.block_textures, greedy=self.greedy_meshing)
+        mesh_time = (time.perf_counter() - mesh_start) * 1000
+        vertex_count = sum(mesh.getGeom(i).getVertexData().getNumRows() for i in range(mesh.getNumGeoms()))
+        print(f"meshed chunk {chunk.position}: {vertex_count} vertices, {mesh.getNumGeoms()} geoms, {mesh_time:.2f} ms")
+        self.chunk_nodes[chunk.position] = self.render.attachNewNode(mesh)
+
+    def save_world(self):
+        '''Hand copies of the modified chunks to the store's background thread.'''
+        modified = self.world.take_modified()
+        if modified:
+            self.store.save_async(modified)
+
+    def userExit(self):
+        if self.streamer is not None:
+            self.streamer.destroy()
+        self.save_world()
+        self.store.close()
+        ShowBase.userExit(self)
+
+    def physics_tick(self, dt: float):
+        self.previous_player_position = list(self.player.position)
+        self.player.step(dt, *self.move_input, self.key_state['up'])
+        if self.player.position[2] // block_size < self.world_bounds_z:
+            self.player.position = list(self.spawn_position)
+            self.player.velocity = [0.0, 0.0, 0.0]
+            self.previous_player_position = list(self.player.position)
+
+    def hold_player(self):
+        '''Stop the simulation clock, it starts again from the current position.'''
+        self.physics_loop.reset()
+        self.previous_player_position = list(self.player.position)
 
     def setup_window(self):
         props = WindowProperties()
@@ -314,25 +342,13 @@ class Application(ShowBase):
         crosshair = self.images["crosshair"]
         crosshair.setScale(0.05)
         crosshair.setTransparency(TransparencyAttrib.MAlpha)
-        # Setup collision detection for the camera line of sight
-        self.cTrav = CollisionTraverser()
-        ray = CollisionRay()
-        ray.setFromLens(self.camNode, (0, 0))
-        ray_node = CollisionNode("camera_line_of_sight")
-        ray_node.addSolid(ray)
-        ray_node.setIntoCollideMask(0)
-        ray_node_path = self.camera.attachNewNode(ray_node)
-        self.ray_queue = CollisionHandlerQueue()
-        self.cTrav.addCollider(ray_node_path, self.ray_queue)
-        # self.cTrav.showCollisions(self.render)
-        # Setup collision detection for below the camera for gravity using a CollisionSphere
-        self.cTrav2 = CollisionTraverser()
-        camera_collider_node = CollisionNode("camera_collision")
-        camera_collider_node.addSolid(CollisionSphere(0, 0, 0, camera_radius))
-        camera_collider = self.camera.attachNewNode(camera_collider_node)
-        self.camera_collision_queue = CollisionHandlerQueue()
-        self.cTrav2.addCollider(camera_collider, self.camera_collision_queue)
-        # self.cTrav2.showCollisions(self.render)
+        # The camera line of sight is walked through the voxel grid on click, see get_ray_hit
+        # The player box collides with the voxel grid, see PlayerController
+        self.player = PlayerController(self.world, position, half_width=player_half_width,
+                                       eye_height=player_eye_height, head_height=player_head_height,
+                                       gravity=gravity, jump_speed=jump_speed, move_speed=camera_move_speed)
+        self.previous_player_position = list(self.player.position)
+        self.physics_loop = FixedStepLoop(self.physics_tick, physics_step, max_physics_steps)
 
     def capture_mouse(self):
         mouse_pointer = self.mouseWatcherNode
@@ -366,92 +382,44 @@ class Application(ShowBase):
         if key in self.key_state:
             self.key_state[key] = value
 
+    def get_ray_hit(self):
+        '''Get the block hit by the camera ray and the face normal, or None when nothing is in reach.'''
+        # Grid traversal through the block arrays, the cost depends on the reach and not on the number of blocks
+        origin = self.camera.getPos(self.render)
+        direction = self.render.getRelativeVector(self.camera, (0, 1, 0))
+        return self.world.raycast(origin, direction, interaction_distance)
+
     def remove_block(self):
-        if self.ray_queue.getNumEntries() > 0:
-            self.ray_queue.sortEntries()
-            for i in range(self.ray_queue.getNumEntries()):
-                ray_hit = self.ray_queue.getEntry(i)
-                hit_path = ray_hit.getIntoNodePath()
-                # normal = ray_hit.getSurfaceNormal(hit_path)
-                hit_object = hit_path.getPythonTag('owner')
-                if hit_object is not None:
-                    distance_from_camera = hit_object.getDistance(self.camera)
-                    if distance_from_camera < interaction_distance:
-                        hit_path.clearPythonTag("owner")
-                        hit_object.removeNode()
-                    break
+        hit = self.get_ray_hit()
+        if hit is not None:
+            hit_block, _normal = hit
+            self.world.set_block(*hit_block, voxel.air)
+            self.update_chunks()
 
     def create_block(self, x: int, y: int, z: int, type: str):
-        new_block = self.render.attachNewNode('block')
-        new_block.setPos(x, y, z)
-        if type == 'grass':
-            self.models["grass"].instanceTo(new_block)
-        elif type == 'dirt':
-            self.models["dirt"].instanceTo(new_block)
-        elif type == 'sand':
-            self.models["sand"].instanceTo(new_block)
-        elif type == 'stone':
-            self.models["stone"].instanceTo(new_block)
-        block_solid = CollisionBox((-1, -1, -1), (1, 1, 1))
-        # block_solid = CollisionSphere(0, 0, 0, 1)
-        block_node = CollisionNode(f'{x}_{y}_{z}')
-        block_node.addSolid(block_solid)
-        collider = new_block.attachNewNode(block_node)
-        collider.setPythonTag('owner', new_block)
+        self.world.set_block(*self.world.world_to_block((x, y, z)), voxel.block_ids[type])
+        self.update_chunks()
+
+    def get_place_position(self):
+        '''Get the world position for a new block against the face in view, or None when it would hit the player.'''
+        hit = self.get_ray_hit()
+        if hit is None:
+            return None
+        hit_block, normal = hit
+        new_block = tuple(hit_block[i] + normal[i] for i in range(3))
+        if self.player.intersects_block(new_block):
+            return None
+        return self.world.block_to_world(*new_block)
 
     def place_block(self):
-        if self.ray_queue.getNumEntries() > 0:
-            self.ray_queue.sortEntries()
-            c_x = self.camera.getX()
-            c_y = self.camera.getY()
-            c_z = self.camera.getZ()
-            c_x_block = round(c_x / block_size) * block_size
-            c_y_block = round(c_y / block_size) * block_size
-            c_z_block = round(c_z / block_size) * block_size
-            for i in range(self.ray_queue.getNumEntries()):
-                ray_hit = self.ray_queue.getEntry(i)
-                hit_path = ray_hit.getIntoNodePath()
-                normal = ray_hit.getSurfaceNormal(hit_path)
-                hit_object = hit_path.getPythonTag('owner')
-                if hit_object is not None:
-                    distance_from_camera = hit_object.getDistance(self.camera)
-                    if distance_from_camera < interaction_distance:
-                        hit_block_position = hit_object.getPos()
-                        new_position = hit_block_position + normal * 2
-                        delta_x = abs(c_x_block - new_position.x)
-                        delta_y = abs(c_y_block - new_position.y)
-                        delta_z = abs(c_z_block - new_position.z)
-                        distance = math.sqrt(delta_x ** 2 + delta_y ** 2 + delta_z ** 2)
-                        if distance > camera_radius:
-                            self.create_block(new_position.x, new_position.y, new_position.z, self.place_block_type)
-                    break
+        new_position = self.get_place_position()
+        if new_position is not None:
+            self.create_block(*new_position, self.place_block_type)
 
     def place_test(self):
-        if self.ray_queue.getNumEntries() > 0:
-            self.ray_queue.sortEntries()
-            c_x = self.camera.getX()
-            c_y = self.camera.getY()
-            c_z = self.camera.getZ()
-            c_x_block = round(c_x / block_size) * block_size
-            c_y_block = round(c_y / block_size) * block_size
-            c_z_block = round(c_z / block_size) * block_size
-            for i in range(self.ray_queue.getNumEntries()):
-                ray_hit = self.ray_queue.getEntry(i)
-                hit_path = ray_hit.getIntoNodePath()
-                normal = ray_hit.getSurfaceNormal(hit_path)
-                hit_object = hit_path.getPythonTag('owner')
-                if hit_object is not None:
-                    distance_from_camera = hit_object.getDistance(self.camera)
-                    if distance_from_camera < interaction_distance:
-                        hit_block_position = hit_object.getPos()
-                        new_position = hit_block_position + normal * 2
-                        delta_x = abs(c_x_block - new_position.x)
-                        delta_y = abs(c_y_block - new_position.y)
-                        delta_z = abs(c_z_block - new_position.z)
-                        distance = math.sqrt(delta_x ** 2 + delta_y ** 2 + delta_z ** 2)
-                        if distance > camera_radius:
-                            print(f"test {distance}")
-                    break
+        new_position = self.get_place_position()
+        if new_position is not None:
+            print(f"test {new_position}")
 
     def handle_mouse_click(self):
         self.capture_mouse()
@@ -462,6 +430,13 @@ class Application(ShowBase):
         self.on_screen_status.setText(f"block: {self.place_block_type}, free_look: {1 if self.free_look else 0}")
         print(f"selected block type: {block_type}")
 
+    def toggle_greedy_meshing(self):
+        self.greedy_meshing = not self.greedy_meshing
+        print(f"greedy meshing: {self.greedy_meshing}")
+        for chunk in self.world.chunks.values():
+            chunk.dirty = True
+        self.update_chunks()
+
     def toggle_free_look(self):
         self.free_look = not self.free_look
         self.on_screen_status.setText(f"block: {self.place_block_type}, free_look: {1 if self.free_look else 0}")
@@ -482,16 +457,19 @@ class Application(ShowBase):
         self.accept("mouse1", self.handle_mouse_click)
         self.accept("mouse3", self.place_block)  # Right mouse button
         self.accept("mouse2", self.place_test)  # Middle mouse button
-        self.accept("1", self.select_block_type, ["grass"])
-        self.accept("2", self.select_block_type, ["dirt"])
-        self.accept("3", self.select_block_type, ["sand"])
-        self.accept("4", self.select_block_type, ["stone"])
+        placeable = [block_type.name for block_type in blocks.registry.types if block_type.model is not None]
+        for number, block_type in enumerate(placeable[:9]):
+            self.accept(str(number + 1), self.select_block_type, [block_type])
         self.accept("f1", self.toggle_free_look)
+        self.accept("f2", self.toggle_greedy_meshing)
+        self.accept("f5", self.save_world)
         for key in key_map:
             self.accept(key["key"], self.change_key_state, [key["action"], True])
             self.accept(f"{key['key']}-up", self.change_key_state, [key["action"], False])
 
 
-common.load_prc_file()
-game = Application()
-game.run()
+# The chunk worker processes import this module again, so only start the game in the main process
+if __name__ == '__main__':
+    common.load_prc_file()
+    game = Application()
+    game.run()
@@ -0,0 +1,98 @@
+import math
+import voxel
+from blocks import registry
+
+
+class PlayerController:
+    '''Character controller moving an axis aligned box through the solid blocks of a voxel world.
+
+    The box is swept one axis at a time with a fixed timestep, and only the blocks the box overlaps are read,
+    so the cost of a step does not depend on the size of the world.
+    '''
+
+    def __init__(self, world: voxel.VoxelWorld, position: tuple = (0, 0, 0), half_width: float = 0.6,
+                 eye_height: float = 3.0, head_height: float = 0.4, gravity: float = 9.81, jump_speed: float = 7,
+                 move_speed: float = 10, max_fall_speed: float = 50, skin: float = 0.001):
+        self.world = world
+        # Position is the eye, the box spans eye_height below it and head_height above it
+        self.position = list(position)
+        self.velocity = [0.0, 0.0, 0.0]
+        self.half_width = half_width
+        self.eye_height = eye_height
+        self.head_height = head_height
+        self.gravity = gravity
+        self.jump_speed = jump_speed
+        self.move_speed = move_speed
+        self.max_fall_speed = max_fall_speed
+        self.skin = skin
+        self.on_ground = False
+
+    def get_box(self, position: list = None) -> tuple:
+        '''World space minimum and maximum corners of the player box.'''
+        x, y, z = self.position if position is None else position
+        return ((x - self.half_width, y - self.half_width, z - self.eye_height),
+                (x + self.half_width, y + self.half_width, z + self.head_height))
+
+    def get_block_range(self, box_min: tuple, box_max: tuple) -> tuple:
+        '''First and last block coordinates overlapped by a world space box.'''
+        size = self.world.block_size
+        start = tuple(math.floor((box_min[i] + self.skin) / size + 0.5) for i in range(3))
+        end = tuple(math.floor((box_max[i] - self.skin) / size + 0.5) for i in range(3))
+        return start, end
+
+    def intersects_block(self, block: tuple) -> bool:
+        start, end = self.get_block_range(*self.get_box())
+        return all(start[i] <= block[i] <= end[i] for i in range(3))
+
+    def check_ground(self) -> bool:
+        '''Sample the blocks just under the feet across the footprint of the box.'''
+        box_min, box_max = self.get_box()
+        start, end = self.get_block_range(box_min, box_max)
+        below = math.floor((box_min[2] - self.skin * 2) / self.world.block_size + 0.5)
+        region = self.world.get_region((start[0], start[1], below), (end[0], end[1], below))
+        return bool(registry.solid[region].any())
+
+    def move_axis(self, axis: int, distance: float) -> bool:
+        '''Move along one axis and stop at the face of the first solid block, return True on a collision.'''
+        if distance == 0:
+            return False
+        position = list(self.position)
+        position[axis] += distance
+        start, end = self.get_block_range(*self.get_box(position))
+        region = self.world.get_region(start, end)
+        solid = registry.solid[region]
+        if not solid.any():
+            self.position = position
+            return False
+        # Clamp against the nearest blocking layer along the axis of movement
+        layers = [i for i in range(solid.shape[axis]) if solid.take(i, axis=axis).any()]
+        size = self.world.block_size
+        offset = self.head_height if axis == 2 else self.half_width
+        if distance > 0:
+            block = start[axis] + layers[0]
+            position[axis] = (block - 0.5) * size - offset - self.skin
+        else:
+            block = start[axis] + layers[-1]
+            offset = self.eye_height if axis == 2 else self.half_width
+            position[axis] = (block + 0.5) * size + offset + self.skin
+        self.position = position
+        return True
+
+    def step(self, dt: float, move_x: float, move_y: float, jump: bool) -> None:
+        '''Advance one fixed timestep.
+        Args:
+            dt (float): Timestep in seconds
+            move_x, move_y (float): Wanted horizontal direction in world space, up to unit length
+            jump (bool): Jump if standing on the ground
+        '''
+        self.velocity[0] = move_x * self.move_speed
+        self.velocity[1] = move_y * self.move_speed
+        if self.on_ground and jump:
+            self.velocity[2] = self.jump_speed
+        self.velocity[2] = max(self.velocity[2] - self.gravity * dt, -self.max_fall_speed)
+        for axis in range(3):
+            if self.move_axis(axis, self.velocity[axis] * dt):
+                self.velocity[axis] = 0.0
+        self.on_ground = self.velocity[2] <= 0 and self.check_ground()
+        if self.on_ground:
+            self.velocity[2] = 0.0
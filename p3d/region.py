@@ -0,0 +1,280 @@
+from concurrent.futures import ThreadPoolExecutor
+import mmap
+import numpy
+import os
+import threading
+import time
+import zlib
+
+import voxel
+
+# Region file layout: header, offset table with one entry per chunk slot, then the chunk records in any order
+region_magic = b"VXRG"
+region_version = 1
+header_dtype = numpy.dtype([('magic', 'S4'), ('version', '<u2'), ('chunk_size', '<u2'), ('region_size', '<u2'),
+                            ('reserved', '<u2')])
+entry_dtype = numpy.dtype([('offset', '<u4'), ('length', '<u4'), ('encoding', '<u4')])
+
+# Chunk record encodings, 0 marks an empty slot
+no_chunk = 0
+rle = 1
+deflate = 2
+
+
+def encode_rle(blocks: numpy.ndarray) -> bytes:
+    '''Run-length encode the flattened block array, runs follow z so a column of the same block is one run.
+    Returns:
+        bytes: Run count, then the uint16 run lengths, then the uint8 run values
+    '''
+    flat = blocks.ravel()
+    starts = numpy.concatenate(([0], numpy.flatnonzero(flat[1:] != flat[:-1]) + 1))
+    lengths = numpy.diff(numpy.append(starts, flat.size))
+    return (numpy.uint32(len(starts)).tobytes() + lengths.astype('<u2').tobytes() +
+            flat[starts].astype(numpy.uint8).tobytes())
+
+
+def decode_rle(data, size: int) -> numpy.ndarray:
+    runs = int(numpy.frombuffer(data, dtype='<u4', count=1)[0])
+    lengths = numpy.frombuffer(data, dtype='<u2', count=runs, offset=4)
+    values = numpy.frombuffer(data, dtype=numpy.uint8, count=runs, offset=4 + runs * 2)
+    return numpy.repeat(values, lengths).reshape(size, size, size)
+
+
+def encode_chunk(blocks: numpy.ndarray) -> tuple:
+    '''Encode a chunk with RLE or zlib, whichever is smaller. Terrain is mostly long runs, noisy caves compress
+    better with zlib.
+    Returns:
+        tuple: Encoding and bytes
+    '''
+    run_data = encode_rle(blocks)
+    if len(run_data) <= 64:
+        return rle, run_data
+    zlib_data = zlib.compress(numpy.ascontiguousarray(blocks, dtype=numpy.uint8).tobytes(), 1)
+    if len(zlib_data) < len(run_data):
+        return deflate, zlib_data
+    return rle, run_data
+
+
+def decode_chunk(encoding: int, data, size: int) -> numpy.ndarray:
+    if encoding == rle:
+        return decode_rle(data, size)
+    if encoding == deflate:
+        return numpy.frombuffer(zlib.decompress(data), dtype=numpy.uint8).reshape(size, size, size).copy()
+    raise ValueError(f"unknown chunk encoding {encoding}")
+
+
+class RegionFile:
+    '''One region file of region_size^3 chunk slots. The offset table is read once and kept in memory, chunk
+    records are read through a read only mmap so only the pages of the chunks asked for are loaded.'''
+
+    def __init__(self, path: str, chunk_size: int, region_size: int):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.region_size = region_size
+        self.table_offset = header_dtype.itemsize
+        self.data_offset = self.table_offset + entry_dtype.itemsize * region_size ** 3
+        self.table = numpy.zeros(region_size ** 3, dtype=entry_dtype)
+        self.file = None
+        self.map = None
+        # Held while chunks are written, the map stays closed and records are read from the file meanwhile
+        self.write_lock = threading.Lock()
+        self.writing = False
+        if os.path.exists(path):
+            self.read_table()
+
+    def read_table(self):
+        self.open_map()
+        header = numpy.frombuffer(self.map, dtype=header_dtype, count=1)[0]
+        if header['magic'] != region_magic or header['version'] != region_version:
+            raise ValueError(f"{self.path} is not a version {region_version} region file")
+        if header['chunk_size'] != self.chunk_size or header['region_size'] != self.region_size:
+            raise ValueError(f"{self.path} has chunk size {header['chunk_size']} and region size "
+                             f"{header['region_size']}, expected {self.chunk_size} and {self.region_size}")
+        self.table = numpy.frombuffer(self.map, dtype=entry_dtype, count=len(self.table),
+                                      offset=self.table_offset).copy()
+
+    def open_map(self):
+        if self.map is None:
+            self.file = open(self.path, 'rb')
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close_map(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = None
+            self.file = None
+
+    def has_chunk(self, index: int) -> bool:
+        return self.table[index]['encoding'] != no_chunk
+
+    def get_indices(self) -> numpy.ndarray:
+        return numpy.flatnonzero(self.table['encoding'] != no_chunk)
+
+    def read_chunk(self, index: int) -> numpy.ndarray:
+        entry = self.table[index]
+        if entry['encoding'] == no_chunk:
+            return None
+        start, length = int(entry['offset']), int(entry['length'])
+        if self.writing:
+            # Records in the table are not moved by a write, only slots being saved are overwritten
+            with open(self.path, 'rb') as file:
+                file.seek(start)
+                data = file.read(length)
+        else:
+            self.open_map()
+            data = self.map[start:start + length]
+        return decode_chunk(int(entry['encoding']), data, self.chunk_size)
+
+    def write_chunks(self, records: dict) -> tuple:
+        '''Write encoded chunks, each over its old record when it fits or at the end of the file, then the table.
+        The table in memory is left as it is, so chunks can still be read while the file is written.
+        Args:
+            records (dict): Slot index to (encoding, bytes)
+        Returns:
+            tuple: Bytes written and the new table, to be set once the write is done
+        '''
+        # Windows does not allow writing to a file while a mapping of it is open
+        self.close_map()
+        new_file = not os.path.exists(self.path)
+        table = self.table.copy()
+        written = 0
+        with open(self.path, 'w+b' if new_file else 'r+b') as file:
+            if new_file:
+                header = numpy.array([(region_magic, region_version, self.chunk_size, self.region_size, 0)],
+                                     dtype=header_dtype)
+                file.write(header.tobytes())
+                file.write(table.tobytes())
+            end = file.seek(0, os.SEEK_END)
+            for index, (encoding, data) in records.items():
+                entry = table[index]
+                if entry['encoding'] != no_chunk and len(data) <= entry['length']:
+                    file.seek(int(entry['offset']))
+                else:
+                    file.seek(end)
+                    entry['offset'] = end
+                    end += len(data)
+                file.write(data)
+                entry['length'] = len(data)
+                entry['encoding'] = encoding
+                written += len(data)
+            file.seek(self.table_offset)
+            file.write(table.tobytes())
+        return written + table.nbytes, table
+
+
+class RegionStore:
+    '''Saved chunks of a voxel world in region files of region_size^3 chunks each. Only chunks handed to save are
+    written, chunks are decoded one at a time when asked for, and saving can run on a background thread.'''
+
+    def __init__(self, directory: str, chunk_size: int = voxel.chunk_size, region_size: int = 8):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.region_size = region_size
+        self.regions = {}
+        # Chunks queued for the background thread, read from here until they are on disk
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def get_region_position(self, chunk_position: tuple) -> tuple:
+        return tuple(p // self.region_size for p in chunk_position)
+
+    def get_index(self, chunk_position: tuple) -> int:
+        x, y, z = (p % self.region_size for p in chunk_position)
+        return (x * self.region_size + y) * self.region_size + z
+
+    def get_region(self, region_position: tuple) -> RegionFile:
+        region = self.regions.get(region_position)
+        if region is None:
+            name = "r.{}.{}.{}.vxr".format(*region_position)
+            region = RegionFile(os.path.join(self.directory, name), self.chunk_size, self.region_size)
+            self.regions[region_position] = region
+        return region
+
+    def has_chunk(self, chunk_position: tuple) -> bool:
+        with self.lock:
+            if chunk_position in self.pending:
+                return True
+            region = self.get_region(self.get_region_position(chunk_position))
+            return region.has_chunk(self.get_index(chunk_position))
+
+    def load_chunk(self, chunk_position: tuple) -> numpy.ndarray:
+        '''Get the saved blocks of a chunk, or None when it was never saved.'''
+        with self.lock:
+            blocks = self.pending.get(chunk_position)
+            if blocks is not None:
+                return blocks.copy()
+            region = self.get_region(self.get_region_position(chunk_position))
+            return region.read_chunk(self.get_index(chunk_position))
+
+    def get_positions(self) -> list:
+        '''Chunk positions of every saved chunk.'''
+        positions = set(self.pending)
+        if os.path.isdir(self.directory):
+            with self.lock:
+                for name in os.listdir(self.directory):
+                    parts = name.split('.')
+                    if len(parts) != 5 or parts[0] != 'r' or parts[4] != 'vxr':
+                        continue
+                    region_position = tuple(int(p) for p in parts[1:4])
+                    region = self.get_region(region_position)
+                    for index in region.get_indices().tolist():
+                        local = (index // self.region_size ** 2, index // self.region_size % self.region_size,
+                                 index % self.region_size)
+                        positions.add(tuple(region_position[i] * self.region_size + local[i] for i in range(3)))
+        return sorted(positions)
+
+    def save_chunks(self, chunks: dict) -> int:
+        '''Encode and write chunks, grouped by region so each region file is opened once.
+        Args:
+            chunks (dict): Chunk position to block array
+        Returns:
+            int: Bytes written
+        '''
+        by_region = {}
+        for position, blocks in chunks.items():
+            records = by_region.setdefault(self.get_region_position(position), {})
+            records[self.get_index(position)] = encode_chunk(blocks)
+        os.makedirs(self.directory, exist_ok=True)
+        written = 0
+        for region_position, records in by_region.items():
+            with self.lock:
+                region = self.get_region(region_position)
+            # The store lock is only held to swap the map and table, so loading never waits on the disk
+            with region.write_lock:
+                with self.lock:
+                    region.close_map()
+                    region.writing = True
+                region_written, table = region.write_chunks(records)
+                with self.lock:
+                    region.table = table
+                    region.writing = False
+                written += region_written
+        with self.lock:
+            for position, blocks in chunks.items():
+                if self.pending.get(position) is blocks:
+                    del self.pending[position]
+        return written
+
+    def save_async(self, chunks: dict):
+        '''Save on the background thread, the arrays must not change after this call.
+        Returns:
+            Future: Bytes written
+        '''
+        with self.lock:
+            self.pending.update(chunks)
+        start = time.perf_counter()
+
+        def save():
+            written = self.save_chunks(chunks)
+            print(f"saved {len(chunks)} chunks: {written} bytes, {(time.perf_counter() - start) * 1000:.2f} ms")
+            return written
+        return self.executor.submit(save)
+
+    def close(self):
+        '''Finish the queued saves and close the region files.'''
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            for region in self.regions.values():
+                region.close_map()
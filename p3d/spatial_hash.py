@@ -0,0 +1,247 @@
+import time
+import numpy
+
+sphere: int = 0
+box: int = 1
+
+# Half of the 27 neighbour cells, with the cell itself, so each pair of cells is visited once
+half_neighbour_offsets = numpy.array(
+    [(0, 0, 0)] + [(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1) if (x, y, z) > (0, 0, 0)],
+    dtype=numpy.int64)
+
+cell_bits = 21
+cell_mask = (1 << cell_bits) - 1
+
+
+def hash_cells(cells: numpy.ndarray) -> numpy.ndarray:
+    '''Pack (n, 3) integer cell coordinates into one int64 key per cell, 21 bits per axis.'''
+    cells = cells & cell_mask
+    return (cells[:, 0] << (cell_bits * 2)) | (cells[:, 1] << cell_bits) | cells[:, 2]
+
+
+class BodySystem:
+    '''Dynamic spheres and axis aligned boxes stored as NumPy arrays, with a uniform grid spatial hash for the
+    broad phase, batched narrow phase tests and a semi-implicit Euler integrator.
+
+    The cell size must be at least the largest body extent, so a body only touches bodies in the 27 cells around
+    its own.
+    '''
+
+    def __init__(self, cell_size: float = 2.0, gravity: tuple = (0, 0, -9.81), restitution: float = 0.3,
+                 floor_z: float = 0.0, capacity: int = 1024):
+        self.cell_size = cell_size
+        self.gravity = numpy.array(gravity, dtype=numpy.float32)
+        self.restitution = restitution
+        self.floor_z = floor_z
+        self.count = 0
+        self.positions = numpy.zeros((capacity, 3), dtype=numpy.float32)
+        self.velocities = numpy.zeros((capacity, 3), dtype=numpy.float32)
+        # Sphere radius in all three columns, or box half extents
+        self.extents = numpy.zeros((capacity, 3), dtype=numpy.float32)
+        self.shapes = numpy.zeros(capacity, dtype=numpy.int8)
+        self.inverse_masses = numpy.zeros(capacity, dtype=numpy.float32)
+        # Last step statistics
+        self.pair_count = 0
+        self.contact_count = 0
+
+    def add_bodies(self, positions, extents, shapes, masses=1.0, velocities=None) -> numpy.ndarray:
+        '''Add a batch of bodies.
+        Args:
+            positions: (n, 3) centres
+            extents: (n,) sphere radii or (n, 3) box half extents
+            shapes: (n,) sphere or box, or one shape for all
+            masses: (n,) masses or one mass for all, 0 for a static body
+            velocities: (n, 3) start velocities, zero when None
+        Returns:
+            numpy.ndarray: Indices of the new bodies
+        '''
+        positions = numpy.asarray(positions, dtype=numpy.float32).reshape(-1, 3)
+        n = len(positions)
+        extents = numpy.asarray(extents, dtype=numpy.float32)
+        if extents.ndim < 2:
+            extents = numpy.broadcast_to(extents.reshape(-1, 1), (n, 3))
+        masses = numpy.broadcast_to(numpy.asarray(masses, dtype=numpy.float32), (n,))
+        self.reserve(self.count + n)
+        index = numpy.arange(self.count, self.count + n)
+        self.positions[index] = positions
+        self.velocities[index] = 0 if velocities is None else velocities
+        self.extents[index] = extents
+        self.shapes[index] = shapes
+        self.inverse_masses[index] = numpy.where(masses > 0, 1 / numpy.maximum(masses, 1e-9), 0)
+        self.count += n
+        return index
+
+    def reserve(self, capacity: int) -> None:
+        '''Grow the arrays by doubling so adding bodies in small batches stays cheap.'''
+        if capacity <= len(self.positions):
+            return
+        new_capacity = max(capacity, len(self.positions) * 2)
+        for name in ('positions', 'velocities', 'extents', 'shapes', 'inverse_masses'):
+            old = getattr(self, name)
+            new = numpy.zeros((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def find_pairs(self) -> tuple:
+        '''Broad phase, return the (i, j) index arrays of bodies in the same or neighbouring cells.'''
+        n = self.count
+        cells = numpy.floor(self.positions[:n] / self.cell_size).astype(numpy.int64)
+        keys = hash_cells(cells)
+        order = numpy.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        # Searching in sorted order keeps the needles almost sorted too, which binary search handles much faster
+        sorted_cells = cells[order]
+        pairs_i = []
+        pairs_j = []
+        for offset in half_neighbour_offsets:
+            neighbour_keys = hash_cells(sorted_cells + offset)
+            start = numpy.searchsorted(sorted_keys, neighbour_keys, side='left')
+            end = numpy.searchsorted(sorted_keys, neighbour_keys, side='right')
+            counts = end - start
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # Expand each body's range of sorted indices into explicit pairs without a Python loop
+            body = numpy.repeat(order, counts)
+            first = numpy.repeat(start - numpy.cumsum(counts) + counts, counts)
+            other = order[first + numpy.arange(total)]
+            if not offset.any():
+                # Pairs within one cell are found from both sides, keep one
+                keep = other > body
+                body, other = body[keep], other[keep]
+            pairs_i.append(body)
+            pairs_j.append(other)
+        if not pairs_i:
+            empty = numpy.zeros(0, dtype=numpy.int64)
+            return empty, empty
+        return numpy.concatenate(pairs_i), numpy.concatenate(pairs_j)
+
+    def get_contacts(self, i: numpy.ndarray, j: numpy.ndarray) -> tuple:
+        '''Narrow phase for all candidate pairs at once.
+        Returns:
+            tuple: The touching (i, j) pairs, unit normals from i to j and penetration depths
+        '''
+        position_i, position_j = self.positions[i], self.positions[j]
+        extent_i, extent_j = self.extents[i], self.extents[j]
+        shape_i, shape_j = self.shapes[i], self.shapes[j]
+        normals = numpy.zeros((len(i), 3), dtype=numpy.float32)
+        depths = numpy.full(len(i), -1.0, dtype=numpy.float32)
+
+        # Sphere - sphere
+        mask = (shape_i == sphere) & (shape_j == sphere)
+        if mask.any():
+            delta = position_j[mask] - position_i[mask]
+            distance = numpy.linalg.norm(delta, axis=1)
+            depths[mask] = extent_i[mask, 0] + extent_j[mask, 0] - distance
+            normals[mask] = delta / numpy.maximum(distance, 1e-6)[:, None]
+
+        # Box - box, separated along the axis of least overlap
+        mask = (shape_i == box) & (shape_j == box)
+        if mask.any():
+            delta = position_j[mask] - position_i[mask]
+            overlap = extent_i[mask] + extent_j[mask] - numpy.abs(delta)
+            axis = numpy.argmin(overlap, axis=1)
+            rows = numpy.arange(len(axis))
+            depths[mask] = numpy.where((overlap > 0).all(axis=1), overlap[rows, axis], -1.0)
+            box_normals = numpy.zeros_like(delta)
+            box_normals[rows, axis] = numpy.where(delta[rows, axis] < 0, -1.0, 1.0)
+            normals[mask] = box_normals
+
+        # Sphere - box, either order, from the closest point on the box to the sphere centre
+        mask = (shape_i != shape_j)
+        if mask.any():
+            i_is_box = shape_i[mask] == box
+            box_position = numpy.where(i_is_box[:, None], position_i[mask], position_j[mask])
+            box_extent = numpy.where(i_is_box[:, None], extent_i[mask], extent_j[mask])
+            sphere_position = numpy.where(i_is_box[:, None], position_j[mask], position_i[mask])
+            radius = numpy.where(i_is_box, extent_j[mask, 0], extent_i[mask, 0])
+            closest = numpy.clip(sphere_position, box_position - box_extent, box_position + box_extent)
+            delta = sphere_position - closest
+            distance = numpy.linalg.norm(delta, axis=1)
+            # Normal from the box to the sphere, flipped when the sphere is body i
+            box_to_sphere = delta / numpy.maximum(distance, 1e-6)[:, None]
+            inside = distance < 1e-6
+            if inside.any():
+                # Centre inside the box, push out along the axis of least overlap
+                local = sphere_position[inside] - box_position[inside]
+                overlap = box_extent[inside] - numpy.abs(local)
+                axis = numpy.argmin(overlap, axis=1)
+                rows = numpy.arange(len(axis))
+                push = numpy.zeros_like(local)
+                push[rows, axis] = numpy.where(local[rows, axis] < 0, -1.0, 1.0)
+                box_to_sphere[inside] = push
+                distance[inside] = -overlap[rows, axis]
+            normals[mask] = numpy.where(i_is_box[:, None], box_to_sphere, -box_to_sphere)
+            depths[mask] = radius - distance
+
+        touching = depths > 0
+        return i[touching], j[touching], normals[touching], depths[touching]
+
+    def resolve(self, i: numpy.ndarray, j: numpy.ndarray, normals: numpy.ndarray, depths: numpy.ndarray) -> None:
+        '''Push touching bodies apart by inverse mass and remove their approaching velocity, all pairs at once.'''
+        inverse_i = self.inverse_masses[i]
+        inverse_j = self.inverse_masses[j]
+        inverse_sum = inverse_i + inverse_j
+        moving = inverse_sum > 0
+        i, j, normals, depths = i[moving], j[moving], normals[moving], depths[moving]
+        inverse_i, inverse_j, inverse_sum = inverse_i[moving], inverse_j[moving], inverse_sum[moving]
+        # Positional correction, bodies in several contacts get the sum of their pushes
+        correction = normals * (depths / inverse_sum)[:, None]
+        numpy.add.at(self.positions, i, -correction * inverse_i[:, None])
+        numpy.add.at(self.positions, j, correction * inverse_j[:, None])
+        # Impulse along the normal when the bodies move towards each other
+        relative = numpy.einsum('ij,ij->i', self.velocities[j] - self.velocities[i], normals)
+        approaching = relative < 0
+        impulse = -(1 + self.restitution) * relative * approaching / inverse_sum
+        numpy.add.at(self.velocities, i, -normals * (impulse * inverse_i)[:, None])
+        numpy.add.at(self.velocities, j, normals * (impulse * inverse_j)[:, None])
+
+    def step(self, dt: float) -> None:
+        '''Advance one step: semi-implicit Euler, then the floor, then the body contacts.'''
+        n = self.count
+        dynamic = self.inverse_masses[:n] > 0
+        # Semi-implicit Euler, the new velocity moves the body
+        self.velocities[:n][dynamic] += self.gravity * dt
+        self.positions[:n][dynamic] += self.velocities[:n][dynamic] * dt
+        # Floor plane
+        bottom = self.positions[:n, 2] - self.extents[:n, 2]
+        below = dynamic & (bottom < self.floor_z)
+        self.positions[:n, 2][below] += self.floor_z - bottom[below]
+        falling = below & (self.velocities[:n, 2] < 0)
+        self.velocities[:n, 2][falling] *= -self.restitution
+        # Body contacts
+        i, j = self.find_pairs()
+        self.pair_count = len(i)
+        i, j, normals, depths = self.get_contacts(i, j)
+        self.contact_count = len(i)
+        self.resolve(i, j, normals, depths)
+
+
+def benchmark(counts: tuple = (500, 1000, 2000, 4000, 8000, 16000), steps: int = 60, dt: float = 1 / 60) -> list:
+    '''Drop a mix of spheres and boxes into a box of space and time the steps as the body count grows.
+    Returns:
+        list: (count, ms per step, bodies per ms) per count
+    '''
+    results = []
+    rng = numpy.random.default_rng(1)
+    for count in counts:
+        system = BodySystem(cell_size=2.0, capacity=count)
+        # Keep the density about the same as the count grows
+        side = max(8.0, (count * 8.0) ** (1 / 3))
+        positions = rng.uniform((-side, -side, 1), (side, side, side), size=(count, 3))
+        shapes = rng.integers(0, 2, size=count)
+        extents = numpy.where(shapes[:, None] == sphere, 0.5, rng.uniform(0.3, 0.8, size=(count, 3)))
+        system.add_bodies(positions, extents, shapes)
+        system.step(dt)
+        start = time.perf_counter()
+        for _ in range(steps):
+            system.step(dt)
+        step_time = (time.perf_counter() - start) * 1000 / steps
+        results.append((count, step_time, count / step_time))
+        print(f"bodies: {count:6d}  step: {step_time:8.3f} ms  bodies/ms: {count / step_time:8.1f}  "
+              f"pairs: {system.pair_count}  contacts: {system.contact_count}")
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
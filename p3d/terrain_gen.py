@@ -0,0 +1,195 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+import opensimplex
+import voxel
+
+# Terrain shape in blocks
+sea_level: int = 0
+height_amplitude: float = 10.0
+height_scale: float = 0.02
+height_octaves: int = 4
+dirt_depth: int = 3
+sand_height: int = 1
+# Caves where the 3D noise is above the threshold, sampled every cave_step blocks and interpolated
+cave_scale: float = 0.06
+cave_threshold: float = 0.45
+cave_step: int = 4
+cave_roof: int = 3
+bedrock_z: int = -16
+
+# One noise generator per process, keyed by seed
+noise_generators = {}
+
+
+def get_noise(seed: int) -> opensimplex.OpenSimplex:
+    if seed not in noise_generators:
+        noise_generators[seed] = opensimplex.OpenSimplex(seed)
+    return noise_generators[seed]
+
+
+def get_heights(seed: int, xs: numpy.ndarray, ys: numpy.ndarray) -> numpy.ndarray:
+    '''Surface height in blocks for a grid of block columns, fractal 2D noise over all columns at once.
+    Args:
+        seed (int): World seed
+        xs, ys (numpy.ndarray): Block x and y coordinates of the grid
+    Returns:
+        numpy.ndarray: int heights indexed [x, y]
+    '''
+    noise = get_noise(seed)
+    heights = numpy.zeros((len(xs), len(ys)), dtype=numpy.float64)
+    amplitude = 1.0
+    frequency = height_scale
+    for _ in range(height_octaves):
+        # noise2array returns [y, x]
+        heights += noise.noise2array(xs * frequency, ys * frequency).T * amplitude
+        amplitude *= 0.5
+        frequency *= 2.0
+    return numpy.floor(sea_level + heights * height_amplitude).astype(numpy.int32)
+
+
+def get_cave_mask(seed: int, origin: tuple, size: int) -> numpy.ndarray:
+    '''Bool array of carved blocks for a chunk, from coarse 3D noise upsampled with trilinear interpolation.'''
+    noise = get_noise(seed + 1)
+    coarse = [origin[i] + numpy.arange(0, size + cave_step, cave_step) for i in range(3)]
+    # noise3array returns [z, y, x]
+    samples = noise.noise3array(coarse[0] * cave_scale, coarse[1] * cave_scale, coarse[2] * cave_scale)
+    samples = samples.transpose(2, 1, 0)
+    fine = (numpy.arange(size) / cave_step)
+    index = numpy.floor(fine).astype(numpy.int32)
+    weight = fine - index
+    # Separable linear interpolation, one axis at a time
+    for axis in range(3):
+        low = numpy.take(samples, index, axis=axis)
+        high = numpy.take(samples, index + 1, axis=axis)
+        shape = [1, 1, 1]
+        shape[axis] = size
+        samples = low + (high - low) * weight.reshape(shape)
+    return samples > cave_threshold
+
+
+def generate_chunk(chunk_position: tuple, seed: int, size: int = voxel.chunk_size) -> numpy.ndarray:
+    '''Generate the blocks of one chunk, safe to run in a worker process.
+    Args:
+        chunk_position (tuple): Chunk coordinates
+        seed (int): World seed
+        size (int): Chunk size in blocks
+    Returns:
+        numpy.ndarray: uint8 block IDs indexed [x, y, z]
+    '''
+    origin = tuple(p * size for p in chunk_position)
+    xs = numpy.arange(origin[0], origin[0] + size)
+    ys = numpy.arange(origin[1], origin[1] + size)
+    zs = numpy.arange(origin[2], origin[2] + size)
+    heights = get_heights(seed, xs, ys)[:, :, None]
+    z = zs[None, None, :]
+    blocks = numpy.zeros((size, size, size), dtype=numpy.uint8)
+    if origin[2] > heights.max() or origin[2] + size <= bedrock_z:
+        return blocks
+    blocks[z <= heights] = voxel.block_ids["stone"]
+    blocks[(z <= heights) & (z > heights - dirt_depth)] = voxel.block_ids["dirt"]
+    blocks[z == heights] = voxel.block_ids["grass"]
+    blocks[(z > heights - dirt_depth) & (z <= heights) & (heights <= sea_level + sand_height)] = voxel.block_ids["sand"]
+    # Caves stay under the surface and above the bedrock
+    caves = get_cave_mask(seed, origin, size) & (z < heights - cave_roof) & (z > bedrock_z)
+    blocks[caves] = voxel.air
+    blocks[numpy.broadcast_to(z == bedrock_z, blocks.shape)] = voxel.block_ids["stone"]
+    return blocks
+
+
+class ChunkStreamer:
+    '''Load the chunks within a view radius of the camera from a process pool and unload the ones left behind.
+    With a store, saved chunks are read from it instead of generated and modified chunks are saved when unloaded.'''
+
+    def __init__(self, world: voxel.VoxelWorld, seed: int = 1, view_radius: int = 4, chunk_z_range: tuple = (-1, 0),
+                 workers: int = None, max_pending: int = 16, store=None):
+        self.world = world
+        self.store = store
+        self.seed = seed
+        self.view_radius = view_radius
+        self.chunk_z_range = chunk_z_range
+        self.max_pending = max_pending
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.pending = {}
+        # Every generated chunk position, including the empty ones that are not stored in the world
+        self.loaded = set()
+
+    def get_wanted(self, centre: tuple) -> list:
+        '''Chunk positions in the circle of columns around the centre chunk, nearest first.'''
+        cx, cy = centre[0], centre[1]
+        radius = self.view_radius
+        columns = [(cx + dx, cy + dy) for dx in range(-radius, radius + 1) for dy in range(-radius, radius + 1)
+                   if dx * dx + dy * dy <= radius * radius]
+        columns.sort(key=lambda c: (c[0] - cx) ** 2 + (c[1] - cy) ** 2)
+        return [(x, y, z) for x, y in columns for z in range(self.chunk_z_range[1], self.chunk_z_range[0] - 1, -1)]
+
+    def update(self, camera_block: tuple) -> list:
+        '''Collect finished chunks, request missing ones and unload far ones.
+        Args:
+            camera_block (tuple): Block coordinates of the camera
+        Returns:
+            list: Positions of the chunks that were unloaded
+        '''
+        for position, future in list(self.pending.items()):
+            if future.done():
+                del self.pending[position]
+                self.add_chunk(position, future.result())
+        centre = self.world.get_chunk_position(*camera_block)
+        wanted = self.get_wanted(centre)
+        for position in wanted:
+            if position in self.loaded or position in self.pending:
+                continue
+            if self.store is not None and self.store.has_chunk(position):
+                # Decoding a saved chunk is much cheaper than generating it, so do it here
+                self.add_chunk(position, self.store.load_chunk(position))
+            elif len(self.pending) < self.max_pending:
+                self.pending[position] = self.executor.submit(generate_chunk, position, self.seed,
+                                                              self.world.chunk_size)
+        # Unload one chunk further out than the load radius, so chunks on the edge do not flicker in and out
+        unload_radius = (self.view_radius + 1) ** 2
+        unloaded = []
+        modified = {}
+        for position in list(self.loaded):
+            if (position[0] - centre[0]) ** 2 + (position[1] - centre[1]) ** 2 > unload_radius:
+                chunk = self.world.chunks.get(position)
+                if chunk is not None and chunk.modified:
+                    modified[position] = chunk.blocks
+                self.loaded.discard(position)
+                self.world.remove_chunk(position)
+                unloaded.append(position)
+        if modified and self.store is not None:
+            self.store.save_async(modified)
+        return unloaded
+
+    def add_chunk(self, position: tuple, blocks: numpy.ndarray):
+        self.loaded.add(position)
+        chunk = self.world.chunks.get(position)
+        if chunk is not None:
+            # set_block made the chunk for blocks placed while it was loading, keep them over the loaded blocks
+            chunk.blocks = numpy.where(chunk.blocks != voxel.air, chunk.blocks, blocks)
+            chunk.dirty = True
+            chunk.modified = True
+            self.world.mark_neighbours_dirty(position)
+        elif blocks.any():
+            self.world.set_chunk(position, blocks)
+
+    def is_loaded(self, block: tuple) -> bool:
+        return self.world.get_chunk_position(*block) in self.loaded
+
+    def get_spawn_height(self, x: int = 0, y: int = 0) -> int:
+        '''Surface height in blocks at a block column, computed in this process.'''
+        return int(get_heights(self.seed, numpy.array([x]), numpy.array([y]))[0, 0])
+
+    def destroy(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def get_chunk_count(view_radius: int, chunk_z_range: tuple) -> int:
+    '''Number of chunks kept around the camera, to size memory use.'''
+    columns = sum(1 for dx in range(-view_radius, view_radius + 1) for dy in range(-view_radius, view_radius + 1)
+                  if dx * dx + dy * dy <= view_radius * view_radius)
+    return columns * (chunk_z_range[1] - chunk_z_range[0] + 1)
+
+
+def get_memory_estimate(view_radius: int, chunk_z_range: tuple, size: int = voxel.chunk_size) -> int:
+    '''Upper bound of the block array bytes kept around the camera.'''
+    return get_chunk_count(view_radius + 1, chunk_z_range) * size ** 3
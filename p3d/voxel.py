@@ -0,0 +1,252 @@
+import numpy
+
+from blocks import registry
+
+
+chunk_size: int = 16
+
+# Block IDs stored in the chunk arrays, 0 is air, see blocks.py for the properties of each type
+block_types = registry.names
+block_ids = registry.ids
+air = block_ids["air"]
+
+# Offsets to the six face neighbours
+neighbour_offsets = [(1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)]
+
+
+class Chunk:
+    '''A cube of chunk_size blocks stored as a dense uint8 array of block IDs, indexed [x, y, z].'''
+
+    def __init__(self, position: tuple, size: int = chunk_size):
+        self.position = position
+        self.size = size
+        self.blocks = numpy.zeros((size, size, size), dtype=numpy.uint8)
+        self.dirty = True
+        # Changed since it was generated or last saved
+        self.modified = False
+
+    def get_origin(self) -> tuple:
+        '''Block coordinates of the chunk's first block.'''
+        return tuple(p * self.size for p in self.position)
+
+    def is_empty(self) -> bool:
+        return not self.blocks.any()
+
+
+class VoxelWorld:
+    '''Blocks in chunks keyed by chunk coordinates, block coordinates are integers and a block at (x, y, z) is
+    centred at (x, y, z) * block_size in the world.'''
+
+    def __init__(self, block_size: int = 2, size: int = chunk_size):
+        self.block_size = block_size
+        self.chunk_size = size
+        self.chunks = {}
+
+    def get_chunk_position(self, x: int, y: int, z: int) -> tuple:
+        return x // self.chunk_size, y // self.chunk_size, z // self.chunk_size
+
+    def get_chunk(self, chunk_position: tuple, create: bool = False) -> Chunk:
+        '''Get the chunk at the chunk coordinates, or None when it does not exist and create is False.'''
+        chunk = self.chunks.get(chunk_position)
+        if chunk is None and create:
+            chunk = Chunk(chunk_position, self.chunk_size)
+            self.chunks[chunk_position] = chunk
+        return chunk
+
+    def get_block(self, x: int, y: int, z: int) -> int:
+        chunk = self.chunks.get(self.get_chunk_position(x, y, z))
+        if chunk is None:
+            return air
+        s = self.chunk_size
+        return int(chunk.blocks[x % s, y % s, z % s])
+
+    def set_block(self, x: int, y: int, z: int, block_id: int) -> None:
+        '''Set one block, the chunk and any neighbour chunk sharing the changed face are marked dirty.
+        Args:
+            x, y, z (int): Block coordinates
+            block_id (int): Block ID, air to remove the block
+        '''
+        chunk = self.get_chunk(self.get_chunk_position(x, y, z), create=block_id != air)
+        if chunk is None:
+            return
+        s = self.chunk_size
+        local = (x % s, y % s, z % s)
+        chunk.blocks[local] = block_id
+        chunk.dirty = True
+        chunk.modified = True
+        for axis in range(3):
+            if local[axis] == 0 or local[axis] == s - 1:
+                neighbour_position = list(chunk.position)
+                neighbour_position[axis] += 1 if local[axis] == s - 1 else -1
+                neighbour = self.chunks.get(tuple(neighbour_position))
+                if neighbour is not None:
+                    neighbour.dirty = True
+
+    def set_chunk(self, chunk_position: tuple, blocks: numpy.ndarray) -> Chunk:
+        '''Store a whole generated chunk, the six face neighbours are marked dirty to hide their shared faces.'''
+        chunk = Chunk(chunk_position, self.chunk_size)
+        chunk.blocks = blocks
+        self.chunks[chunk_position] = chunk
+        self.mark_neighbours_dirty(chunk_position)
+        return chunk
+
+    def remove_chunk(self, chunk_position: tuple) -> None:
+        '''Drop a chunk, the six face neighbours are marked dirty to show the faces it was hiding.'''
+        if self.chunks.pop(chunk_position, None) is not None:
+            self.mark_neighbours_dirty(chunk_position)
+
+    def mark_neighbours_dirty(self, chunk_position: tuple) -> None:
+        cx, cy, cz = chunk_position
+        for dx, dy, dz in neighbour_offsets:
+            neighbour = self.chunks.get((cx + dx, cy + dy, cz + dz))
+            if neighbour is not None:
+                neighbour.dirty = True
+
+    def fill(self, start: tuple, end: tuple, block_id: int) -> None:
+        '''Fill the box of blocks from start to end inclusive, one array slice per chunk it overlaps.
+        Args:
+            start (tuple): First block coordinates
+            end (tuple): Last block coordinates
+            block_id (int): Block ID
+        '''
+        s = self.chunk_size
+        start, end = [min(a, b) for a, b in zip(start, end)], [max(a, b) for a, b in zip(start, end)]
+        first = self.get_chunk_position(*start)
+        last = self.get_chunk_position(*end)
+        for cx in range(first[0], last[0] + 1):
+            for cy in range(first[1], last[1] + 1):
+                for cz in range(first[2], last[2] + 1):
+                    chunk = self.get_chunk((cx, cy, cz), create=block_id != air)
+                    if chunk is None:
+                        continue
+                    origin = chunk.get_origin()
+                    lo = [max(start[i] - origin[i], 0) for i in range(3)]
+                    hi = [min(end[i] - origin[i], s - 1) + 1 for i in range(3)]
+                    chunk.blocks[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]] = block_id
+                    chunk.dirty = True
+                    chunk.modified = True
+
+    def get_region(self, start: tuple, end: tuple) -> numpy.ndarray:
+        '''Copy the block IDs of the box from start to end inclusive into one array, air where there is no chunk.
+        Args:
+            start (tuple): First block coordinates
+            end (tuple): Last block coordinates
+        Returns:
+            numpy.ndarray: uint8 block IDs indexed [x, y, z] from start
+        '''
+        s = self.chunk_size
+        region = numpy.zeros([end[i] - start[i] + 1 for i in range(3)], dtype=numpy.uint8)
+        first = self.get_chunk_position(*start)
+        last = self.get_chunk_position(*end)
+        for cx in range(first[0], last[0] + 1):
+            for cy in range(first[1], last[1] + 1):
+                for cz in range(first[2], last[2] + 1):
+                    chunk = self.chunks.get((cx, cy, cz))
+                    if chunk is None:
+                        continue
+                    origin = chunk.get_origin()
+                    lo = [max(start[i], origin[i]) for i in range(3)]
+                    hi = [min(end[i], origin[i] + s - 1) + 1 for i in range(3)]
+                    region[lo[0] - start[0]:hi[0] - start[0], lo[1] - start[1]:hi[1] - start[1],
+                           lo[2] - start[2]:hi[2] - start[2]] = chunk.blocks[lo[0] - origin[0]:hi[0] - origin[0],
+                                                                             lo[1] - origin[1]:hi[1] - origin[1],
+                                                                             lo[2] - origin[2]:hi[2] - origin[2]]
+        return region
+
+    def world_to_block(self, position) -> tuple:
+        '''Block coordinates containing a world position.'''
+        return tuple(int(round(p / self.block_size)) for p in position)
+
+    def block_to_world(self, x: int, y: int, z: int) -> tuple:
+        '''World position of the centre of a block.'''
+        return x * self.block_size, y * self.block_size, z * self.block_size
+
+    def get_padded_blocks(self, chunk: Chunk) -> numpy.ndarray:
+        '''The chunk's blocks with a one block border copied from the neighbour chunks, air where there is none.'''
+        s = self.chunk_size
+        padded = numpy.zeros((s + 2, s + 2, s + 2), dtype=numpy.uint8)
+        padded[1:-1, 1:-1, 1:-1] = chunk.blocks
+        cx, cy, cz = chunk.position
+        for axis, (dx, dy, dz) in enumerate(neighbour_offsets):
+            neighbour = self.chunks.get((cx + dx, cy + dy, cz + dz))
+            if neighbour is None:
+                continue
+            # The neighbour's layer touching this chunk goes into the border layer on that side
+            source = [slice(None)] * 3
+            target = [slice(1, -1)] * 3
+            side = axis // 2
+            direction = (dx, dy, dz)[side]
+            source[side] = 0 if direction > 0 else s - 1
+            target[side] = s + 1 if direction > 0 else 0
+            padded[tuple(target)] = neighbour.blocks[tuple(source)]
+        return padded
+
+    def get_exposed_mask(self, chunk: Chunk) -> numpy.ndarray:
+        '''Bool array of the non-air blocks in the chunk with at least one transparent face neighbour.'''
+        padded = self.get_padded_blocks(chunk)
+        solid = chunk.blocks != air
+        exposed = numpy.zeros_like(solid)
+        for dx, dy, dz in neighbour_offsets:
+            exposed |= ~registry.opaque[padded[1 + dx:padded.shape[0] - 1 + dx,
+                                                1 + dy:padded.shape[1] - 1 + dy,
+                                                1 + dz:padded.shape[2] - 1 + dz]]
+        return solid & exposed
+
+    def get_dirty_chunks(self) -> list:
+        return [chunk for chunk in self.chunks.values() if chunk.dirty]
+
+    def take_modified(self) -> dict:
+        '''Copy the block arrays of the modified chunks for saving and clear their modified flags.'''
+        modified = {}
+        for position, chunk in self.chunks.items():
+            if chunk.modified:
+                modified[position] = chunk.blocks.copy()
+                chunk.modified = False
+        return modified
+
+    def get_memory_size(self) -> int:
+        '''Bytes used by the block arrays.'''
+        return sum(chunk.blocks.nbytes for chunk in self.chunks.values())
+
+    def raycast(self, origin, direction, max_distance: float) -> tuple:
+        '''Walk the blocks along a ray with the Amanatides-Woo grid traversal, one step per block crossed.
+        Args:
+            origin: Ray start in world coordinates
+            direction: Ray direction in world coordinates
+            max_distance (float): Reach in world units
+        Returns:
+            tuple: Block coordinates of the first solid block and the normal of the face entered, or None
+        '''
+        length = sum(d * d for d in direction) ** 0.5
+        if length == 0:
+            return None
+        direction = [d / length for d in direction]
+        # Block space, where block (x, y, z) spans x - 0.5 to x + 0.5
+        position = [o / self.block_size + 0.5 for o in origin]
+        block = [int(numpy.floor(p)) for p in position]
+        step = [0, 0, 0]
+        t_max = [numpy.inf, numpy.inf, numpy.inf]
+        t_delta = [numpy.inf, numpy.inf, numpy.inf]
+        for i in range(3):
+            if direction[i] > 0:
+                step[i] = 1
+                t_max[i] = (block[i] + 1 - position[i]) / direction[i]
+            elif direction[i] < 0:
+                step[i] = -1
+                t_max[i] = (position[i] - block[i]) / -direction[i]
+            if direction[i] != 0:
+                t_delta[i] = 1 / abs(direction[i])
+        max_t = max_distance / self.block_size
+        normal = (0, 0, 0)
+        t = 0.0
+        while t <= max_t:
+            if self.get_block(*block) != air:
+                return tuple(block), normal
+            axis = min(range(3), key=lambda i: t_max[i])
+            t = t_max[axis]
+            t_max[axis] += t_delta[axis]
+            block[axis] += step[axis]
+            face_normal = [0, 0, 0]
+            face_normal[axis] = -step[axis]
+            normal = tuple(face_normal)
+        return None